@@ -4,6 +4,8 @@ from .models import *
 admin.site.register(UserProfile)
 
 admin.site.register(Meeting)
+admin.site.register(RoomProvisioningJob)
 admin.site.register(UserMeetings)
 admin.site.register(AgendaItem)
 admin.site.register(Vote)
+admin.site.register(VoteTally)
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        # Подключаем обработчики сигналов и системные проверки
+        from . import checks, signals  # noqa: F401
+
+        # Шрифты для PDF-протоколов регистрируем один раз при старте
+        from .protocol import register_fonts
+        register_fonts()
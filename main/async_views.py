@@ -0,0 +1,219 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .authentication import get_token
+from .avatars import get_variant_urls
+from .deadlines import voting_is_open
+from .etags import profile_etag, user_meetings_etag
+from .models import AgendaItem, Meeting, UserMeetings, Vote
+from .pagination import KeysetPagination
+from .provisioning import enqueue_meeting
+from .serializers import AgendaItemSerializer, MeetingSerializer
+from .views import create_vote, filter_list, select_fields, update_vote, upsert_vote
+
+
+# Асинхронные варианты эндпоинтов профиля, конференций, вопросов и голосов
+# (api/async/...) для запуска под ASGI (meeting/asgi.py). Пока запрос ждёт
+# базу, процесс обслуживает другие запросы. Чтение - через асинхронный ORM;
+# транзакции и сериализаторы DRF синхронные, такие шаги выполняются в потоке
+# (sync_to_async) и общие с синхронными представлениями (main.views).
+# Ответы совпадают с ответами синхронных эндпоинтов.
+
+
+def json_response(data, status=200, headers=None):
+    return JsonResponse(
+        data, status=status, headers=headers, safe=False, json_dumps_params={'ensure_ascii': False}
+    )
+
+
+async def authenticate(request):
+    """Пользователь по заголовку "Authorization: Token <ключ>" (через кэш токенов)"""
+    parts = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if not parts or parts[0].lower() != 'token':
+        raise NotAuthenticated()
+    if len(parts) != 2:
+        raise AuthenticationFailed('Invalid token header.')
+
+    try:
+        token = await sync_to_async(get_token)(parts[1])
+    except Token.DoesNotExist:
+        raise AuthenticationFailed('Invalid token.')
+    if not token.user.is_active:
+        raise AuthenticationFailed('User inactive or deleted.')
+    return token.user
+
+
+def async_api_view(methods, etag_func=None, read_from_replica=False):
+    """Аналог APIView для корутин: метод, токен, разбор тела, ETag и ошибки DRF.
+
+    Представление получает rest_framework.request.Request с request.user
+    и разобранным request.data.
+    """
+    allowed = [*methods, 'HEAD'] if 'GET' in methods else methods
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in allowed:
+                return json_response(
+                    {'detail': f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED,
+                    headers={'Allow': ', '.join(allowed)},
+                )
+
+            drf_request = Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES])
+            try:
+                drf_request.user = await authenticate(request)
+                if request.method not in ('GET', 'HEAD'):
+                    # Разбор тела (в том числе загружаемых файлов) - в потоке
+                    await sync_to_async(getattr)(drf_request, 'data')
+
+                etag = None
+                if etag_func is not None:
+                    etag = await sync_to_async(etag_func)(drf_request, *args, **kwargs)
+                    etag = quote_etag(etag) if etag else None
+                    response = get_conditional_response(request, etag=etag)
+                    if response is not None:
+                        return response
+
+                response = await view(drf_request, *args, **kwargs)
+            except APIException as exc:
+                detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+                headers = {'WWW-Authenticate': 'Token'} if exc.status_code == 401 else None
+                return json_response(detail, exc.status_code, headers)
+
+            if etag is not None:
+                response.headers.setdefault('ETag', etag)
+            return response
+
+        wrapper.csrf_exempt = True
+        wrapper.read_from_replica = read_from_replica
+        return wrapper
+    return decorator
+
+
+def _error(message, status_code):
+    return json_response({"error": message}, status_code)
+
+
+async def _paginate_list(request, queryset, serializer_class, ordering):
+    fields, queryset = select_fields(request, queryset, serializer_class, ordering)
+    paginator = KeysetPagination(ordering)
+    page = await paginator.apaginate_queryset(queryset, request)
+    serializer = serializer_class(page, many=True, fields=fields)
+    return json_response(serializer.data, headers=paginator.get_headers())
+
+
+def _profile(user):
+    try:
+        return user.profile
+    except AttributeError:
+        raise AuthenticationFailed('User profile does not exist')
+
+
+@async_api_view(['GET'], etag_func=profile_etag, read_from_replica=True)
+async def profile(request):
+    user = request.user
+    profile = _profile(user)
+    return json_response({
+        'username': user.username,
+        'email': user.email,
+        'is_admin': profile.is_admin,
+        'photo': request.build_absolute_uri(profile.photo.url) if profile.photo else None,
+        'photo_variants': get_variant_urls(profile, request.build_absolute_uri),
+    })
+
+
+@async_api_view(['POST'])
+async def meeting_create(request):
+    if not _profile(request.user).is_admin:
+        return _error("Only admins can create meetings", status.HTTP_403_FORBIDDEN)
+
+    # Комната во внешнем сервисе создаётся в фоне (run_room_provisioning)
+    meeting, job = await sync_to_async(enqueue_meeting)(
+        request.data.get('name_room'), request.data.get('password_room'), request.data.get('date'), request.user,
+    )
+    return json_response({
+        "message": "Meeting creation started",
+        "meeting_id": meeting.id,
+        "job_id": job.id,
+        "status": job.status,
+    }, status.HTTP_202_ACCEPTED)
+
+
+@async_api_view(['GET'], etag_func=user_meetings_etag, read_from_replica=True)
+async def meeting_list(request):
+    meeting_ids = UserMeetings.objects.filter(user=request.user).values('meeting_id')
+    meetings = filter_list(request, Meeting.objects.filter(pk__in=meeting_ids), 'date', 'pk')
+    return await _paginate_list(request, meetings, MeetingSerializer, ('date', 'id'))
+
+
+@async_api_view(['POST'])
+async def agenda_create(request):
+    if not _profile(request.user).is_admin:
+        return _error("Only admins can create meetings", status.HTTP_403_FORBIDDEN)
+
+    serializer = AgendaItemSerializer(data=request.data)
+    # Проверка конференции и сохранение - синхронные запросы к базе
+    if not await sync_to_async(serializer.is_valid)():
+        return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+    await sync_to_async(serializer.save)()
+    return json_response({"message": "AgendaItem created successfully"}, status.HTTP_201_CREATED)
+
+
+@async_api_view(['GET'], etag_func=user_meetings_etag, read_from_replica=True)
+async def agenda_get(request):
+    meeting_ids = UserMeetings.objects.filter(user=request.user).values_list('meeting_id', flat=True)
+    agenda_items = AgendaItem.objects.filter(meeting_id__in=meeting_ids)
+    agenda_items = filter_list(request, agenda_items, 'summary_datetime', 'meeting_id')
+    return await _paginate_list(request, agenda_items, AgendaItemSerializer, ('summary_datetime', 'id'))
+
+
+async def _get_agenda_item(request):
+    try:
+        return await AgendaItem.objects.aget(pk=request.data.get('agenda_item'))
+    except AgendaItem.DoesNotExist:
+        return None
+
+
+@async_api_view(['POST'])
+async def vote_create(request):
+    agenda_item = await _get_agenda_item(request)
+    if agenda_item is None:
+        return _error("Вопрос не найден", status.HTTP_404_NOT_FOUND)
+
+    if not voting_is_open(agenda_item):
+        return _error("Время голосования истекло", status.HTTP_400_BAD_REQUEST)
+
+    return json_response(*await sync_to_async(create_vote)(request.user, agenda_item, request.data))
+
+
+@async_api_view(['PUT'])
+async def vote_update(request):
+    """Обновление голоса, с ?upsert=1 - создание, если его ещё нет"""
+    agenda_item = await _get_agenda_item(request)
+    if agenda_item is None:
+        return _error("Вопрос не найден", status.HTTP_404_NOT_FOUND)
+
+    if request.query_params.get('upsert') in ('1', 'true'):
+        if not voting_is_open(agenda_item):
+            return _error("Время голосования истекло", status.HTTP_400_BAD_REQUEST)
+        return json_response(*await sync_to_async(upsert_vote)(request.user, agenda_item, request.data))
+
+    try:
+        vote = await Vote.objects.aget(agenda_item=agenda_item, user=request.user)
+    except Vote.DoesNotExist:
+        return _error("Голос не найден", status.HTTP_404_NOT_FOUND)
+
+    if not voting_is_open(agenda_item):
+        return _error("Время голосования истекло", status.HTTP_400_BAD_REQUEST)
+
+    return json_response(*await sync_to_async(update_vote)(request.user, agenda_item, vote, request.data))
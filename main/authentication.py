@@ -0,0 +1,87 @@
+import copy
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from .cache import TTLCache
+
+
+SHARED_KEY_PREFIX = 'auth_token:'
+
+# Локальный кэш процесса: ключ токена -> Token с подгруженными user и user.profile
+_local_cache = TTLCache(
+    maxsize=getattr(settings, 'TOKEN_CACHE_MAXSIZE', 10000),
+    ttl=getattr(settings, 'TOKEN_CACHE_TTL', 60),
+)
+
+
+def _shared_cache():
+    """Общий кэш между процессами (если настроен TOKEN_CACHE_ALIAS)"""
+    alias = getattr(settings, 'TOKEN_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def _load_token(key):
+    token = _local_cache.get(key)
+    if token is not None:
+        return token
+
+    shared = _shared_cache()
+    if shared is not None:
+        token = shared.get(SHARED_KEY_PREFIX + key)
+        if token is not None:
+            _local_cache.set(key, token)
+            return token
+
+    # Одним запросом получаем токен, пользователя и его профиль. Всегда из
+    # основной базы: кэш сбрасывается при изменении пользователя, и данные
+    # с отстающей реплики остались бы в нём до конца TOKEN_CACHE_TTL
+    token = Token.objects.using(DEFAULT_DB_ALIAS).select_related('user', 'user__profile').get(key=key)
+
+    _local_cache.set(key, token)
+    if shared is not None:
+        shared.set(SHARED_KEY_PREFIX + key, token, getattr(settings, 'TOKEN_CACHE_TTL', 60))
+    return token
+
+
+def get_token(key):
+    """Возвращает Token (с user и user.profile) по ключу, используя кэш.
+
+    Возвращается копия закэшированного объекта, чтобы изменения
+    в одном запросе не влияли на другие.
+    """
+    return copy.deepcopy(_load_token(key))
+
+
+def invalidate_token(key):
+    """Удаляет токен из локального и общего кэша"""
+    _local_cache.delete(key)
+    shared = _shared_cache()
+    if shared is not None:
+        shared.delete(SHARED_KEY_PREFIX + key)
+
+
+def invalidate_user_tokens(user_id):
+    """Удаляет из кэша все токены пользователя"""
+    for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену с кэшированием пользователя и профиля"""
+
+    def authenticate_credentials(self, key):
+        try:
+            token = get_token(key)
+        except Token.DoesNotExist:
+            raise AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (token.user, token)
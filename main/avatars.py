@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import os
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from PIL import Image, ImageOps
+
+from .authentication import invalidate_user_tokens
+from .models import UserProfile
+from .process_pool import add_result_callback, get_pool
+from .versions import bump_version, user_version_key
+
+
+logger = logging.getLogger(__name__)
+
+
+# Уменьшенные копии фото профиля (квадратные, WebP и JPEG) для списков участников.
+# Строятся в пуле процессов после загрузки фото; пока они не готовы, клиенту
+# отдаётся оригинал. Имена копий зависят только от имени оригинала, а оно -
+# от содержимого (main.storage), поэтому одно фото обрабатывается один раз.
+
+VARIANT_PREFIX = 'avatars'
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+# Копии лежат в MEDIA_ROOT рядом с оригиналами, но вне хранилища по содержимому
+variant_storage = FileSystemStorage(allow_overwrite=True)
+
+
+def variant_key(name):
+    return hashlib.sha256(name.encode()).hexdigest()
+
+
+def variant_names(name):
+    """{размер: {формат: имя файла}} копий фото name"""
+    key = variant_key(name)
+    return {
+        str(size): {fmt: f'{VARIANT_PREFIX}/{key[:2]}/{key}/{size}.{fmt}' for fmt in FORMATS}
+        for size in settings.AVATAR_SIZES
+    }
+
+
+def render_variants(name):
+    """Строит копии фото name (в процессе пула). Возвращает их имена"""
+    names = variant_names(name)
+    if all(variant_storage.exists(path) for formats in names.values() for path in formats.values()):
+        return names
+
+    with default_storage.open(name, 'rb') as f, Image.open(f) as image:
+        # JPEG сразу декодируется в уменьшенном масштабе - многократно быстрее для фото с камеры
+        largest = max(settings.AVATAR_SIZES)
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # Прозрачный фон - белый (в JPEG прозрачности нет)
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        image = image.convert('RGB')
+
+        for size in sorted(settings.AVATAR_SIZES, reverse=True):
+            variant = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+            for fmt, pil_format in FORMATS.items():
+                output = BytesIO()
+                variant.save(output, pil_format, quality=settings.AVATAR_QUALITY)
+                variant_storage.save(names[str(size)][fmt], ContentFile(output.getvalue()))
+    return names
+
+
+def store_variants(user_id, name, variants):
+    """Записывает готовые копии, если фото профиля за это время не сменилось"""
+    updated = UserProfile.objects.filter(user_id=user_id, photo=name).update(photo_variants=variants)
+    if updated:
+        # update() не отправляет сигналов: кэш токенов (с профилем) и ETag обновляем сами
+        invalidate_user_tokens(user_id)
+        bump_version(user_version_key(user_id))
+    return bool(updated)
+
+
+def _variants_ready(user_id, name, future):
+    # Выполняется в потоке обработки результатов (main.process_pool.add_result_callback)
+    try:
+        store_variants(user_id, name, future.result())
+    except Exception:
+        logger.exception('Не удалось построить копии фото %s', name)
+
+
+def schedule_variants(user_id, name):
+    """Ставит построение копий фото в очередь пула процессов"""
+    future = get_pool().submit(render_variants, name)
+    add_result_callback(future, partial(_variants_ready, user_id, name))
+
+
+def get_variant_urls(profile, build_url):
+    """URL копий фото профиля. Пока копии не готовы - URL оригинала для всех размеров"""
+    if not profile.photo:
+        return None
+    variants = profile.photo_variants
+    original = build_url(profile.photo.url)
+    return {
+        str(size): {
+            fmt: build_url(variant_storage.url(variants[str(size)][fmt])) if str(size) in variants else original
+            for fmt in FORMATS
+        }
+        for size in settings.AVATAR_SIZES
+    }
+
+
+def remove_stale_variants():
+    """Удаляет копии фото, которых больше нет ни в одном профиле. Возвращает число каталогов"""
+    photos = UserProfile.objects.exclude(photo='').exclude(photo=None).values_list('photo', flat=True)
+    used = {variant_key(name) for name in photos.iterator()}
+    if not variant_storage.exists(VARIANT_PREFIX):
+        return 0
+
+    removed = 0
+    prefixes, _ = variant_storage.listdir(VARIANT_PREFIX)
+    for prefix in prefixes:
+        keys, _ = variant_storage.listdir(f'{VARIANT_PREFIX}/{prefix}')
+        for key in keys:
+            if key in used:
+                continue
+            directory = f'{VARIANT_PREFIX}/{prefix}/{key}'
+            for filename in variant_storage.listdir(directory)[1]:
+                variant_storage.delete(f'{directory}/{filename}')
+            os.rmdir(variant_storage.path(directory))
+            removed += 1
+    return removed
@@ -0,0 +1,144 @@
+from collections import Counter
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AgendaItem, Blob, UserProfile, Vote
+from .storage import BLOB_PREFIX, is_blob
+
+
+# Счётчики ссылок на файлы хранилища по содержимому (main.storage).
+# Ссылки обновляются сигналами при сохранении и удалении моделей с файлами;
+# bulk_create и update() сигналов не отправляют, такие ссылки досчитывает
+# recount_references. Перед удалением файла ссылки на него всё равно
+# проверяются по самим моделям.
+
+FILE_FIELDS = {
+    AgendaItem: 'materials',
+    Vote: 'signed_vote',
+    UserProfile: 'photo',
+}
+
+
+def add_reference(name):
+    if not is_blob(name):
+        return
+    now = timezone.now()
+    updated = Blob.objects.filter(name=name).update(refcount=F('refcount') + 1, updated_at=now)
+    if not updated:
+        # Первая ссылка на файл
+        _, created = Blob.objects.get_or_create(name=name, defaults={'refcount': 1, 'updated_at': now})
+        if not created:
+            Blob.objects.filter(name=name).update(refcount=F('refcount') + 1, updated_at=now)
+
+
+def release_reference(name):
+    if not is_blob(name):
+        return
+    Blob.objects.filter(name=name, refcount__gt=0).update(
+        refcount=F('refcount') - 1, updated_at=timezone.now()
+    )
+
+
+def count_references():
+    """Число ссылок на каждый файл хранилища по полям моделей"""
+    counts = Counter()
+    for model, field in FILE_FIELDS.items():
+        names = model.objects.filter(**{f'{field}__startswith': f'{BLOB_PREFIX}/'}).values_list(field, flat=True)
+        counts.update(names.iterator())
+    return counts
+
+
+def referenced_names(names):
+    """Какие из имён файлов используются в моделях"""
+    used = set()
+    for model, field in FILE_FIELDS.items():
+        used.update(model.objects.filter(**{f'{field}__in': names}).values_list(field, flat=True))
+    return used
+
+
+def recount_references():
+    """Пересчитывает Blob.refcount по полям моделей. Возвращает число исправленных записей"""
+    counts = count_references()
+    now = timezone.now()
+    changed = 0
+
+    with transaction.atomic():
+        for name, refcount in Blob.objects.select_for_update().values_list('name', 'refcount').iterator():
+            actual = counts.pop(name, 0)
+            if actual != refcount:
+                Blob.objects.filter(name=name).update(refcount=actual, updated_at=now)
+                changed += 1
+        # Ссылки на файлы, для которых ещё нет записи
+        Blob.objects.bulk_create(
+            [Blob(name=name, refcount=refcount, updated_at=now) for name, refcount in counts.items()],
+            ignore_conflicts=True,
+        )
+    return changed + len(counts)
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _iter_blob_files(storage):
+    directories, _ = storage.listdir(BLOB_PREFIX) if storage.exists(BLOB_PREFIX) else ([], [])
+    for directory in directories:
+        _, files = storage.listdir(f'{BLOB_PREFIX}/{directory}')
+        for filename in files:
+            yield f'{BLOB_PREFIX}/{directory}/{filename}'
+
+
+def collect_garbage(grace=None, storage=None, batch_size=1000):
+    """Удаляет файлы без ссылок. Возвращает {'deleted': файлов, 'freed_bytes': байт}
+
+    Удаляются файлы, у которых нет ссылок дольше grace (по умолчанию
+    BLOB_GC_GRACE) и которые столько же не сохранялись повторно, а также
+    файлы без записи Blob (прерванное сохранение). Файл, на который есть
+    ссылка в моделях, не удаляется, даже если счётчик ошибочно нулевой.
+    """
+    if grace is None:
+        grace = timedelta(seconds=settings.BLOB_GC_GRACE)
+    storage = storage or default_storage
+    cutoff = timezone.now() - grace
+    stats = {'deleted': 0, 'freed_bytes': 0}
+
+    def remove(name):
+        if not storage.exists(name):
+            return True
+        if storage.get_modified_time(name) >= cutoff:
+            # Содержимое только что сохранили заново
+            return False
+        stats['freed_bytes'] += storage.size(name)
+        stats['deleted'] += 1
+        storage.delete(name)
+        return True
+
+    orphans = Blob.objects.filter(refcount=0, updated_at__lt=cutoff).values_list('name', flat=True)
+    for batch in _batches(orphans.iterator(), batch_size):
+        used = referenced_names(batch)
+        for name in batch:
+            if name in used:
+                continue
+            with transaction.atomic():
+                # Счётчик мог вырасти, пока шла проверка
+                blob = Blob.objects.select_for_update().filter(name=name, refcount=0).first()
+                if blob is not None and remove(name):
+                    blob.delete()
+
+    # Файлы без записи Blob
+    for batch in _batches(_iter_blob_files(storage), batch_size):
+        known = set(Blob.objects.filter(name__in=batch).values_list('name', flat=True))
+        used = referenced_names(batch)
+        for name in batch:
+            if name not in known and name not in used:
+                remove(name)
+
+    return stats
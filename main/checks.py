@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+# Кэши, которые видит только один процесс
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_replica_caches(app_configs, **kwargs):
+    """С репликами (DATABASE_REPLICAS) отметки о записи и счётчики версий
+    должны быть общими для всех процессов: иначе воркер, не видевший
+    записи клиента, прочитает отстающую реплику
+    """
+    if not settings.DATABASE_REPLICAS:
+        return []
+
+    errors = []
+    for alias in dict.fromkeys(['default', settings.REPLICA_STICKY_CACHE]):
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend in LOCAL_CACHE_BACKENDS:
+            errors.append(Error(
+                f'Кэш {alias!r} ({backend}) не общий для процессов, а DATABASE_REPLICAS заданы',
+                hint='Укажите в CACHES Redis или Memcached (REPLICA_STICKY_CACHE и default)',
+                id='main.E001',
+            ))
+    return errors
@@ -0,0 +1,126 @@
+import heapq
+import logging
+from concurrent.futures import as_completed
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AgendaItem
+from .process_pool import get_pool
+from .protocol import get_participants, protocol_name, protocol_storage, store_protocol
+from .tallies import get_tally, rebuild_tallies
+
+
+logger = logging.getLogger(__name__)
+
+
+# Подведение итогов в момент summary_datetime (команда run_deadline_scheduler).
+# Ближайшие сроки открытых вопросов лежат в куче в памяти воркера, из базы
+# (по частичному индексу agenda_open_deadline_idx) они перечитываются раз в
+# DEADLINE_REFRESH_INTERVAL - так подхватываются новые вопросы. В срок вопрос
+# закрывается (closed_at), итоги пересчитываются по голосам, а протокол
+# генерируется заранее: его запрашивают сразу после окончания голосования.
+# Голоса записываются под блокировкой строки вопроса (lock_open_agenda_items),
+# что и закрытие: голос, принятый до срока, входит в итоги, а после закрытия
+# голос отклоняется.
+
+
+class DeadlineQueue:
+    """Сроки вопросов в порядке наступления (heapq)"""
+
+    def __init__(self):
+        self._heap = []
+
+    def __len__(self):
+        return len(self._heap)
+
+    def replace(self, deadlines):
+        """Заменяет содержимое списком [(срок, id вопроса)]"""
+        self._heap = list(deadlines)
+        heapq.heapify(self._heap)
+
+    def next_deadline(self):
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """id вопросов со сроком не позже now"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[1])
+        return due
+
+
+def voting_is_open(agenda_item, now=None):
+    """Открыто ли голосование по вопросу (без блокировки - для предварительных проверок)"""
+    return agenda_item.closed_at is None and (now or timezone.now()) <= agenda_item.summary_datetime
+
+
+def lock_open_agenda_items(agenda_item_ids):
+    """Блокирует до конца транзакции строки вопросов с открытым голосованием. Возвращает их id"""
+    return set(
+        AgendaItem.objects.select_for_update()
+        .filter(pk__in=agenda_item_ids, closed_at__isnull=True, summary_datetime__gte=timezone.now())
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+
+
+def load_deadlines(until):
+    """[(срок, id)] открытых вопросов со сроком до until (в том числе просроченных)"""
+    return list(
+        AgendaItem.objects.filter(closed_at__isnull=True, summary_datetime__lte=until)
+        .order_by('summary_datetime', 'id')
+        .values_list('summary_datetime', 'id')
+    )
+
+
+def close_agenda_item(agenda_item_id):
+    """Закрывает вопрос, если срок прошёл, и пересчитывает итоги. Возвращает вопрос или None"""
+    now = timezone.now()
+    with transaction.atomic():
+        agenda_item = (
+            AgendaItem.objects.select_for_update()
+            .filter(pk=agenda_item_id, closed_at__isnull=True, summary_datetime__lte=now)
+            .first()
+        )
+        if agenda_item is None:
+            # Закрыт другим воркером или срок перенесли
+            return None
+        # Итоги - по самим голосам, а не по накопленным счётчикам
+        rebuild_tallies([agenda_item.pk])
+        agenda_item.closed_at = now
+        agenda_item.save(update_fields=['closed_at'])
+
+    return AgendaItem.objects.select_related('tally', 'meeting__admin').get(pk=agenda_item.pk)
+
+
+def get_protocol_counter(agenda_item, user):
+    """Кто подводит итоги в протоколе: по закрытому вопросу - администратор конференции"""
+    return agenda_item.meeting.admin if agenda_item.closed_at else user
+
+
+def finalize_agenda_items(agenda_item_ids):
+    """Закрывает вопросы и генерирует их протоколы в пуле процессов. Возвращает закрытые вопросы"""
+    closed = [
+        agenda_item for agenda_item_id in agenda_item_ids
+        if (agenda_item := close_agenda_item(agenda_item_id)) is not None
+    ]
+
+    futures = {}
+    for agenda_item in closed:
+        admin = agenda_item.meeting.admin
+        name = protocol_name(agenda_item, admin.id)
+        if protocol_storage.exists(name):
+            continue
+        future = get_pool().submit(
+            store_protocol, name, agenda_item, get_tally(agenda_item), get_participants(agenda_item), admin
+        )
+        futures[future] = agenda_item
+
+    for future in as_completed(futures):
+        try:
+            future.result()
+        except Exception:
+            # Протокол сгенерируется при первом запросе
+            logger.exception('Не удалось сгенерировать протокол вопроса %s', futures[future].id)
+    return closed
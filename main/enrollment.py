@@ -0,0 +1,205 @@
+import codecs
+import csv
+import json
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from .models import UserMeetings
+from .versions import bump_version, user_version_key
+
+
+# Массовая запись участников в конференцию из CSV или JSON (email или id пользователя).
+# Файл читается и обрабатывается пачками, поэтому память не зависит от его размера.
+
+READ_SIZE = 64 * 1024
+# Элемент JSON-массива длиннее этого считается ошибкой (защита от нечитаемого файла)
+MAX_JSON_ITEM_SIZE = 1024 * 1024
+# Сколько нераспознанных записей вернуть в ответе
+UNKNOWN_SAMPLE_SIZE = 20
+
+
+class EnrollmentError(ValueError):
+    """Файл не удалось разобрать. summary - что успели записать до ошибки"""
+
+    def __init__(self, message, summary):
+        super().__init__(message)
+        self.summary = summary
+
+
+def _iter_text(stream):
+    """Декодированный текст из бинарного потока, блоками"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    for chunk in iter(lambda: stream.read(READ_SIZE), b''):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def _iter_lines(chunks):
+    tail = ''
+    for chunk in chunks:
+        lines = (tail + chunk).split('\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    if tail:
+        yield tail
+
+
+def iter_csv_entries(stream):
+    """Первая колонка CSV или колонка email/user_id/id, если есть заголовок"""
+    rows = csv.reader(_iter_lines(_iter_text(stream)))
+    column = 0
+    for number, row in enumerate(rows):
+        if not row:
+            continue
+        if number == 0:
+            header = [cell.strip().lower() for cell in row]
+            names = [name for name in ('email', 'user_id', 'id') if name in header]
+            if names:
+                column = header.index(names[0])
+                continue
+        if column < len(row):
+            yield row[column]
+
+
+def iter_json_entries(stream):
+    """Элементы JSON-массива по одному, без загрузки всего документа.
+
+    Элемент - email, id пользователя или объект с полем email/user_id/id.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    chunks = _iter_text(stream)
+
+    while True:
+        buffer = buffer.lstrip()
+        if not started:
+            if buffer.startswith('['):
+                buffer = buffer[1:]
+                started = True
+                continue
+        elif buffer.startswith(','):
+            buffer = buffer[1:]
+            continue
+        elif buffer.startswith(']'):
+            return
+
+        if buffer:
+            if not started:
+                raise ValueError('Ожидается JSON-массив')
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # Элемент прочитан не полностью - дочитываем
+                item = end = None
+            # Число на границе блока могло обрезаться: разбираем его, только если за ним есть ещё данные
+            if item is not None and end < len(buffer):
+                buffer = buffer[end:]
+                if isinstance(item, dict):
+                    item = item.get('email') or item.get('user_id') or item.get('id')
+                yield item
+                continue
+
+        if len(buffer) > MAX_JSON_ITEM_SIZE:
+            raise ValueError('Некорректный JSON: слишком длинный элемент')
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise ValueError('Неожиданный конец JSON')
+        buffer += chunk
+
+
+def iter_entries(stream, fmt):
+    if fmt == 'json':
+        return iter_json_entries(stream)
+    return iter_csv_entries(stream)
+
+
+def _classify(entry):
+    """('id', int), ('email', str) или None для нераспознанной записи"""
+    if isinstance(entry, bool):
+        return None
+    if isinstance(entry, int):
+        return ('id', entry)
+    if isinstance(entry, str):
+        value = entry.strip()
+        # isdigit() пропускает символы вроде '²', которые int() не разбирает
+        if value.isascii() and value.isdecimal():
+            return ('id', int(value))
+        if '@' in value:
+            return ('email', value.lower())
+    return None
+
+
+def enroll_participants(meeting, entries, batch_size=1000):
+    """Записывает пользователей в конференцию пачками по batch_size.
+
+    Каждая пачка - два запроса на поиск пользователей (по id и по email),
+    один на уже записанных и один bulk_create. Возвращает сводку:
+    created - записаны, skipped - уже участвовали (или повтор в файле),
+    unknown - пользователь не найден или запись не распознана.
+    """
+    summary = {'created': 0, 'skipped': 0, 'unknown': 0, 'unknown_entries': []}
+    entries = iter(entries)
+
+    while True:
+        try:
+            batch = list(islice(entries, batch_size))
+        except (ValueError, csv.Error) as exc:
+            # Предыдущие пачки уже сохранены
+            raise EnrollmentError(str(exc), summary) from exc
+        if not batch:
+            return summary
+        with transaction.atomic():
+            _enroll_batch(meeting, batch, summary)
+
+
+def _enroll_batch(meeting, batch, summary):
+    keys = [_classify(entry) for entry in batch]
+    ids = {value for kind, value in filter(None, keys) if kind == 'id'}
+    emails = {value for kind, value in filter(None, keys) if kind == 'email'}
+
+    resolved = {}
+    if ids:
+        resolved.update(
+            (('id', pk), pk) for pk in User.objects.filter(pk__in=ids).values_list('pk', flat=True)
+        )
+    if emails:
+        # Если email у нескольких пользователей, берётся первая учётная запись
+        rows = (
+            User.objects.annotate(email_lower=Lower('email'))
+            .filter(email_lower__in=emails)
+            .order_by('-pk')
+            .values_list('email_lower', 'pk')
+        )
+        resolved.update((('email', email), pk) for email, pk in rows)
+
+    user_ids = set(resolved.values())
+    enrolled = set(
+        UserMeetings.objects.filter(meeting=meeting, user_id__in=user_ids).values_list('user_id', flat=True)
+    ) if user_ids else set()
+
+    new_ids = []
+    for entry, key in zip(batch, keys):
+        user_id = resolved.get(key)
+        if user_id is None:
+            summary['unknown'] += 1
+            if len(summary['unknown_entries']) < UNKNOWN_SAMPLE_SIZE:
+                summary['unknown_entries'].append(str(entry))
+        elif user_id in enrolled:
+            summary['skipped'] += 1
+        else:
+            enrolled.add(user_id)
+            new_ids.append(user_id)
+    summary['created'] += len(new_ids)
+
+    # ignore_conflicts: запись, созданная параллельно, пропускается ограничением unique_user_meeting
+    UserMeetings.objects.bulk_create(
+        [UserMeetings(user_id=user_id, meeting=meeting) for user_id in new_ids],
+        ignore_conflicts=True,
+    )
+    # bulk_create не отправляет post_save: версии для ETag обновляем сами
+    transaction.on_commit(lambda: [bump_version(user_version_key(user_id)) for user_id in new_ids])
@@ -0,0 +1,51 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import UserMeetings
+from .versions import get_version, get_versions, meeting_version_key, user_version_key
+
+
+# ETag для условных GET-запросов (If-None-Match -> 304 Not Modified).
+# Считаются только по счётчикам версий в кэше, без запросов к базе.
+
+
+def _etag(request, *parts):
+    data = '|'.join(str(part) for part in (
+        request.get_host(), request.get_full_path(), request.user.pk, *parts
+    ))
+    return hashlib.md5(data.encode()).hexdigest()
+
+
+def get_user_meeting_ids(user_id, user_version):
+    """ID конференций пользователя, закэшированные до изменения его версии.
+
+    Читаются из основной базы: отстающая реплика сохранила бы под новой
+    версией старый список, и он жил бы до следующего изменения.
+    """
+    key = f'user_meetings:{user_id}:{user_version}'
+    meeting_ids = cache.get(key)
+    if meeting_ids is None:
+        meeting_ids = sorted(set(
+            UserMeetings.objects.using(DEFAULT_DB_ALIAS)
+            .filter(user_id=user_id).values_list('meeting_id', flat=True)
+        ))
+        cache.set(key, meeting_ids)
+    return meeting_ids
+
+
+def profile_etag(request, *args, **kwargs):
+    return _etag(request, get_version(user_version_key(request.user.pk)))
+
+
+def user_meetings_etag(request, *args, **kwargs):
+    """ETag списков, зависящих от конференций пользователя и их вопросов"""
+    if request.GET.get('status'):
+        # Открытые/закрытые вопросы меняются со временем без записи в базу
+        return None
+
+    user_version = get_version(user_version_key(request.user.pk))
+    meeting_ids = get_user_meeting_ids(request.user.pk, user_version)
+    versions = get_versions([meeting_version_key(meeting_id) for meeting_id in meeting_ids])
+    return _etag(request, user_version, *sorted(versions.items()))
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """Подписка на канал: ограниченная очередь сообщений одного клиента"""
+
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        # Клиент не успевал читать и часть сообщений потеряна
+        self.lagged = False
+
+    def put(self, message):
+        # Вызывается только в цикле событий подписчика
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.lagged = True
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    """Pub/sub внутри одного процесса.
+
+    Публиковать можно из любого потока (в том числе из синхронных view),
+    сообщения доставляются в цикл событий каждого подписчика.
+    Для нескольких процессов брокер заменяется через VOTE_EVENTS_BROKER
+    на реализацию с теми же методами publish() и subscribe().
+    """
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, message)
+            except RuntimeError:
+                # Цикл событий подписчика уже закрыт
+                pass
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        subscription = Subscription(
+            asyncio.get_running_loop(),
+            getattr(settings, 'VOTE_EVENTS_QUEUE_SIZE', 100),
+        )
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                self._subscriptions[channel].discard(subscription)
+                if not self._subscriptions[channel]:
+                    del self._subscriptions[channel]
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Брокер событий, заданный в настройке VOTE_EVENTS_BROKER"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'VOTE_EVENTS_BROKER', 'main.events.InProcessBroker')
+                _broker = import_string(path)()
+    return _broker
+
+
+def agenda_item_channel(agenda_item_id):
+    return f'agenda_item:{agenda_item_id}'
+
+
+def meeting_channel(meeting_id):
+    return f'meeting:{meeting_id}'
+
+
+def publish_tally_delta(agenda_item_id, meeting_id, delta, version):
+    """Публикует изменение итогов по вопросу в каналы вопроса и конференции.
+
+    version - версия итогов (VoteTally.version) после изменения.
+    """
+    message = {'agenda_item': agenda_item_id, 'meeting': meeting_id, 'delta': delta, 'version': version}
+    broker = get_broker()
+    broker.publish(agenda_item_channel(agenda_item_id), message)
+    broker.publish(meeting_channel(meeting_id), message)
+
+
+def format_event(event, data):
+    """Сообщение в формате Server-Sent Events"""
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
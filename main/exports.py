@@ -0,0 +1,111 @@
+import zipfile
+from collections import defaultdict
+from concurrent.futures import as_completed
+
+from .models import AgendaItem, Vote
+from .process_pool import get_pool
+from .protocol import participant_label, protocol_name, protocol_storage, store_protocol
+from .tallies import get_tally
+
+
+def iter_meeting_protocols(meeting_id, user):
+    """Протоколы всех вопросов конференции в порядке готовности.
+
+    Данные собираются двумя запросами (вопросы с итогами и участники),
+    уже сохранённые протоколы берутся из хранилища, остальные генерируются
+    параллельно в пуле процессов.
+    """
+    agenda_items = list(
+        AgendaItem.objects.filter(meeting_id=meeting_id)
+        .select_related('tally')
+        .order_by('summary_datetime', 'id')
+    )
+
+    participants = defaultdict(list)
+    rows = (
+        Vote.objects.filter(agenda_item__meeting_id=meeting_id)
+        .order_by('agenda_item_id', 'timestamp')
+        .values_list('agenda_item_id', 'user__username', 'signature_status')
+    )
+    for agenda_item_id, username, signature_status in rows:
+        participants[agenda_item_id].append(participant_label(username, signature_status))
+
+    # Запросы к базе выполняются сразу, генерация - по мере чтения ответа
+    return _iter_protocols(agenda_items, participants, user)
+
+
+def _open_stored(name):
+    try:
+        return protocol_storage.open(name, 'rb')
+    except FileNotFoundError:
+        return None
+
+
+def _iter_protocols(agenda_items, participants, user):
+    """(вопрос, открытый файл протокола). Открытый файл не пропадёт, даже если
+    процесс с более новой версией итогов удалит его (remove_stale_protocols)
+    """
+    futures = {}
+    for agenda_item in agenda_items:
+        source = _open_stored(protocol_name(agenda_item, user.id))
+        if source is not None:
+            yield agenda_item, source
+            continue
+
+        future = get_pool().submit(
+            store_protocol, protocol_name(agenda_item, user.id), agenda_item, get_tally(agenda_item),
+            participants[agenda_item.id], user,
+        )
+        futures[future] = agenda_item
+
+    for future in as_completed(futures):
+        agenda_item = futures[future]
+        source = _open_stored(future.result())
+        if source is None:
+            # Удалён сразу после генерации: генерируем ещё раз по тем же данным
+            source = protocol_storage.open(store_protocol(
+                protocol_name(agenda_item, user.id), agenda_item, get_tally(agenda_item),
+                participants[agenda_item.id], user,
+            ), 'rb')
+        yield agenda_item, source
+
+
+class _ZipStream:
+    """Файлоподобный буфер, из которого готовые байты архива сразу отдаются клиенту"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        # seek() не поддерживается, поэтому zipfile пишет дескрипторы данных
+        return self._position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_protocols_zip(protocols, chunk_size=64 * 1024):
+    """ZIP-архив протоколов, отдаваемый по частям по мере генерации.
+
+    protocols - пары (вопрос, открытый файл протокола). Файлы копируются
+    в архив блоками, целиком в память не читаются.
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for agenda_item, source in protocols:
+            with source, archive.open(f'protocol_{agenda_item.id}.pdf', 'w') as target:
+                for chunk in iter(lambda: source.read(chunk_size), b''):
+                    target.write(chunk)
+                    yield stream.pop()
+    yield stream.pop()
@@ -0,0 +1,152 @@
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """Часть файла [start, start + length) для отдачи в ответе 206.
+
+    fileno() проксируется, поэтому WSGI-сервер может отдать часть
+    через sendfile (смещение - текущая позиция файла, длина - Content-Length).
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """Диапазон из заголовка Range: (start, end) включительно.
+
+    None - заголовок не поддерживается (несколько диапазонов и т.п.),
+    отдаётся файл целиком. ValueError - диапазон за пределами файла.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+
+    start, end = match.groups()
+    if start == '':
+        # bytes=-N: последние N байт
+        length = int(end)
+        if length == 0:
+            raise ValueError('Empty suffix range')
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError('Range not satisfiable')
+    return start, end
+
+
+def file_response(request, file, size, content_type=None, filename='', as_attachment=False,
+                  etag=None, last_modified=None):
+    """Отдаёт открытый файл потоком с поддержкой Range и условных заголовков.
+
+    Файл не читается в память целиком: FileResponse отдаёт его блоками
+    (или через sendfile, если его поддерживает WSGI-сервер).
+    """
+    if etag is not None:
+        etag = quote_etag(etag)
+
+    # If-None-Match / If-Modified-Since -> 304
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        file.close()
+        return conditional
+
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header and _if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type, filename=filename, as_attachment=as_attachment)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        response = FileResponse(
+            RangeFile(file, start, end - start + 1),
+            status=206, content_type=content_type, filename=filename, as_attachment=as_attachment,
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    if etag is not None:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def _if_range_matches(request, etag, last_modified):
+    """If-Range: диапазон отдаётся, только если файл не изменился"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return etag is not None and if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and last_modified is not None and int(last_modified) <= date
+
+
+def media_response(request, storage, name, filename, as_attachment=False):
+    """Отдаёт файл из MEDIA_ROOT после проверки прав в представлении.
+
+    С MEDIA_ACCEL файл отдаёт фронт-сервер (nginx - X-Accel-Redirect,
+    Apache/lighttpd - X-Sendfile): Range, условные запросы и sendfile
+    выполняет он, воркер Django сразу освобождается. Без MEDIA_ACCEL -
+    file_response. Имя файла в хранилище меняется вместе с содержимым,
+    поэтому служит ETag.
+    """
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    accel = getattr(settings, 'MEDIA_ACCEL', None)
+
+    if accel in ('x-accel-redirect', 'x-sendfile'):
+        response = HttpResponse(content_type=content_type)
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+        if accel == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(name)
+        else:
+            response['X-Sendfile'] = storage.path(name)
+    else:
+        response = file_response(
+            request, storage.open(name, 'rb'), storage.size(name),
+            content_type=content_type, filename=filename, as_attachment=as_attachment, etag=name,
+        )
+
+    # Ответ зависит от пользователя: общие кэши его не сохраняют
+    patch_cache_control(response, private=True)
+    return response
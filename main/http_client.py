@@ -0,0 +1,253 @@
+import asyncio
+import functools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+
+class CircuitOpenError(requests.RequestException):
+    """Сервис недоступен: запросы к нему временно не выполняются"""
+
+
+class CircuitBreaker:
+    """Размыкатель цепи: после серии ошибок запросы сразу отклоняются,
+    через reset_timeout пропускается один пробный запрос.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            # Полуоткрытое состояние: пропускаем один пробный запрос
+            if not self._probe_in_flight and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class HttpClient:
+    """HTTP-клиент для внешних сервисов.
+
+    Держит пул keep-alive соединений на каждый хост, ограничивает время
+    соединения и чтения, повторяет запрос с задержкой и случайным разбросом
+    и размыкает цепь для хоста, который перестал отвечать.
+    """
+
+    # Ответы, после которых можно повторить любой запрос: сервис его не выполнял
+    RETRY_STATUSES = (502, 503)
+    # 504 - шлюз не дождался ответа, запрос мог быть выполнен. Повторяются
+    # только идемпотентные методы
+    IDEMPOTENT_RETRY_STATUSES = (502, 503, 504)
+    IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10, retries=2, backoff=0.5,
+                 pool_size=10, failure_threshold=5, reset_timeout=30):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.pool_size = pool_size
+
+        self._local = threading.local()
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """Сессия текущего потока: requests.Session не рассчитана на общий доступ из потоков"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        return session
+
+    def get_breaker(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
+
+    def retry_delay(self, attempt):
+        # Экспоненциальная задержка с полным случайным разбросом
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def sleep_before_retry(self, attempt):
+        time.sleep(self.retry_delay(attempt))
+
+    def is_idempotent(self, method):
+        return method.upper() in self.IDEMPOTENT_METHODS
+
+    def can_retry_error(self, method, exc):
+        """Можно ли повторить запрос после ошибки соединения exc"""
+        if self.is_idempotent(method):
+            return True
+        # Неидемпотентный запрос повторяем, только если соединение не было
+        # установлено и запрос точно не отправлен. Обрыв уже установленного
+        # соединения (в том числе keep-alive из пула) не повторяем: сервис мог
+        # получить запрос и выполнить его
+        if isinstance(exc, requests.ConnectTimeout):
+            return True
+        reason = getattr(exc.args[0], 'reason', None) if exc.args else None
+        return isinstance(reason, NewConnectionError)
+
+    def attempt(self, breaker, method, url, attempt, **kwargs):
+        """Одна попытка запроса. Возвращает ответ или None, если запрос нужно повторить"""
+        if not breaker.allow():
+            raise CircuitOpenError(f'Circuit is open for {urlsplit(url).netloc}')
+
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.ConnectionError as exc:
+            breaker.record_failure()
+            if attempt >= self.retries or not self.can_retry_error(method, exc):
+                raise
+            return None
+        except requests.RequestException:
+            # Таймаут чтения не повторяем: запрос мог быть уже выполнен
+            breaker.record_failure()
+            raise
+
+        if response.status_code < 500:
+            breaker.record_success()
+            return response
+
+        breaker.record_failure()
+        retry_statuses = self.IDEMPOTENT_RETRY_STATUSES if self.is_idempotent(method) else self.RETRY_STATUSES
+        if response.status_code not in retry_statuses or attempt >= self.retries:
+            return response
+        response.close()
+        return None
+
+    def request(self, method, url, **kwargs):
+        breaker = self.get_breaker(url)
+        kwargs.setdefault('timeout', self.timeout)
+
+        attempt = 0
+        while (response := self.attempt(breaker, method, url, attempt, **kwargs)) is None:
+            self.sleep_before_retry(attempt)
+            attempt += 1
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+class AsyncHttpClient(HttpClient):
+    """HttpClient для корутин: те же повторы и размыкатель цепи.
+
+    Каждая попытка выполняется в собственном пуле клиента из max_workers
+    потоков (у каждого потока своя сессия), а пауза перед повтором -
+    asyncio.sleep, поэтому цикл событий не блокируется на время запроса.
+    Общий пул цикла событий (min(32, CPU + 4) потоков) не используется:
+    одновременных запросов должно быть столько, сколько задано клиенту.
+    """
+
+    def __init__(self, *args, max_workers=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_workers = max_workers or self.pool_size
+        self._executor = None
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='http-client')
+            return self._executor
+
+    def set_max_workers(self, max_workers):
+        """Меняет число одновременных запросов; начатые запросы завершаются в старом пуле"""
+        with self._lock:
+            if max_workers == self.max_workers:
+                return
+            self.max_workers = max_workers
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    async def request(self, method, url, **kwargs):
+        breaker = self.get_breaker(url)
+        kwargs.setdefault('timeout', self.timeout)
+        loop = asyncio.get_running_loop()
+
+        attempt = 0
+        while (response := await loop.run_in_executor(
+            self.executor, functools.partial(self.attempt, breaker, method, url, attempt, **kwargs)
+        )) is None:
+            await asyncio.sleep(self.retry_delay(attempt))
+            attempt += 1
+        return response
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+
+_room_service_clients = {}
+_client_lock = threading.Lock()
+
+
+def _get_client(client_class):
+    if client_class not in _room_service_clients:
+        with _client_lock:
+            if client_class not in _room_service_clients:
+                _room_service_clients[client_class] = client_class(
+                    connect_timeout=getattr(settings, 'ROOM_SERVICE_CONNECT_TIMEOUT', 3.05),
+                    read_timeout=getattr(settings, 'ROOM_SERVICE_READ_TIMEOUT', 10),
+                    retries=getattr(settings, 'ROOM_SERVICE_RETRIES', 2),
+                    backoff=getattr(settings, 'ROOM_SERVICE_BACKOFF', 0.5),
+                    pool_size=getattr(settings, 'ROOM_SERVICE_POOL_SIZE', 10),
+                    failure_threshold=getattr(settings, 'ROOM_SERVICE_BREAKER_THRESHOLD', 5),
+                    reset_timeout=getattr(settings, 'ROOM_SERVICE_BREAKER_RESET', 30),
+                )
+    return _room_service_clients[client_class]
+
+
+def get_room_service_client():
+    """Общий для процесса клиент сервиса комнат (настройки ROOM_SERVICE_*)"""
+    return _get_client(HttpClient)
+
+
+def get_async_room_service_client():
+    """То же для корутин (AsyncHttpClient)"""
+    return _get_client(AsyncHttpClient)
@@ -0,0 +1,250 @@
+import json
+import math
+import platform
+import statistics
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from main.models import AgendaItem, Meeting, UserMeetings, Vote
+from main.provisioning import enqueue_meeting
+
+
+def percentile(values, p):
+    """Перцентиль методом ближайшего ранга"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+Measurement = namedtuple('Measurement', ['status', 'elapsed_ms', 'queries', 'peak_alloc'])
+
+
+class Endpoint:
+    """Замеряемый запрос.
+
+    Запросы с write=True выполняются в транзакции, которая откатывается,
+    поэтому каждая итерация видит одни и те же данные. setup(), если задан,
+    готовит данные внутри этой транзакции (вне замера), а его результат
+    передаётся в path.
+    """
+
+    def __init__(self, name, method, path, client, data=None, write=False, setup=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.client = client
+        self.data = data
+        self.write = write
+        self.setup = setup
+
+    def call(self, trace_memory=False):
+        """Выполняет запрос. Возвращает результат замера (Measurement)"""
+        if not self.write:
+            return self.measure(self.path, trace_memory)
+
+        with transaction.atomic():
+            path = self.path(self.setup()) if self.setup else self.path
+            measurement = self.measure(path, trace_memory)
+            transaction.set_rollback(True)
+        return measurement
+
+    def measure(self, path, trace_memory):
+        if trace_memory:
+            tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = self.request(path)
+                elapsed = (time.perf_counter() - started) * 1000
+            peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+        return Measurement(response.status_code, elapsed, len(queries), peak)
+
+    def request(self, path):
+        method = getattr(self.client, self.method.lower())
+        if self.data is None:
+            response = method(path)
+        else:
+            response = method(path, self.data, content_type='application/json')
+
+        if response.streaming:
+            b''.join(response.streaming_content)
+        response.close()
+        return response
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет эндпоинты main/views.py через тестовый клиент на текущей базе '
+        '(заполняется seed_benchmark_data): p50/p95, число запросов, выделения памяти'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3, help='Итерации прогрева (не учитываются)')
+        parser.add_argument('--only', nargs='*', default=None, help='Имена замеряемых эндпоинтов')
+        parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+        parser.add_argument('--compare', help='JSON-файл предыдущего запуска для сравнения')
+
+    def handle(self, *args, **options):
+        # Тестовый клиент ходит на хост testserver
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            endpoints = self.get_endpoints()
+            if options['only']:
+                endpoints = [endpoint for endpoint in endpoints if endpoint.name in options['only']]
+
+            results = {}
+            for endpoint in endpoints:
+                results[endpoint.name] = self.measure(endpoint, options['iterations'], options['warmup'])
+                self.print_result(endpoint.name, results[endpoint.name])
+
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'dataset': {
+                'users': User.objects.count(),
+                'meetings': Meeting.objects.count(),
+                'agenda_items': AgendaItem.objects.count(),
+                'votes': Vote.objects.count(),
+            },
+            'iterations': options['iterations'],
+            'results': results,
+        }
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Результаты сохранены в {options["output"]}'))
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def measure(self, endpoint, iterations, warmup):
+        for _ in range(warmup):
+            endpoint.call()
+
+        measurements = [endpoint.call() for _ in range(iterations)]
+        timings = [measurement.elapsed_ms for measurement in measurements]
+
+        # Отдельный проход: tracemalloc сильно замедляет выполнение
+        traced = endpoint.call(trace_memory=True)
+
+        return {
+            'method': endpoint.method,
+            'status': measurements[-1].status,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'mean_ms': round(statistics.mean(timings), 3),
+            'queries': max(measurement.queries for measurement in measurements),
+            'peak_alloc_kib': round(traced.peak_alloc / 1024, 1),
+        }
+
+    def print_result(self, name, result):
+        self.stdout.write(
+            f'{name:<24} {result["status"]}  p50 {result["p50_ms"]:>9.2f} ms  '
+            f'p95 {result["p95_ms"]:>9.2f} ms  запросов {result["queries"]:>3}  '
+            f'память {result["peak_alloc_kib"]:>9.1f} KiB'
+        )
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as f:
+            previous = json.load(f)['results']
+
+        self.stdout.write(f'\nСравнение с {path} (p50):')
+        for name, result in results.items():
+            if name not in previous:
+                continue
+            before, after = previous[name]['p50_ms'], result['p50_ms']
+            change = (after - before) / before * 100 if before else 0
+            self.stdout.write(
+                f'{name:<24} {before:>9.2f} -> {after:>9.2f} ms ({change:+.1f}%), '
+                f'запросов {previous[name]["queries"]} -> {result["queries"]}'
+            )
+
+    def get_endpoints(self):
+        """Эндпоинты и данные для них (пользователи, конференция, открытые вопросы)"""
+        now = timezone.now()
+        agenda_item = (
+            AgendaItem.objects.filter(summary_datetime__gte=now + timedelta(hours=1))
+            .order_by('id').first()
+        )
+        if agenda_item is None:
+            raise CommandError('Нет открытых вопросов: заполните базу командой seed_benchmark_data')
+
+        meeting = agenda_item.meeting
+        membership = UserMeetings.objects.filter(meeting=meeting).select_related('user').first()
+        if membership is None:
+            raise CommandError(f'У конференции {meeting.pk} нет участников')
+        member, admin = membership.user, meeting.admin
+
+        open_items = list(
+            AgendaItem.objects.filter(meeting=meeting, summary_datetime__gte=now + timedelta(hours=1))
+            .exclude(votes__user=member)
+            .values_list('pk', flat=True)[:10]
+        )
+        if not open_items:
+            raise CommandError(f'Участник {member.pk} уже проголосовал по всем открытым вопросам')
+
+        member_client = self.client_for(member)
+        admin_client = self.client_for(admin)
+
+        def create_vote():
+            Vote.objects.create(agenda_item_id=open_items[0], user=member, vote='yes')
+
+        def create_job():
+            return enqueue_meeting('bench-room', 'secret', now.isoformat(), admin)[1].pk
+
+        return [
+            Endpoint('register', 'POST', '/api/register/', Client(), write=True, data={
+                'username': 'bench_register', 'email': 'bench_register@example.com', 'password': 'password',
+            }),
+            Endpoint('login', 'POST', '/api/login/', Client(), write=True, data={
+                'email': member.email, 'password': 'password',
+            }),
+            Endpoint('profile', 'GET', '/api/profile/', member_client),
+            Endpoint('profile_update', 'PUT', '/api/profile/update', member_client, write=True,
+                     data={'email': member.email}),
+            Endpoint('meeting_create', 'POST', '/api/meeting_create/', admin_client, write=True, data={
+                'name_room': 'bench-room', 'password_room': 'secret', 'date': now.isoformat(),
+            }),
+            Endpoint('meeting_create_status', 'GET', lambda job_id: f'/api/meeting_create/status/{job_id}/',
+                     admin_client, write=True, setup=create_job),
+            Endpoint('meeting_list', 'GET', '/api/meeting_list/', member_client),
+            Endpoint('agenda_create', 'POST', '/api/agenda_create/', admin_client, write=True, data={
+                'meeting': meeting.pk, 'title': 'Вопрос', 'description': 'Проект решения',
+                'meeting_type': 'vote', 'summary_datetime': (now + timedelta(days=1)).isoformat(),
+            }),
+            Endpoint('agenda_get', 'GET', '/api/agenda_get/', member_client),
+            Endpoint('vote_create', 'POST', '/api/vote_create/', member_client, write=True, data={
+                'agenda_item': open_items[0], 'vote': 'yes',
+            }),
+            Endpoint('vote_batch_create', 'POST', '/api/vote_batch_create/', member_client, write=True, data={
+                'votes': [{'agenda_item': pk, 'vote': 'no'} for pk in open_items],
+            }),
+            Endpoint('vote_update', 'PUT', lambda _: '/api/vote_update/', member_client, write=True,
+                     setup=create_vote, data={'agenda_item': open_items[0], 'vote': 'no'}),
+            Endpoint('check_token', 'GET', '/api/check_token/', member_client),
+            Endpoint('generate_protocol', 'GET', f'/api/generate-protocol/{agenda_item.pk}/', admin_client),
+            Endpoint('generate_protocols', 'GET', f'/api/generate-protocols/{meeting.pk}/', admin_client),
+        ]
+
+    def client_for(self, user):
+        token, _ = Token.objects.get_or_create(user=user)
+        return Client(HTTP_AUTHORIZATION=f'Token {token.key}')
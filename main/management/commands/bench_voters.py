@@ -0,0 +1,155 @@
+import json
+import statistics
+import threading
+import time
+from datetime import timedelta
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from main.models import AgendaItem, UserMeetings
+
+from .bench_api import percentile
+
+
+VOTE_CHOICES = ('yes', 'no', 'abstain')
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает запущенный сервер одновременными голосующими (PUT vote_update?upsert=1) '
+        'и показывает, сколько их выдерживает процесс: синхронные эндпоинты под WSGI или '
+        'api/async/ под ASGI. Голосующие и токены берутся из базы, заполненной seed_benchmark_data, '
+        'поэтому команда должна работать с той же базой, что и сервер. Голоса записываются в базу'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', required=True, help='Адрес сервера, например http://127.0.0.1:8000')
+        parser.add_argument('--stack', choices=['sync', 'async'], default='sync',
+                            help='sync - api/vote_update/, async - api/async/vote_update/')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 100, 200],
+                            help='Числа одновременных голосующих (по очереди)')
+        parser.add_argument('--duration', type=float, default=10, help='Секунд на каждый уровень')
+        parser.add_argument('--timeout', type=float, default=30, help='Таймаут одного запроса, секунд')
+        parser.add_argument('--max-p95', type=float, default=500,
+                            help='p95 в мс, при котором уровень ещё считается выдержанным')
+        parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        levels = sorted(set(options['concurrency']))
+        if levels[0] < 1:
+            raise CommandError('Число голосующих должно быть положительным')
+
+        voters = self.get_voters(levels[-1])
+        prefix = 'async/' if options['stack'] == 'async' else ''
+        url = f'{options["url"].rstrip("/")}/api/{prefix}vote_update/?upsert=1'
+
+        results = {}
+        for level in levels:
+            result = self.run_level(url, voters[:level], options['duration'], options['timeout'])
+            results[level] = result
+            self.stdout.write(
+                f'{level:>5} голосующих: {result["rps"]:>8.1f} запросов/с  p50 {result["p50_ms"]:>8.2f} ms  '
+                f'p95 {result["p95_ms"]:>8.2f} ms  ошибок {result["errors"]}'
+            )
+
+        passed = [
+            level for level, result in results.items()
+            if result['errors'] == 0 and result['p95_ms'] <= options['max_p95']
+        ]
+        capacity = max(passed, default=0)
+        self.stdout.write(self.style.SUCCESS(
+            f'Стек {options["stack"]}: выдерживает {capacity} одновременных голосующих '
+            f'(p95 <= {options["max_p95"]:g} ms без ошибок)'
+        ))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'started_at': timezone.now().isoformat(),
+                    'url': url,
+                    'stack': options['stack'],
+                    'duration': options['duration'],
+                    'capacity': capacity,
+                    'results': results,
+                }, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Результаты сохранены в {options["output"]}'))
+
+    def get_voters(self, count):
+        """[(токен, вопрос)] - разные участники с открытым вопросом в своей конференции"""
+        open_items = (
+            AgendaItem.objects.filter(summary_datetime__gte=timezone.now() + timedelta(hours=1))
+            .order_by('id').values_list('pk', 'meeting_id')
+        )
+        pairs = {}
+        for agenda_item_id, meeting_id in open_items.iterator():
+            for user_id in UserMeetings.objects.filter(meeting_id=meeting_id).values_list('user_id', flat=True):
+                pairs.setdefault(user_id, agenda_item_id)
+            if len(pairs) >= count:
+                break
+        if len(pairs) < count:
+            raise CommandError(
+                f'Нашлось {len(pairs)} участников с открытыми вопросами из {count}: '
+                f'заполните базу командой seed_benchmark_data'
+            )
+
+        user_ids = list(pairs)[:count]
+        tokens = dict(Token.objects.filter(user_id__in=user_ids).values_list('user_id', 'key'))
+        missing = [Token(user_id=user_id, key=Token.generate_key()) for user_id in user_ids if user_id not in tokens]
+        Token.objects.bulk_create(missing)
+        tokens.update((token.user_id, token.key) for token in missing)
+        return [(tokens[user_id], pairs[user_id]) for user_id in user_ids]
+
+    def run_level(self, url, voters, duration, timeout):
+        timings = []
+        errors = []
+        lock = threading.Lock()
+        start = threading.Barrier(len(voters) + 1)
+
+        def vote(number, token, agenda_item_id):
+            session = requests.Session()
+            session.headers['Authorization'] = f'Token {token}'
+            own_timings, own_errors = [], 0
+            start.wait()
+            deadline = time.perf_counter() + duration
+            iteration = number
+            # Хотя бы один запрос от каждого голосующего
+            while iteration == number or time.perf_counter() < deadline:
+                iteration += 1
+                started = time.perf_counter()
+                try:
+                    response = session.put(url, json={
+                        'agenda_item': agenda_item_id, 'vote': VOTE_CHOICES[iteration % len(VOTE_CHOICES)],
+                    }, timeout=timeout)
+                    ok = response.status_code in (200, 201)
+                except requests.RequestException:
+                    ok = False
+                own_timings.append((time.perf_counter() - started) * 1000)
+                own_errors += not ok
+            session.close()
+            with lock:
+                timings.extend(own_timings)
+                errors.append(own_errors)
+
+        threads = [
+            threading.Thread(target=vote, args=(number, token, agenda_item_id), daemon=True)
+            for number, (token, agenda_item_id) in enumerate(voters)
+        ]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            'requests': len(timings),
+            'errors': sum(errors),
+            'rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'mean_ms': round(statistics.mean(timings), 3),
+        }
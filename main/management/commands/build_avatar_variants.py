@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from main.avatars import render_variants, store_variants
+from main.models import UserProfile
+from main.process_pool import get_pool
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии фото профилей, для которых их ещё нет (в пуле процессов)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Перестроить копии всех фото')
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.exclude(photo='').exclude(photo=None)
+        if not options['all']:
+            profiles = profiles.filter(photo_variants={})
+        photos = list(profiles.values_list('user_id', 'photo'))
+
+        built = 0
+        names = [name for _, name in photos]
+        for (user_id, name), variants in zip(photos, get_pool().map(render_variants, names)):
+            built += store_variants(user_id, name, variants)
+        self.stdout.write(self.style.SUCCESS(f'Построены копии фото: {built} из {len(photos)}'))
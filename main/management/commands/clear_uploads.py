@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from main.uploads import remove_expired_sessions
+
+
+class Command(BaseCommand):
+    help = 'Удаляет просроченные незавершённые загрузки (UploadSession) и их файлы'
+
+    def handle(self, *args, **options):
+        count = remove_expired_sessions()
+        self.stdout.write(self.style.SUCCESS(f'Удалено загрузок: {count}'))
@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.enrollment import EnrollmentError, enroll_participants, iter_entries
+from main.models import Meeting
+
+
+class Command(BaseCommand):
+    help = 'Записывает участников в конференцию из CSV или JSON со списком email или id пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('meeting_id', type=int)
+        parser.add_argument('path', help='Путь к файлу, "-" - стандартный ввод')
+        parser.add_argument('--file-format', choices=['csv', 'json'],
+                            help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            meeting = Meeting.objects.get(pk=options['meeting_id'])
+        except Meeting.DoesNotExist:
+            raise CommandError(f'Конференция {options["meeting_id"]} не найдена')
+
+        path = options['path']
+        file_format = options['file_format'] or ('json' if path.lower().endswith('.json') else 'csv')
+
+        stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        try:
+            summary = enroll_participants(meeting, iter_entries(stream, file_format), options['batch_size'])
+        except EnrollmentError as exc:
+            raise CommandError(f'{exc} (записано до ошибки: {exc.summary["created"]})')
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Записано: {summary["created"]}, уже участвовали: {summary["skipped"]}, '
+            f'не найдено: {summary["unknown"]}'
+        ))
+        for entry in summary['unknown_entries']:
+            self.stdout.write(f'  не найден: {entry}')
@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.avatars import remove_stale_variants
+from main.blobs import collect_garbage, recount_references
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из хранилища по содержимому файлы, на которые нет ссылок, и копии удалённых фото'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=settings.BLOB_GC_GRACE,
+            help='Секунд без ссылок, после которых файл удаляется',
+        )
+        parser.add_argument(
+            '--skip-recount', action='store_true',
+            help='Не пересчитывать ссылки по моделям перед удалением',
+        )
+
+    def handle(self, *args, **options):
+        if not options['skip_recount']:
+            changed = recount_references()
+            self.stdout.write(f'Исправлено счётчиков ссылок: {changed}')
+
+        stats = collect_garbage(timedelta(seconds=options['grace']))
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено файлов: {stats["deleted"]}, освобождено {stats["freed_bytes"]} байт'
+        ))
+        self.stdout.write(f'Удалено копий фото: {remove_stale_variants()}')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.tallies import rebuild_tallies
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает итоги голосования (VoteTally) по таблице голосов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'agenda_item_ids', nargs='*', type=int,
+            help='ID вопросов для пересчёта (по умолчанию - все вопросы)',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_tallies(options['agenda_item_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Пересчитаны итоги по {count} вопросам'))
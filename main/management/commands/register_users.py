@@ -0,0 +1,54 @@
+import csv
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from main.registration import BulkRegistrationError, register_users
+from main.serializers import BulkUserSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Массовая регистрация пользователей из JSON-списка или CSV '
+        '(колонки username,email,password[,is_admin]). Выводит CSV с токенами'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSON или CSV файл')
+        parser.add_argument('--output', help='Файл для CSV с токенами (по умолчанию - стандартный вывод)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            data = json.load(f) if path.lower().endswith('.json') else list(csv.DictReader(f))
+
+        serializer = BulkUserSerializer(data=data, many=True, allow_empty=False)
+        if not serializer.is_valid():
+            raise CommandError(self.format_errors(serializer.errors))
+
+        try:
+            users = register_users(serializer.validated_data, options['batch_size'])
+        except BulkRegistrationError as exc:
+            raise CommandError(self.format_errors(exc.errors))
+        except IntegrityError as exc:
+            raise CommandError(f'Пользователи не созданы: {exc}')
+
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            writer = csv.DictWriter(output, fieldnames=['id', 'username', 'token'])
+            writer.writeheader()
+            writer.writerows(users)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        self.stderr.write(self.style.SUCCESS(f'Создано пользователей: {len(users)}'))
+
+    def format_errors(self, errors):
+        if isinstance(errors, dict):
+            return f'Некорректные данные: {errors}'
+        lines = [f'  строка {index + 1}: {error}' for index, error in enumerate(errors) if error]
+        return 'Пользователи не созданы:\n' + '\n'.join(lines)
@@ -0,0 +1,48 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main.deadlines import DeadlineQueue, finalize_agenda_items, load_deadlines
+
+
+class Command(BaseCommand):
+    help = (
+        'Планировщик сроков: в summary_datetime закрывает вопрос, фиксирует итоги '
+        'и заранее генерирует протокол'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresh-interval', type=float,
+                            help='Секунд между чтениями сроков из базы (по умолчанию DEADLINE_REFRESH_INTERVAL)')
+        parser.add_argument('--once', action='store_true',
+                            help='Закрыть вопросы с прошедшим сроком и завершиться')
+
+    def handle(self, *args, **options):
+        refresh_interval = options['refresh_interval'] or settings.DEADLINE_REFRESH_INTERVAL
+        queue = DeadlineQueue()
+        next_refresh = 0
+
+        while True:
+            if time.monotonic() >= next_refresh:
+                # Сроки с запасом на интервал: вопрос не пропускается между чтениями
+                queue.replace(load_deadlines(timezone.now() + timedelta(seconds=2 * refresh_interval)))
+                next_refresh = time.monotonic() + refresh_interval
+
+            due = queue.pop_due(timezone.now())
+            if due:
+                for agenda_item in finalize_agenda_items(due):
+                    self.stdout.write(f'Вопрос {agenda_item.id}: итоги подведены, протокол готов')
+                continue
+
+            if options['once']:
+                break
+
+            # Спим до ближайшего срока или до следующего чтения сроков
+            timeout = next_refresh - time.monotonic()
+            deadline = queue.next_deadline()
+            if deadline is not None:
+                timeout = min(timeout, (deadline - timezone.now()).total_seconds())
+            time.sleep(max(timeout, 0))
@@ -0,0 +1,60 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+
+from main.http_client import get_async_room_service_client
+from main.metrics import start_metrics_server
+from main.provisioning import arun_job, claim_jobs, run_job_in_thread
+
+
+class Command(BaseCommand):
+    help = 'Воркер очереди создания комнат конференций (RoomProvisioningJob)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Число потоков (с --async - одновременных запросов к сервису)')
+        parser.add_argument('--async', action='store_true', dest='use_async',
+                            help='Ждать сервис комнат в цикле событий, а не в потоках')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Пауза между опросами пустой очереди, секунд')
+        parser.add_argument('--once', action='store_true',
+                            help='Обработать готовые задачи и завершиться')
+        parser.add_argument('--metrics-port', type=int,
+                            help='Отдавать метрики воркера (время запросов к сервису комнат) на этом порту')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if options['metrics_port']:
+            start_metrics_server(options['metrics_port'])
+
+        if options['use_async']:
+            asyncio.run(self.run_async(options))
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                jobs = claim_jobs(workers)
+                for job in executor.map(run_job_in_thread, jobs):
+                    self.stdout.write(f'Задача {job.id} (конференция {job.meeting_id}): {job.status}')
+
+                if options['once'] and not jobs:
+                    break
+                if not jobs:
+                    time.sleep(options['poll_interval'])
+
+    async def run_async(self, options):
+        # Запросы забранных задач выполняются одновременно, а не по числу
+        # потоков общего пула цикла событий
+        get_async_room_service_client().set_max_workers(options['workers'])
+        while True:
+            jobs = await sync_to_async(claim_jobs)(options['workers'])
+            for job in await asyncio.gather(*(arun_job(job) for job in jobs)):
+                self.stdout.write(f'Задача {job.id} (конференция {job.meeting_id}): {job.status}')
+
+            if options['once'] and not jobs:
+                break
+            if not jobs:
+                await asyncio.sleep(options['poll_interval'])
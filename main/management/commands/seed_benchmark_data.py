@@ -0,0 +1,154 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from main.models import AgendaItem, Meeting, UserMeetings, UserProfile, Vote, VoteTally
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими данными для нагрузочных замеров (bench_api)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--meetings', type=int, default=1_000)
+        parser.add_argument('--agenda-items', type=int, default=50_000)
+        parser.add_argument('--votes', type=int, default=1_000_000)
+        parser.add_argument('--meetings-per-user', type=int, default=5,
+                            help='В скольких конференциях участвует каждый пользователь')
+        parser.add_argument('--admin-ratio', type=float, default=0.01,
+                            help='Доля администраторов среди пользователей')
+        parser.add_argument('--password', default='password',
+                            help='Пароль всех пользователей (хешируется один раз)')
+        parser.add_argument('--prefix', default='bench', help='Префикс имён пользователей')
+        parser.add_argument('--batch-size', type=int, default=5_000)
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора случайных чисел')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+
+        if options['users'] < 1 or options['meetings'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь и одна конференция')
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Пользователи с префиксом "{prefix}_" уже есть: используйте чистую базу или другой --prefix'
+            )
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            user_ids, admin_ids = self.create_users(
+                prefix, options['users'], options['admin_ratio'], options['password']
+            )
+            meeting_ids = self.create_meetings(prefix, options['meetings'], admin_ids)
+            members = self.create_memberships(user_ids, meeting_ids, options['meetings_per_user'])
+            agenda_items = self.create_agenda_items(meeting_ids, options['agenda_items'])
+            votes = self.create_votes(agenda_items, members, options['votes'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: {len(user_ids)} пользователей, {len(meeting_ids)} конференций, '
+            f'{len(agenda_items)} вопросов, {votes} голосов за {time.perf_counter() - started:.1f} с'
+        ))
+
+    def bulk_create(self, model, objects):
+        """Вставляет объекты пачками по --batch-size. Возвращает созданные объекты"""
+        created = []
+        for start in range(0, len(objects), self.batch_size):
+            created += model.objects.bulk_create(objects[start:start + self.batch_size])
+        return created
+
+    def create_users(self, prefix, count, admin_ratio, password):
+        # Хеширование пароля - самая дорогая часть, делаем его один раз
+        password = make_password(password)
+        users = self.bulk_create(User, [
+            User(username=f'{prefix}_{i}', email=f'{prefix}_{i}@example.com', password=password)
+            for i in range(count)
+        ])
+        user_ids = [user.pk for user in users]
+
+        admin_every = max(int(1 / admin_ratio), 1) if admin_ratio > 0 else count + 1
+        admin_ids = [user_id for i, user_id in enumerate(user_ids) if i % admin_every == 0]
+        admins = set(admin_ids)
+        self.bulk_create(UserProfile, [
+            UserProfile(user_id=user_id, is_admin=user_id in admins) for user_id in user_ids
+        ])
+        self.stdout.write(f'Пользователи: {len(user_ids)} (администраторов: {len(admin_ids)})')
+        return user_ids, admin_ids
+
+    def create_meetings(self, prefix, count, admin_ids):
+        now = timezone.now()
+        meetings = self.bulk_create(Meeting, [
+            Meeting(
+                registration_link=f'https://rooms.example.com/{prefix}-{i}',
+                name_room=f'{prefix}-{i}',
+                # Половина конференций прошла, половина впереди
+                date=now + timedelta(days=self.random.uniform(-180, 180)),
+                admin_id=self.random.choice(admin_ids),
+            )
+            for i in range(count)
+        ])
+        self.stdout.write(f'Конференции: {len(meetings)}')
+        return [(meeting.pk, meeting.date) for meeting in meetings]
+
+    def create_memberships(self, user_ids, meeting_ids, per_user):
+        """Участники конференций: meeting_id -> [user_id]"""
+        per_user = min(per_user, len(meeting_ids))
+        members = {meeting_id: [] for meeting_id, _ in meeting_ids}
+        links = []
+        for user_id in user_ids:
+            for meeting_id, _ in self.random.sample(meeting_ids, per_user):
+                members[meeting_id].append(user_id)
+                links.append(UserMeetings(user_id=user_id, meeting_id=meeting_id))
+        self.bulk_create(UserMeetings, links)
+        self.stdout.write(f'Участие в конференциях: {len(links)}')
+        return members
+
+    def create_agenda_items(self, meeting_ids, count):
+        """Вопросы распределяются по конференциям поровну. Возвращает [(id, meeting_id)]"""
+        items = []
+        for i in range(count):
+            meeting_id, date = meeting_ids[i % len(meeting_ids)]
+            items.append(AgendaItem(
+                meeting_id=meeting_id,
+                title=f'Вопрос {i}',
+                description='Проект решения, поставленный на голосование',
+                meeting_type=self.random.choice(['vote', 'online']),
+                summary_datetime=date + timedelta(hours=self.random.uniform(1, 72)),
+            ))
+        items = self.bulk_create(AgendaItem, items)
+        self.stdout.write(f'Вопросы: {len(items)}')
+        return [(item.pk, item.meeting_id) for item in items]
+
+    def create_votes(self, agenda_items, members, count):
+        """Голоса участников конференции по её вопросам и итоги (VoteTally) по ним"""
+        per_item, remainder = divmod(count, max(len(agenda_items), 1))
+        choices = ['yes', 'no', 'abstain']
+
+        votes, tallies, created = [], [], 0
+        for i, (agenda_item_id, meeting_id) in enumerate(agenda_items):
+            voters = members[meeting_id]
+            wanted = min(per_item + (1 if i < remainder else 0), len(voters))
+
+            tally = VoteTally(agenda_item_id=agenda_item_id)
+            for user_id in self.random.sample(voters, wanted):
+                choice = self.random.choice(choices)
+                setattr(tally, choice, getattr(tally, choice) + 1)
+                votes.append(Vote(agenda_item_id=agenda_item_id, user_id=user_id, vote=choice))
+            tally.total = wanted
+            tallies.append(tally)
+
+            # Голоса не держим в памяти все сразу
+            if len(votes) >= self.batch_size:
+                created += len(self.bulk_create(Vote, votes))
+                votes = []
+
+        created += len(self.bulk_create(Vote, votes))
+        self.bulk_create(VoteTally, tallies)
+        self.stdout.write(f'Голоса: {created}')
+        return created
@@ -0,0 +1,257 @@
+import bisect
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, JsonResponse
+from django.utils.crypto import constant_time_compare
+from rest_framework.authtoken.models import Token
+
+from .authentication import get_token
+
+
+# Метрики производительности в памяти процесса, в текстовом формате Prometheus.
+# Гистограммы с фиксированными корзинами: запись - O(число корзин) под одной
+# блокировкой, память не растёт с числом запросов. У каждого процесса
+# (воркера gunicorn, пула протоколов) свои метрики.
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # секунд
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)  # байт
+HTTP_METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE', 'CONNECT'})
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus"""
+        with self._lock:
+            histograms = sorted(
+                ((key, h.buckets, list(h.counts), h.sum, h.count) for key, h in self._histograms.items()),
+                key=lambda item: item[0],
+            )
+            counters = sorted(self._counters.items())
+
+        lines = []
+        typed = set()
+        for (name, labels), buckets, counts, total, count in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} histogram')
+            cumulative = 0
+            for bound, bucket_count in zip([*buckets, '+Inf'], counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {total:.6f}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{_labels(labels)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels, **extra):
+    items = [*labels, *extra.items()]
+    if not items:
+        return ''
+    escaped = (
+        str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        for _, value in items
+    )
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + '}'
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def timer(name, **labels):
+    """Замеряет время блока в гистограмму name с меткой outcome=ok|error"""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        registry.observe(name, time.perf_counter() - started, outcome=outcome, **labels)
+
+
+class QueryStats:
+    """Обёртка выполнения SQL (connection.execute_wrapper): число запросов и их время"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def _wrap_connections(stack, stats):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(stats))
+
+
+class MetricsMiddleware:
+    """Время ответа, число и время SQL-запросов, размер и статус ответа по имени URL.
+
+    Асинхронные представления ходят в базу через sync_to_async
+    (thread_sensitive): асинхронный ORM, main.async_views. Эти запросы
+    выполняются в отдельном потоке запроса со своими соединениями, поэтому
+    обёртка SQL устанавливается и снимается в нём же. Время потокового
+    ответа и его SQL - до отдачи заголовков.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        stats = QueryStats()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            _wrap_connections(stack, stats)
+            response = self.get_response(request)
+        record_request(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        stack = ExitStack()
+        await sync_to_async(_wrap_connections)(stack, stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        record_request(request, response, time.perf_counter() - started, stats)
+        return response
+
+
+def record_request(request, response, duration, stats=None):
+    match = request.resolver_match
+    view = match.view_name if match is not None else 'unmatched'
+    # Метод приходит от клиента: произвольные значения не должны порождать новые серии
+    method = request.method if request.method in HTTP_METHODS else 'other'
+
+    registry.observe('http_request_duration_seconds', duration, view=view, method=method)
+    registry.inc('http_responses_total', view=view, status=response.status_code)
+
+    if stats is not None:
+        registry.observe('http_request_db_queries', stats.count, QUERY_BUCKETS, view=view)
+        registry.observe('http_request_db_duration_seconds', stats.duration, view=view)
+
+    if not response.streaming:
+        size = len(response.content)
+    elif response.has_header('Content-Length'):
+        size = int(response['Content-Length'])
+    else:
+        # Размер потокового ответа без Content-Length заранее неизвестен
+        return
+    registry.observe('http_response_size_bytes', size, SIZE_BUCKETS, view=view)
+
+
+def has_metrics_access(request):
+    """Bearer-токен METRICS_TOKEN (для сборщика метрик) или токен администратора"""
+    parts = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(parts) != 2:
+        return False
+    kind, key = parts[0].lower(), parts[1]
+
+    if kind == 'bearer':
+        metrics_token = getattr(settings, 'METRICS_TOKEN', None)
+        return bool(metrics_token) and constant_time_compare(key, metrics_token)
+
+    if kind == 'token':
+        try:
+            user = get_token(key).user
+        except Token.DoesNotExist:
+            return False
+        profile = getattr(user, 'profile', None)
+        return user.is_active and profile is not None and profile.is_admin
+
+    return False
+
+
+def metrics_view(request):
+    """Метрики процесса в текстовом формате Prometheus"""
+    if not has_metrics_access(request):
+        return JsonResponse({"error": "Forbidden"}, status=403)
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """HTTP-сервер метрик в фоновом потоке для процессов без Django-сервера (воркеры)"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
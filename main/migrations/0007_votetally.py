@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-18 16:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fill_tallies(apps, schema_editor):
+    # Заполняем итоги по уже существующим голосам
+    AgendaItem = apps.get_model('main', 'AgendaItem')
+    Vote = apps.get_model('main', 'Vote')
+    VoteTally = apps.get_model('main', 'VoteTally')
+
+    counts = {
+        row['agenda_item_id']: row
+        for row in Vote.objects.values('agenda_item_id').annotate(
+            yes=Count('id', filter=Q(vote='yes')),
+            no=Count('id', filter=Q(vote='no')),
+            abstain=Count('id', filter=Q(vote='abstain')),
+            total=Count('id'),
+        )
+    }
+    VoteTally.objects.bulk_create(
+        [
+            VoteTally(
+                agenda_item_id=agenda_item_id,
+                yes=counts.get(agenda_item_id, {}).get('yes', 0),
+                no=counts.get(agenda_item_id, {}).get('no', 0),
+                abstain=counts.get(agenda_item_id, {}).get('abstain', 0),
+                total=counts.get(agenda_item_id, {}).get('total', 0),
+            )
+            for agenda_item_id in AgendaItem.objects.values_list('pk', flat=True)
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_meeting_name_room_alter_agendaitem_summary_datetime_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteTally',
+            fields=[
+                ('agenda_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='tally', serialize=False, to='main.agendaitem')),
+                ('yes', models.PositiveIntegerField(default=0, verbose_name='За')),
+                ('no', models.PositiveIntegerField(default=0, verbose_name='Против')),
+                ('abstain', models.PositiveIntegerField(default=0, verbose_name='Воздержались')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Всего голосов')),
+            ],
+        ),
+        migrations.RunPython(fill_tallies, migrations.RunPython.noop),
+    ]
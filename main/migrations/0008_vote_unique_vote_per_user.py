@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-18 16:29
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    # Оставляем только последний голос пользователя по каждому вопросу
+    Vote = apps.get_model('main', 'Vote')
+    VoteTally = apps.get_model('main', 'VoteTally')
+
+    duplicates = (
+        Vote.objects.values('agenda_item_id', 'user_id')
+        .annotate(last_id=Max('id'), count=Count('id'))
+        .filter(count__gt=1)
+    )
+
+    agenda_item_ids = set()
+    for row in duplicates.iterator():
+        Vote.objects.filter(
+            agenda_item_id=row['agenda_item_id'], user_id=row['user_id'], id__lt=row['last_id']
+        ).delete()
+        agenda_item_ids.add(row['agenda_item_id'])
+
+    # Пересчитываем итоги по вопросам, где были дубли
+    counts = (
+        Vote.objects.filter(agenda_item_id__in=agenda_item_ids)
+        .values('agenda_item_id')
+        .annotate(
+            yes=Count('id', filter=Q(vote='yes')),
+            no=Count('id', filter=Q(vote='no')),
+            abstain=Count('id', filter=Q(vote='abstain')),
+            total=Count('id'),
+        )
+    )
+    for row in counts:
+        VoteTally.objects.update_or_create(
+            agenda_item_id=row.pop('agenda_item_id'), defaults=row
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_votetally'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('agenda_item', 'user'), name='unique_vote_per_user'),
+        ),
+    ]
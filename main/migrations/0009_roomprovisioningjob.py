@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 16:31
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_vote_unique_vote_per_user'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='meeting',
+            name='registration_link',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Ссылка на регистрацию на конференцию'),
+        ),
+        migrations.CreateModel(
+            name='RoomProvisioningJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('password_room', models.CharField(blank=True, max_length=255, verbose_name='Пароль комнаты')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('running', 'Выполняется'), ('done', 'Выполнена'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлена')),
+                ('meeting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='provisioning_jobs', to='main.meeting')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='room_job_queue_idx')],
+            },
+        ),
+    ]
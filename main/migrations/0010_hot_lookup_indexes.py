@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 16:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_roomprovisioningjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # Регистронезависимый поиск пользователя по email (LoginView).
+    # auth_user - модель django.contrib.auth, поэтому индекс по выражению создаётся вручную
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agendaitem',
+            index=models.Index(fields=['meeting', 'summary_datetime', 'id'], name='agenda_meeting_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meeting',
+            index=models.Index(fields=['date', 'id'], name='meeting_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usermeetings',
+            index=models.Index(fields=['user', 'meeting'], name='user_meetings_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['agenda_item', 'vote'], name='vote_item_choice_idx'),
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX auth_user_email_lower_idx ON auth_user (LOWER(email))',
+            reverse_sql='DROP INDEX auth_user_email_lower_idx',
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-18 16:44
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_memberships(apps, schema_editor):
+    # Оставляем первую запись участия пользователя в каждой конференции
+    UserMeetings = apps.get_model('main', 'UserMeetings')
+
+    duplicates = (
+        UserMeetings.objects.values('user_id', 'meeting_id')
+        .annotate(first_id=Min('id'), count=Count('id'))
+        .filter(count__gt=1)
+    )
+    for row in duplicates.iterator():
+        UserMeetings.objects.filter(
+            user_id=row['user_id'], meeting_id=row['meeting_id'], id__gt=row['first_id']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_hot_lookup_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_memberships, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='usermeetings',
+            constraint=models.UniqueConstraint(fields=('user', 'meeting'), name='unique_user_meeting'),
+        ),
+        # Индекс ограничения покрывает те же выборки
+        migrations.RemoveIndex(
+            model_name='usermeetings',
+            name='user_meetings_user_idx',
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-18 16:49
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_usermeetings_unique_user_meeting'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('target', models.CharField(choices=[('materials', 'Материалы вопроса'), ('signed_vote', 'Подписанный опросный лист')], max_length=20, verbose_name='Назначение')),
+                ('filename', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер, байт')),
+                ('received', models.PositiveBigIntegerField(default=0, verbose_name='Получено, байт')),
+                ('sha256', models.CharField(blank=True, max_length=64, verbose_name='Контрольная сумма')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('expires_at', models.DateTimeField(verbose_name='Действует до')),
+                ('agenda_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.agendaitem', verbose_name='Вопрос')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expires_at'], name='upload_session_expires_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_userprofile_photo_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SignatureCheck',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='SHA-256')),
+                ('status', models.CharField(choices=[('pending', 'Проверяется'), ('valid', 'Подпись действительна'), ('invalid', 'Подпись недействительна'), ('error', 'Не удалось проверить')], max_length=10, verbose_name='Результат')),
+                ('signer', models.CharField(blank=True, max_length=255, verbose_name='Подписант')),
+                ('detail', models.TextField(blank=True, verbose_name='Подробности')),
+                ('checked_at', models.DateTimeField(auto_now=True, verbose_name='Проверен')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='signature_signer',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Подписант'),
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='signature_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Проверяется'), ('valid', 'Подпись действительна'), ('invalid', 'Подпись недействительна'), ('error', 'Не удалось проверить')], max_length=10, verbose_name='Проверка ЭП'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 17:08
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Now
+
+
+def close_past_items(apps, schema_editor):
+    # Вопросы, срок которых уже прошёл, считаем закрытыми в срок:
+    # планировщик не генерирует протоколы по всей истории при первом запуске
+    AgendaItem = apps.get_model('main', 'AgendaItem')
+    AgendaItem.objects.filter(summary_datetime__lt=Now()).update(closed_at=F('summary_datetime'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_signature_verification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agendaitem',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Итоги подведены'),
+        ),
+        migrations.AddIndex(
+            model_name='agendaitem',
+            index=models.Index(condition=models.Q(('closed_at__isnull', True)), fields=['summary_datetime', 'id'], name='agenda_open_deadline_idx'),
+        ),
+        migrations.RunPython(close_past_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_agenda_item_closed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='votetally',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Версия'),
+        ),
+    ]
@@ -1,4 +1,7 @@
+import uuid
+
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 
@@ -6,6 +9,8 @@ class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     is_admin = models.BooleanField(default=False, verbose_name="Администратор")
     photo = models.ImageField(upload_to='user_photos/', null=True, blank=True, verbose_name="Фото")
+    # Уменьшенные копии фото (main.avatars): {размер: {формат: имя файла}}, пусто - ещё не готовы
+    photo_variants = models.JSONField(default=dict, blank=True, verbose_name="Копии фото")
 
     def __str__(self):
         return f"Профиль {self.user.username}"
@@ -13,20 +18,65 @@ class UserProfile(models.Model):
 
 class Meeting(models.Model):
     """Модель конференции"""
-    registration_link = models.CharField(max_length=255, verbose_name="Ссылка на регистрацию на конференцию")
+    registration_link = models.CharField(
+        max_length=255,
+        blank=True,  # Заполняется после создания комнаты (RoomProvisioningJob)
+        verbose_name="Ссылка на регистрацию на конференцию"
+    )
     name_room = models.CharField(max_length=255, verbose_name="Название комнаты")
     date = models.DateTimeField(verbose_name="Дата проведения")
     admin = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Создатель конференции")
 
+    class Meta:
+        indexes = [
+            # Список конференций упорядочен по (date, id)
+            models.Index(fields=['date', 'id'], name='meeting_date_idx'),
+        ]
+
     def __str__(self):
         return f"Заседание {self.date}"
 
 
+class RoomProvisioningJob(models.Model):
+    """Задача на создание комнаты конференции во внешнем сервисе"""
+    STATUS_CHOICES = [
+        ("pending", "Ожидает"),
+        ("running", "Выполняется"),
+        ("done", "Выполнена"),
+        ("failed", "Ошибка"),
+    ]
+
+    meeting = models.ForeignKey(Meeting, related_name="provisioning_jobs", on_delete=models.CASCADE)
+    password_room = models.CharField(max_length=255, blank=True, verbose_name="Пароль комнаты")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending", verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    # Время следующей попытки (для выполняющейся задачи - до какого времени она занята воркером)
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Следующая попытка")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлена")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='room_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Комната для {self.meeting} ({self.status})"
+
+
 class UserMeetings(models.Model):
     """Связь пользователя и конференции"""
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     meeting = models.ForeignKey(Meeting, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            # Пользователь участвует в конференции один раз. Индекс ограничения
+            # заодно покрывает выборку user -> meeting_id
+            models.UniqueConstraint(fields=['user', 'meeting'], name='unique_user_meeting'),
+        ]
+
     def __str__(self):
         return f"{self.user} - {self.meeting}"
 
@@ -50,11 +100,32 @@ class AgendaItem(models.Model):
     summary_datetime = models.DateTimeField(
         verbose_name="Дата и время подведения итогов",
     )
+    # Заполняет планировщик сроков (main.deadlines) после summary_datetime
+    closed_at = models.DateTimeField(null=True, blank=True, verbose_name="Итоги подведены")
+
+    class Meta:
+        indexes = [
+            # Вопросы конференции в порядке подведения итогов (постраничная выдача)
+            models.Index(fields=['meeting', 'summary_datetime', 'id'], name='agenda_meeting_date_idx'),
+            # Ближайшие сроки открытых вопросов (run_deadline_scheduler)
+            models.Index(
+                fields=['summary_datetime', 'id'], name='agenda_open_deadline_idx',
+                condition=models.Q(closed_at__isnull=True),
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
 
+SIGNATURE_STATUS_CHOICES = [
+    ("pending", "Проверяется"),
+    ("valid", "Подпись действительна"),
+    ("invalid", "Подпись недействительна"),
+    ("error", "Не удалось проверить"),
+]
+
+
 class Vote(models.Model):
     """Модель голосования по вопросу"""
     agenda_item = models.ForeignKey(AgendaItem, related_name="votes", on_delete=models.CASCADE)
@@ -71,6 +142,95 @@ class Vote(models.Model):
         null=True,  # Разрешаем NULL в базе данных
         blank=True  # Разрешаем пустое значение в формах
     )
+    # Проверка подписи опросного листа (main.signatures), пусто - листа нет
+    signature_status = models.CharField(
+        max_length=10, blank=True, choices=SIGNATURE_STATUS_CHOICES, verbose_name="Проверка ЭП"
+    )
+    signature_signer = models.CharField(max_length=255, blank=True, verbose_name="Подписант")
+
+    class Meta:
+        constraints = [
+            # Один голос пользователя по каждому вопросу
+            models.UniqueConstraint(fields=['agenda_item', 'user'], name='unique_vote_per_user'),
+        ]
+        indexes = [
+            # Подсчёт голосов по вопросу с разбивкой по вариантам
+            models.Index(fields=['agenda_item', 'vote'], name='vote_item_choice_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.vote}"
+
+
+class VoteTally(models.Model):
+    """Итоги голосования по вопросу (обновляются при каждом голосе)"""
+    agenda_item = models.OneToOneField(
+        AgendaItem, primary_key=True, related_name="tally", on_delete=models.CASCADE
+    )
+    yes = models.PositiveIntegerField(default=0, verbose_name="За")
+    no = models.PositiveIntegerField(default=0, verbose_name="Против")
+    abstain = models.PositiveIntegerField(default=0, verbose_name="Воздержались")
+    total = models.PositiveIntegerField(default=0, verbose_name="Всего голосов")
+    # Растёт при каждом изменении счётчиков: потоки итогов (main.streams)
+    # по ней пропускают изменения, уже учтённые в отправленных итогах
+    version = models.PositiveBigIntegerField(default=0, verbose_name="Версия")
+
+    def __str__(self):
+        return f"{self.agenda_item}: {self.yes}/{self.no}/{self.abstain}"
+
+
+class UploadSession(models.Model):
+    """Загрузка файла частями (main.uploads): материалы вопроса или подписанный опросный лист"""
+    TARGET_CHOICES = [
+        ("materials", "Материалы вопроса"),
+        ("signed_vote", "Подписанный опросный лист"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
+    agenda_item = models.ForeignKey(AgendaItem, on_delete=models.CASCADE, verbose_name="Вопрос")
+    target = models.CharField(max_length=20, choices=TARGET_CHOICES, verbose_name="Назначение")
+    filename = models.CharField(max_length=255, verbose_name="Имя файла")
+    size = models.PositiveBigIntegerField(verbose_name="Размер, байт")
+    received = models.PositiveBigIntegerField(default=0, verbose_name="Получено, байт")
+    # SHA-256 файла, если клиент передал его при создании загрузки
+    sha256 = models.CharField(max_length=64, blank=True, verbose_name="Контрольная сумма")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    expires_at = models.DateTimeField(verbose_name="Действует до")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='upload_session_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+
+class Blob(models.Model):
+    """Файл в хранилище по содержимому (main.storage) и число ссылок на него
+    из AgendaItem.materials, Vote.signed_vote и UserProfile.photo"""
+    name = models.CharField(max_length=255, primary_key=True, verbose_name="Имя файла")
+    refcount = models.PositiveIntegerField(default=0, verbose_name="Ссылок")
+    # Когда менялось число ссылок: файл без ссылок удаляется не сразу (BLOB_GC_GRACE)
+    updated_at = models.DateTimeField(default=timezone.now, verbose_name="Обновлён")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['refcount', 'updated_at'], name='blob_orphans_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+
+class SignatureCheck(models.Model):
+    """Результат проверки подписи файла по его SHA-256 (main.signatures)"""
+    digest = models.CharField(max_length=64, primary_key=True, verbose_name="SHA-256")
+    status = models.CharField(max_length=10, choices=SIGNATURE_STATUS_CHOICES, verbose_name="Результат")
+    signer = models.CharField(max_length=255, blank=True, verbose_name="Подписант")
+    detail = models.TextField(blank=True, verbose_name="Подробности")
+    checked_at = models.DateTimeField(auto_now=True, verbose_name="Проверен")
+
+    def __str__(self):
+        return f"{self.digest}: {self.status}"
@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination:
+    """Курсорная (keyset) пагинация по уникальному упорядочиванию.
+
+    Тело ответа остаётся списком, ссылка на следующую страницу передаётся
+    в заголовках Link (rel="next") и X-Next-Cursor. Курсор подписан:
+    изменённый клиентом курсор отклоняется.
+    """
+    cursor_query_param = 'cursor'
+    cursor_salt = 'main.pagination.cursor'
+    limit_query_param = 'limit'
+
+    def __init__(self, ordering):
+        # Последнее поле упорядочивания должно быть уникальным (обычно id)
+        self.ordering = ordering
+        self.next_cursor = None
+
+    def get_limit(self, request):
+        default = getattr(settings, 'API_PAGE_SIZE', 100)
+        maximum = getattr(settings, 'API_MAX_PAGE_SIZE', 500)
+        try:
+            limit = int(request.query_params.get(self.limit_query_param, default))
+        except ValueError:
+            raise ValidationError({'limit': 'Ожидается целое число'})
+        if not 1 <= limit <= maximum:
+            raise ValidationError({'limit': f'Допустимые значения: от 1 до {maximum}'})
+        return limit
+
+    def encode_cursor(self, obj):
+        values = [obj._meta.get_field(name).value_to_string(obj) for name in self.ordering]
+        return signing.dumps(values, salt=self.cursor_salt)
+
+    def decode_cursor(self, cursor, model):
+        try:
+            values = signing.loads(cursor, salt=self.cursor_salt)
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.ordering, values)
+            ]
+        except (signing.BadSignature, ValueError, TypeError, DjangoValidationError):
+            raise ValidationError({'cursor': 'Некорректный курсор'})
+
+    def after(self, values):
+        """Условие "строго после курсора" для упорядочивания по нескольким полям:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        for i, name in enumerate(self.ordering):
+            equal = {field: value for field, value in zip(self.ordering[:i], values[:i])}
+            condition |= Q(**equal, **{f'{name}__gt': values[i]})
+        return condition
+
+    def paginate_queryset(self, queryset, request):
+        return self.get_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        """То же для асинхронных представлений (main.async_views)"""
+        return self.get_page([item async for item in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.limit = self.get_limit(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_cursor(cursor, queryset.model)))
+
+        # Берём на одну запись больше, чтобы понять, есть ли следующая страница
+        return queryset[:self.limit + 1]
+
+    def get_page(self, items):
+        if len(items) > self.limit:
+            items = items[:self.limit]
+            self.next_cursor = self.encode_cursor(items[-1])
+        return items
+
+    def get_headers(self):
+        if self.next_cursor is None:
+            return {}
+        url = replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor
+        )
+        return {'Link': f'<{url}>; rel="next"', 'X-Next-Cursor': self.next_cursor}
+
+    def get_paginated_response(self, data):
+        return Response(data, headers=self.get_headers())
+
+
+def get_requested_fields(request, serializer_class):
+    """Поля из параметра ?fields=a,b (None - все поля сериализатора)"""
+    value = request.query_params.get('fields')
+    if not value:
+        return None
+
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = set(fields) - set(serializer_class.Meta.fields)
+    if unknown:
+        raise ValidationError({'fields': f'Неизвестные поля: {", ".join(sorted(unknown))}'})
+    return fields
@@ -0,0 +1,67 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import connections
+
+
+# Общий пул процессов для тяжёлой работы на CPU (генерация PDF и т.п.).
+# Модуль не импортирует модели: его импортируют дочерние процессы до настройки Django.
+
+_pool = None
+_result_executor = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    # Процессы пула запускаются через spawn: настраиваем Django заново
+    # (MainConfig.ready в том числе регистрирует шрифты протоколов)
+    django.setup()
+
+
+def get_pool():
+    """Пул процессов размером PROCESS_POOL_WORKERS (None - по числу ядер)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=getattr(settings, 'PROCESS_POOL_WORKERS', None),
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                )
+    return _pool
+
+
+def get_result_executor():
+    """Потоки для обработки результатов задач пула (PROCESS_POOL_RESULT_WORKERS)"""
+    global _result_executor
+    if _result_executor is None:
+        with _pool_lock:
+            if _result_executor is None:
+                _result_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'PROCESS_POOL_RESULT_WORKERS', 2),
+                    thread_name_prefix='process-pool-results',
+                )
+    return _result_executor
+
+
+def _handle_result(callback, future):
+    try:
+        callback(future)
+    finally:
+        # Соединения с базой у каждого потока свои
+        connections.close_all()
+
+
+def add_result_callback(future, callback):
+    """Вызывает callback(future) после завершения задачи пула.
+
+    Колбэки future выполняются в служебном потоке ProcessPoolExecutor,
+    который собирает результаты всех задач пула: медленная запись в базу
+    в нём задержала бы остальные задачи. Поэтому колбэк только передаёт
+    результат в отдельный пул потоков.
+    """
+    future.add_done_callback(lambda done: get_result_executor().submit(_handle_result, callback, done))
@@ -0,0 +1,202 @@
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFError, TTFont
+from reportlab.pdfgen import canvas
+
+from .metrics import timer
+from .models import Vote, VoteTally
+from .tallies import get_tally
+
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_LABELS = {
+    'pending': 'ЭП проверяется',
+    'valid': 'ЭП действительна',
+    'invalid': 'ЭП недействительна',
+    'error': 'ЭП не проверена',
+}
+
+# Шрифты с поддержкой кириллицы: имя шрифта -> файл
+FONTS = {
+    'DejaVuSans': 'DejaVuSans.ttf',
+    'DejaVuSans-Bold': 'DejaVuSans-Bold.ttf',
+}
+
+
+def register_fonts():
+    """Регистрирует шрифты протокола (один раз при старте приложения)"""
+    for name, filename in FONTS.items():
+        if name in pdfmetrics.getRegisteredFontNames():
+            continue
+        try:
+            pdfmetrics.registerFont(TTFont(name, filename))
+        except TTFError:
+            logger.warning('Не удалось загрузить шрифт %s (%s)', name, filename)
+
+
+def render_protocol(agenda_item, tally, participants, user, output):
+    """Генерирует PDF-протокол по вопросу и записывает его в файл output"""
+    p = canvas.Canvas(output, pagesize=letter)
+
+    # Устанавливаем шрифт с поддержкой кириллицы
+    p.setFont("DejaVuSans", 14)
+
+    # Заголовок протокола
+    p.drawString(50, 750, f"ПРОТОКОЛ № {agenda_item.id}")
+    p.drawString(50, 730, "заочного голосования Совета директоров")
+    p.drawString(50, 710, "ПАО «ТНС энерго Ростов-на-Дону»")
+
+    # Дата и время окончания приема документов
+    summary_datetime = agenda_item.summary_datetime.strftime("%d %B %Y года, %H:%M")
+    p.setFont("DejaVuSans", 12)
+    p.drawString(50, 680, f"Дата и время окончания приема документов: {summary_datetime} по московскому времени.")
+    p.drawString(50, 660, f"Место подведения итогов заочного голосования: Москва")
+    p.drawString(50, 640, f"Форма проведения: {agenda_item.get_meeting_type_display()}.")
+
+    # Дата составления протокола
+    protocol_date = agenda_item.summary_datetime.strftime("%d %B %Y года")
+    p.drawString(50, 620, f"Дата составления протокола: {protocol_date}.")
+
+    # Лица, принявшие участие в голосовании
+    participants = ", ".join(participants)
+    p.drawString(50, 600, f"Лица, принявшие участие в заочном голосовании: {participants}.")
+    p.drawString(50, 580, f"Лицо, проводившее подсчет голосов: {user.username}.")
+
+    # Кворум
+    p.drawString(50, 560,
+                 "Кворум для подведения итогов заочного голосования Совета директоров с данной повесткой дня имеется.")
+
+    # Повестка дня
+    p.setFont("DejaVuSans-Bold", 12)
+    p.drawString(50, 530, "ПОВЕСТКА ДНЯ:")
+    p.setFont("DejaVuSans", 12)
+    p.drawString(50, 510, f"ВОПРОС № 1:")
+    p.drawString(50, 490, f"Вопрос повестки дня, поставленный на голосование:")
+    p.drawString(50, 470, f"{agenda_item.title}")
+    p.drawString(50, 450, f"Проект решения, поставленный на голосование:")
+    p.drawString(50, 430, f"{agenda_item.description}")
+
+    # Результаты голосования
+    yes_votes = tally.yes
+    no_votes = tally.no
+    abstain_votes = tally.abstain
+
+    p.drawString(50, 410, "Результаты (итоги) голосования:")
+    p.drawString(50, 390, f"ЗА – {yes_votes} голосов.")
+    p.drawString(50, 370, f"ПРОТИВ – {no_votes} голосов.")
+    p.drawString(50, 350, f"ВОЗДЕРЖАЛИСЬ – {abstain_votes} голосов.")
+
+    # Итоговое решение
+    decision = "Решение принято." if yes_votes > no_votes else "Решение не принято."
+    p.drawString(50, 330, decision)
+
+    # Завершение документа
+    p.showPage()
+    p.save()
+
+
+# Готовые протоколы хранятся файлами вне MEDIA_ROOT (без публичного доступа).
+# В имени файла - версия итогов по вопросу (VoteTally.version). Версия
+# хранится в базе и растёт с каждым голосом, поэтому все процессы видят
+# одни и те же имена, а новый голос делает старые файлы неактуальными.
+
+protocol_storage = FileSystemStorage(location=settings.PROTOCOL_ROOT)
+
+
+def bump_protocol_version(agenda_item_id):
+    """Делает сохранённые протоколы вопроса неактуальными.
+
+    Голоса увеличивают версию сами (main.tallies), вызывать нужно при
+    остальных изменениях протокола - в той же транзакции.
+    """
+    VoteTally.objects.filter(agenda_item_id=agenda_item_id).update(version=F('version') + 1)
+
+
+def protocol_name(agenda_item, user_id):
+    """Имя протокола по версии итогов, загруженных вместе с вопросом (select_related('tally'))"""
+    return f'{agenda_item.id}/{get_tally(agenda_item).version}-{user_id}.pdf'
+
+
+def participant_label(username, signature_status):
+    """Участник в протоколе: имя и результат проверки ЭП опросного листа"""
+    if not signature_status:
+        return username
+    return f'{username} ({SIGNATURE_LABELS[signature_status]})'
+
+
+def get_participants(agenda_item):
+    """Проголосовавшие по вопросу (с результатом проверки ЭП)"""
+    rows = (
+        Vote.objects.filter(agenda_item=agenda_item)
+        .order_by('timestamp')
+        .values_list('user__username', 'signature_status')
+    )
+    return [participant_label(username, status) for username, status in rows]
+
+
+def store_protocol(name, agenda_item, tally, participants, user):
+    """Генерирует протокол и сохраняет его в хранилище. Возвращает имя файла
+
+    PDF пишется во временный файл, который остаётся в памяти только
+    пока он меньше PROTOCOL_SPOOL_MAX_SIZE.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=settings.PROTOCOL_SPOOL_MAX_SIZE) as output:
+        with timer('protocol_render_duration_seconds'):
+            render_protocol(agenda_item, tally, participants, user, output)
+        output.seek(0)
+        name = protocol_storage.save(name, File(output))
+
+    remove_stale_protocols(agenda_item.id, name)
+    return name
+
+
+def remove_stale_protocols(agenda_item_id, current_name):
+    """Удаляет протоколы вопроса, сгенерированные по более старым версиям голосов"""
+    current_version = int(current_name.split('/')[-1].split('-')[0])
+    _, files = protocol_storage.listdir(str(agenda_item_id))
+    for filename in files:
+        try:
+            version = int(filename.split('-')[0])
+        except ValueError:
+            continue
+        if version < current_version:
+            protocol_storage.delete(f'{agenda_item_id}/{filename}')
+
+
+def get_protocol(agenda_item, user):
+    """Имя файла актуального протокола (генерируется, если его ещё нет)"""
+    name = protocol_name(agenda_item, user.id)
+    if not protocol_storage.exists(name):
+        name = store_protocol(name, agenda_item, get_tally(agenda_item), get_participants(agenda_item), user)
+    return name
+
+
+def open_protocol(agenda_item, user):
+    """Имя, открытый файл и размер актуального протокола.
+
+    Между проверкой и открытием файл может удалить процесс, который уже
+    видит более новую версию итогов (remove_stale_protocols). Тогда итоги
+    перечитываются и протокол генерируется заново.
+    """
+    name = get_protocol(agenda_item, user)
+    try:
+        file = protocol_storage.open(name, 'rb')
+    except FileNotFoundError:
+        tally = get_tally(agenda_item)
+        if tally.pk is not None:
+            tally.refresh_from_db()
+        name = store_protocol(
+            protocol_name(agenda_item, user.id), agenda_item, tally, get_participants(agenda_item), user
+        )
+        file = protocol_storage.open(name, 'rb')
+    # Размер - по открытому файлу: по имени его уже могут удалить
+    return name, file, os.fstat(file.fileno()).st_size
@@ -0,0 +1,161 @@
+import logging
+from datetime import timedelta
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .http_client import get_async_room_service_client, get_room_service_client
+from .metrics import timer
+from .models import Meeting, RoomProvisioningJob
+
+
+logger = logging.getLogger(__name__)
+
+
+class RoomServiceError(Exception):
+    """Внешний сервис не смог создать комнату"""
+
+
+def create_room(name, password):
+    """Создаёт комнату во внешнем сервисе и возвращает ссылку на регистрацию"""
+    try:
+        with timer('room_service_request_duration_seconds'):
+            response = get_room_service_client().post(
+                settings.ROOM_SERVICE_URL,
+                json={"name": name, "password": password},
+            )
+    except requests.RequestException as exc:
+        # В том числе CircuitOpenError, когда сервис признан недоступным
+        raise RoomServiceError(str(exc)) from exc
+    return _registration_link(response)
+
+
+async def acreate_room(name, password):
+    """То же для корутин: ожидание ответа сервиса не занимает поток"""
+    try:
+        with timer('room_service_request_duration_seconds'):
+            response = await get_async_room_service_client().post(
+                settings.ROOM_SERVICE_URL,
+                json={"name": name, "password": password},
+            )
+    except requests.RequestException as exc:
+        raise RoomServiceError(str(exc)) from exc
+    return _registration_link(response)
+
+
+def _registration_link(response):
+    if response.status_code != 200:
+        raise RoomServiceError(f'Room service responded with {response.status_code}')
+
+    try:
+        return response.json()['uri']
+    except (ValueError, KeyError, TypeError) as exc:
+        raise RoomServiceError('Unexpected room service response') from exc
+
+
+def enqueue_meeting(name_room, password_room, date, admin):
+    """Создаёт конференцию без ссылки и задачу на создание комнаты"""
+    with transaction.atomic():
+        meeting = Meeting.objects.create(
+            registration_link='',
+            name_room=name_room,
+            date=date,
+            admin=admin,
+        )
+        job = RoomProvisioningJob.objects.create(meeting=meeting, password_room=password_room or '')
+    return meeting, job
+
+
+def attempt_timeout():
+    """Наибольшее время одной попытки: запрос к сервису со всеми повторами и паузами"""
+    retries = getattr(settings, 'ROOM_SERVICE_RETRIES', 2)
+    request_timeout = (
+        getattr(settings, 'ROOM_SERVICE_CONNECT_TIMEOUT', 3.05) + getattr(settings, 'ROOM_SERVICE_READ_TIMEOUT', 10)
+    )
+    backoff = getattr(settings, 'ROOM_SERVICE_BACKOFF', 0.5)
+    return (retries + 1) * request_timeout + backoff * (2 ** retries - 1)
+
+
+def claim_jobs(limit):
+    """Забирает задачи, готовые к выполнению.
+
+    Задача помечается выполняющейся до истечения аренды: если воркер упадёт,
+    её подхватит другой. Забранные задачи воркер выполняет одновременно
+    (limit равен числу его потоков или одновременных запросов), поэтому
+    аренда - ROOM_PROVISIONING_LEASE, но не меньше наибольшего времени
+    одной попытки: иначе задачу, ещё ждущую сервис, заберёт другой воркер
+    и комната будет создана дважды.
+    """
+    now = timezone.now()
+    lease = timedelta(seconds=max(getattr(settings, 'ROOM_PROVISIONING_LEASE', 60), attempt_timeout()))
+
+    with transaction.atomic():
+        jobs = list(
+            RoomProvisioningJob.objects.select_for_update(skip_locked=True)
+            .filter(status__in=["pending", "running"], next_attempt_at__lte=now)
+            .select_related('meeting')
+            .order_by('next_attempt_at')[:limit]
+        )
+        for job in jobs:
+            job.status = "running"
+            job.attempts += 1
+            job.next_attempt_at = now + lease
+            job.save(update_fields=['status', 'attempts', 'next_attempt_at', 'updated_at'])
+    return jobs
+
+
+def run_job(job):
+    """Выполняет одну попытку создания комнаты"""
+    try:
+        registration_link = create_room(job.meeting.name_room, job.password_room)
+    except RoomServiceError as exc:
+        return job_failed(job, exc)
+    return job_done(job, registration_link)
+
+
+async def arun_job(job):
+    """То же для корутин: запрос к сервису асинхронный, запись в базу - в потоке"""
+    try:
+        registration_link = await acreate_room(job.meeting.name_room, job.password_room)
+    except RoomServiceError as exc:
+        return await sync_to_async(job_failed)(job, exc)
+    return await sync_to_async(job_done)(job, registration_link)
+
+
+def job_failed(job, exc):
+    logger.warning('Room provisioning for meeting %s failed: %s', job.meeting_id, exc)
+    job.last_error = str(exc)
+    if job.attempts >= getattr(settings, 'ROOM_PROVISIONING_MAX_ATTEMPTS', 5):
+        job.status = "failed"
+        job.password_room = ''
+    else:
+        # Экспоненциальная задержка перед следующей попыткой
+        delay = getattr(settings, 'ROOM_PROVISIONING_RETRY_DELAY', 10) * 2 ** (job.attempts - 1)
+        job.status = "pending"
+        job.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    job.save(update_fields=['status', 'password_room', 'next_attempt_at', 'last_error', 'updated_at'])
+    return job
+
+
+def job_done(job, registration_link):
+    with transaction.atomic():
+        job.meeting.registration_link = registration_link
+        job.meeting.save(update_fields=['registration_link'])
+        job.status = "done"
+        job.last_error = ''
+        # Пароль комнаты больше не нужен
+        job.password_room = ''
+        job.save(update_fields=['status', 'password_room', 'last_error', 'updated_at'])
+    return job
+
+
+def run_job_in_thread(job):
+    """Обёртка для пула потоков: соединение с базой у каждого потока своё"""
+    close_old_connections()
+    try:
+        return run_job(job)
+    finally:
+        close_old_connections()
@@ -0,0 +1,83 @@
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from .models import UserProfile
+from .process_pool import get_pool
+
+
+# Массовая регистрация пользователей (RegisterBulkView, команда register_users).
+# Хеширование паролей (PBKDF2) - основная работа на CPU, оно идёт в пуле процессов.
+# Вставка - пачками bulk_create в одной транзакции: либо создаются все, либо никто.
+
+
+class BulkRegistrationError(Exception):
+    """Часть пользователей не прошла проверку. errors - по одному словарю на пользователя"""
+
+    def __init__(self, errors):
+        super().__init__('Bulk registration failed')
+        self.errors = errors
+
+
+def hash_passwords(passwords):
+    """Хеши паролей в порядке входного списка"""
+    if len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+    # Крупные части заданий - меньше накладных расходов на передачу между процессами
+    return list(get_pool().map(make_password, passwords, chunksize=max(len(passwords) // 32, 1)))
+
+
+def check_usernames(entries, batch_size=1000):
+    """Повторы username во входных данных и уже занятые имена"""
+    errors = [{} for _ in entries]
+    seen = {}
+    for index, entry in enumerate(entries):
+        username = entry['username']
+        if username in seen:
+            errors[index]['username'] = [f'Повторяется (пользователь №{seen[username]})']
+        else:
+            seen[username] = index
+
+    usernames = list(seen)
+    for start in range(0, len(usernames), batch_size):
+        taken = User.objects.filter(username__in=usernames[start:start + batch_size])
+        for username in taken.values_list('username', flat=True):
+            errors[seen[username]]['username'] = ['Пользователь с таким именем уже существует']
+
+    if any(errors):
+        raise BulkRegistrationError(errors)
+
+
+def register_users(entries, batch_size=1000):
+    """Создаёт пользователей с профилями и токенами.
+
+    entries - проверенные данные (BulkUserSerializer). Возвращает
+    [{'id', 'username', 'token'}] в порядке входных данных.
+    """
+    check_usernames(entries, batch_size)
+
+    # Хешируем до начала транзакции, чтобы не держать её открытой
+    hashes = hash_passwords([entry['password'] for entry in entries])
+
+    result = []
+    with transaction.atomic():
+        for start in range(0, len(entries), batch_size):
+            chunk = entries[start:start + batch_size]
+            users = User.objects.bulk_create([
+                User(username=entry['username'], email=entry.get('email', ''), password=password)
+                for entry, password in zip(chunk, hashes[start:start + batch_size])
+            ])
+            UserProfile.objects.bulk_create([
+                UserProfile(user=user, is_admin=entry.get('is_admin', False))
+                for user, entry in zip(users, chunk)
+            ])
+            # bulk_create не вызывает Token.save(), ключ генерируем сами
+            tokens = Token.objects.bulk_create([
+                Token(user=user, key=Token.generate_key()) for user in users
+            ])
+            result += [
+                {'id': user.pk, 'username': user.username, 'token': token.key}
+                for user, token in zip(users, tokens)
+            ]
+    return result
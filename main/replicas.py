@@ -0,0 +1,137 @@
+import hashlib
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+
+# Чтение с реплик базы. Безопасные (GET/HEAD) запросы к представлениям с
+# read_from_replica = True читают с одной из DATABASE_REPLICAS, всё остальное
+# и любые записи идут в основную базу. После записи клиент (по заголовку
+# Authorization) REPLICA_STICKY_SECONDS читает только из основной базы, чтобы
+# видеть свои изменения, пока реплика отстаёт.
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_KEY_PREFIX = 'db_sticky:'
+
+
+class RequestState:
+    """Выбор базы для текущего запроса.
+
+    Реплика выбирается при первом чтении, когда представление уже известно
+    (request.resolver_match).
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.sticky_key = sticky_key(request)
+        self.wrote = False
+        self._decided = False
+        self._replica = None
+
+    @property
+    def replica(self):
+        if not self._decided and self.request.resolver_match is not None:
+            self._replica = choose_replica(self.request, self.sticky_key)
+            self._decided = True
+        return self._replica
+
+
+# Объект, а не значение: синхронный код под ASGI выполняется в копии контекста,
+# изменения атрибутов видны middleware
+_state = ContextVar('replica_state', default=None)
+
+
+def _sticky_cache():
+    return caches[settings.REPLICA_STICKY_CACHE]
+
+
+def sticky_key(request):
+    auth_header = request.META.get('HTTP_AUTHORIZATION')
+    if not auth_header:
+        return None
+    return STICKY_KEY_PREFIX + hashlib.sha256(auth_header.encode()).hexdigest()
+
+
+def choose_replica(request, key):
+    """Реплика для безопасного запроса к представлению с read_from_replica или None"""
+    if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+        return None
+    view = request.resolver_match.func
+    # У APIView флаг на классе, у асинхронных представлений (main.async_views) - на функции
+    if not getattr(getattr(view, 'view_class', view), 'read_from_replica', False):
+        return None
+    if key is not None and _sticky_cache().get(key):
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+def reading_from_replica():
+    """Читает ли текущий запрос с реплики"""
+    state = _state.get()
+    return state is not None and not state.wrote and state.replica is not None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if reading_from_replica():
+            return _state.get().replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Дальше в этом запросе и в окне после него - только основная база
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схему на реплики приносит репликация
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaMiddleware:
+    """Хранит выбор базы для запроса и запоминает клиентов, которые только что писали"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        state = RequestState(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote and state.sticky_key is not None:
+            _sticky_cache().set(state.sticky_key, True, settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        state = RequestState(request)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote and state.sticky_key is not None:
+            await _sticky_cache().aset(state.sticky_key, True, settings.REPLICA_STICKY_SECONDS)
+        return response
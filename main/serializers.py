@@ -1,5 +1,11 @@
+import re
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import transaction
 from rest_framework import serializers
+from .avatars import schedule_variants
 from .models import *
 
 
@@ -42,30 +48,88 @@ class UserSerializer(serializers.ModelSerializer):
         profile.is_admin = profile_data.get('is_admin', profile.is_admin)
         if 'photo' in profile_data:
             profile.photo = profile_data['photo']
+            # Старые копии относятся к прежнему фото, до готовности новых отдаётся оригинал
+            profile.photo_variants = {}
         profile.save()
 
+        if profile_data.get('photo'):
+            name = profile.photo.name
+            transaction.on_commit(lambda: schedule_variants(instance.pk, name))
+
         return instance
 
+    def validate_photo(self, value):
+        if value and value.size > settings.AVATAR_MAX_UPLOAD_SIZE:
+            raise serializers.ValidationError(f"Фото больше {settings.AVATAR_MAX_UPLOAD_SIZE} байт")
+        return value
+
+
+class BulkUserSerializer(serializers.Serializer):
+    """Пользователь для массовой регистрации (уникальность username проверяется пачкой)"""
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    email = serializers.EmailField(required=False, allow_blank=True, default='')
+    password = serializers.CharField(write_only=True)
+    is_admin = serializers.BooleanField(required=False, default=False)
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """Сериализатор, которому можно передать подмножество полей (fields=...)"""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
-class MeetingSerializer(serializers.ModelSerializer):
+
+class MeetingSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Meeting
         fields = ['id', 'registration_link', 'date', 'admin']
 
-class AgendaItemSerializer(serializers.ModelSerializer):
+class AgendaItemSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = AgendaItem
-        fields = ['id', 'meeting', 'title', 'description', 'materials', 'meeting_type', 'summary_datetime']
+        fields = ['id', 'meeting', 'title', 'description', 'materials', 'meeting_type', 'summary_datetime', 'closed_at']
+        read_only_fields = ['closed_at']
 
 class VoteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Vote
-        fields = ['id', 'agenda_item', 'user', 'vote', 'timestamp', 'signed_vote']
-        read_only_fields = ['user', 'timestamp']
+        fields = [
+            'id', 'agenda_item', 'user', 'vote', 'timestamp', 'signed_vote', 'signature_status', 'signature_signer',
+        ]
+        read_only_fields = ['user', 'timestamp', 'signature_status', 'signature_signer']
 
     def create(self, validated_data):
         # Привязываем голос к пользователю, переданному в save()
         user = validated_data.pop('user', None)
         if not user:
             raise serializers.ValidationError("User is required")
-        return Vote.objects.create(user=user, **validated_data)
\ No newline at end of file
+        return Vote.objects.create(user=user, **validated_data)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Загрузка файла частями. offset - сколько байт уже получено"""
+    offset = serializers.IntegerField(source='received', read_only=True)
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'target', 'agenda_item', 'filename', 'size', 'sha256', 'offset', 'chunk_size', 'expires_at']
+        read_only_fields = ['expires_at']
+
+    def get_chunk_size(self, obj):
+        return settings.UPLOAD_CHUNK_MAX_SIZE
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Размер файла - от 1 до {settings.UPLOAD_MAX_SIZE} байт")
+        return value
+
+    def validate_sha256(self, value):
+        if value and not re.fullmatch(r'[0-9a-fA-F]{64}', value):
+            raise serializers.ValidationError("Ожидается SHA-256 в шестнадцатеричном виде")
+        return value
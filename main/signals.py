@@ -0,0 +1,136 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token, invalidate_user_tokens
+from .blobs import FILE_FIELDS, add_reference, release_reference
+from .models import AgendaItem, Meeting, UserMeetings, UserProfile, Vote, VoteTally
+from .protocol import bump_protocol_version
+from .signatures import signed_vote_changed
+from .tallies import remove_vote, vote_saved
+from .versions import bump_version, meeting_version_key, user_version_key
+
+
+# Инвалидация кэша токенов
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def user_changed(sender, instance, created=False, **kwargs):
+    if created:
+        # У нового пользователя ещё нет закэшированных токенов
+        return
+    user_id = instance.pk if sender is User else instance.user_id
+    invalidate_user_tokens(user_id)
+
+
+# Версия сохранённых протоколов - VoteTally.version. Голоса увеличивают её
+# вместе с итогами (main.tallies), проверка подписи - в main.signatures,
+# изменение самого вопроса - здесь, в той же транзакции
+
+@receiver(post_save, sender=AgendaItem)
+def agenda_item_changed(sender, instance, created=False, **kwargs):
+    if created:
+        # Итоги создаются вместе с вопросом, чтобы первый голос
+        # обходился одним UPDATE (см. tallies.apply_delta)
+        VoteTally.objects.create(agenda_item=instance)
+    else:
+        bump_protocol_version(instance.pk)
+
+
+# Итоги голосования (main.tallies): голоса из представлений учитывает
+# apply_vote, сохранённые иначе (в админке, shell) и удалённые (в том числе
+# вместе с пользователем) - эти сигналы. Вместе с итогами растёт и версия
+# протоколов
+
+@receiver(post_init, sender=Vote)
+def remember_choice(sender, instance, **kwargs):
+    # Отложенное поле (only/defer) не загружаем
+    instance._stored_choice = instance.__dict__.get('vote')
+
+
+@receiver(post_save, sender=Vote)
+def vote_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    if update_fields is not None and 'vote' not in update_fields:
+        return
+    vote_saved(instance, created, instance._stored_choice)
+    instance._stored_choice = instance.vote
+
+
+@receiver(post_delete, sender=Vote)
+def vote_deleted(sender, instance, **kwargs):
+    remove_vote(instance)
+
+
+# Версии данных для ETag (main.etags)
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_save, sender=UserMeetings)
+@receiver(post_delete, sender=UserMeetings)
+def user_data_changed(sender, instance, **kwargs):
+    user_id = instance.pk if sender is User else instance.user_id
+    transaction.on_commit(lambda: bump_version(user_version_key(user_id)))
+
+
+@receiver(post_save, sender=Meeting)
+@receiver(post_delete, sender=Meeting)
+@receiver(post_save, sender=AgendaItem)
+@receiver(post_delete, sender=AgendaItem)
+def meeting_data_changed(sender, instance, **kwargs):
+    meeting_id = instance.pk if sender is Meeting else instance.meeting_id
+    transaction.on_commit(lambda: bump_version(meeting_version_key(meeting_id)))
+
+
+# Ссылки на файлы хранилища по содержимому (main.blobs) и проверка подписи
+# нового опросного листа (main.signatures). Имя файла в базе запоминается
+# при загрузке объекта, поэтому сохранение без смены файла не делает
+# лишних запросов
+
+def _file_name(instance, field):
+    # Отложенное поле (only/defer) не загружаем
+    value = instance.__dict__.get(field)
+    return getattr(value, 'name', value) or ''
+
+
+@receiver(post_init, sender=AgendaItem)
+@receiver(post_init, sender=Vote)
+@receiver(post_init, sender=UserProfile)
+def remember_file(sender, instance, **kwargs):
+    instance._stored_file = _file_name(instance, FILE_FIELDS[sender])
+
+
+@receiver(post_save, sender=AgendaItem)
+@receiver(post_save, sender=Vote)
+@receiver(post_save, sender=UserProfile)
+def file_saved(sender, instance, created=False, update_fields=None, **kwargs):
+    field = FILE_FIELDS[sender]
+    if update_fields is not None and field not in update_fields:
+        return
+    # У нового объекта в базе ещё не было файла, даже если имя передано в конструктор
+    stored = '' if created else instance._stored_file
+    name = _file_name(instance, field)
+    if name != stored:
+        if name:
+            add_reference(name)
+        if stored:
+            release_reference(stored)
+        if sender is Vote:
+            signed_vote_changed(instance)
+    instance._stored_file = name
+
+
+@receiver(post_delete, sender=AgendaItem)
+@receiver(post_delete, sender=Vote)
+@receiver(post_delete, sender=UserProfile)
+def file_released(sender, instance, **kwargs):
+    if instance._stored_file:
+        release_reference(instance._stored_file)
@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import mmap
+import os
+import re
+import subprocess
+import tempfile
+from collections import namedtuple
+from functools import partial
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .models import SignatureCheck, Vote
+from .process_pool import add_result_callback, get_pool
+from .protocol import bump_protocol_version
+from .storage import is_blob
+
+
+logger = logging.getLogger(__name__)
+
+
+# Проверка электронной подписи на подписанных опросных листах (Vote.signed_vote).
+# Поддерживаются CMS/PKCS#7 с вложенным документом (.p7s, .sig, DER или PEM)
+# и PDF со встроенной подписью (открепленная CMS по /ByteRange). Проверяет
+# openssl cms в пуле процессов, голос при этом сохраняется сразу со статусом
+# pending. Результат кэшируется по SHA-256 файла (SignatureCheck): повторно
+# загруженный лист не проверяется заново. Для ГОСТ-подписей SIGNATURE_OPENSSL
+# должен указывать на openssl с ГОСТ-движком.
+
+HASH_READ_SIZE = 1024 * 1024
+BYTE_RANGE_RE = re.compile(rb'/ByteRange\s*\[\s*(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s*\]')
+
+
+# status - valid, invalid или error (проверить не удалось), signer - субъект сертификата подписанта
+SignatureResult = namedtuple('SignatureResult', ['status', 'signer', 'detail'], defaults=['', ''])
+
+
+def file_digest(name):
+    """SHA-256 файла. У файлов хранилища по содержимому он уже в имени"""
+    if is_blob(name):
+        return os.path.splitext(os.path.basename(name))[0]
+    digest = hashlib.sha256()
+    with default_storage.open(name, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _openssl(*args):
+    return subprocess.run(
+        [settings.SIGNATURE_OPENSSL, *args],
+        capture_output=True, timeout=settings.SIGNATURE_VERIFY_TIMEOUT,
+    )
+
+
+def _der_length(data):
+    """Длина DER-структуры в начале data (подпись в PDF дополнена нулями)"""
+    if len(data) < 2:
+        return len(data)
+    if data[1] < 0x80:
+        return 2 + data[1]
+    count = data[1] & 0x7f
+    return 2 + count + int.from_bytes(data[2:2 + count], 'big')
+
+
+def _verify_cms(signature_path, content_path=None):
+    with open(signature_path, 'rb') as f:
+        inform = 'PEM' if f.read(10).startswith(b'-----BEGIN') else 'DER'
+
+    with tempfile.TemporaryDirectory() as directory:
+        signer_path = os.path.join(directory, 'signer.pem')
+        args = [
+            'cms', '-verify', '-binary', '-inform', inform, '-in', signature_path,
+            '-CAfile', settings.SIGNATURE_CA_FILE, '-purpose', 'any',
+            '-signer', signer_path, '-out', os.devnull,
+        ]
+        if content_path is not None:
+            args += ['-content', content_path]
+
+        result = _openssl(*args)
+        if result.returncode != 0:
+            return SignatureResult('invalid', detail=result.stderr.decode(errors='replace').strip()[:1000])
+
+        subject = _openssl('x509', '-in', signer_path, '-noout', '-subject', '-nameopt', 'RFC2253,-esc_msb')
+        signer = subject.stdout.decode(errors='replace').strip().removeprefix('subject=')
+    return SignatureResult('valid', signer=signer[:255])
+
+
+def _verify_pdf(data):
+    """Подпись PDF: открепленная CMS над байтами /ByteRange, сама CMS - в /Contents"""
+    matches = list(BYTE_RANGE_RE.finditer(data))
+    if not matches:
+        return SignatureResult('invalid', detail='В PDF нет электронной подписи')
+    # Последняя подпись должна покрывать весь документ: с начала файла до конца,
+    # кроме /Contents. Иначе в непокрытые байты (например, дописанные после
+    # подписи) можно вставить любое содержимое
+    start1, length1, start2, length2 = (int(value) for value in matches[-1].groups())
+    if start1 != 0 or start1 + length1 > start2 or start2 + length2 != len(data):
+        return SignatureResult('invalid', detail='Подпись покрывает не весь документ (/ByteRange)')
+
+    contents = bytes(data[start1 + length1:start2]).strip().strip(b'<>')
+    try:
+        signature = bytes.fromhex(contents.decode('ascii'))
+    except ValueError:
+        return SignatureResult('invalid', detail='Некорректный /Contents')
+    signature = signature[:_der_length(signature)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        signature_path = os.path.join(directory, 'signature.der')
+        content_path = os.path.join(directory, 'content')
+        with open(signature_path, 'wb') as f:
+            f.write(signature)
+        with open(content_path, 'wb') as f:
+            f.write(data[start1:start1 + length1])
+            f.write(data[start2:start2 + length2])
+        return _verify_cms(signature_path, content_path)
+
+
+def verify_file(name):
+    """Проверяет подпись файла name (в процессе пула). Возвращает SignatureResult"""
+    if not settings.SIGNATURE_CA_FILE:
+        return SignatureResult('error', detail='Не задан SIGNATURE_CA_FILE')
+
+    path = default_storage.path(name)
+    try:
+        with open(path, 'rb') as f:
+            if f.read(5) == b'%PDF-':
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return _verify_pdf(data)
+        return _verify_cms(path)
+    except (OSError, subprocess.SubprocessError) as exc:
+        # openssl не найден, завис и т.п. - результат не кэшируется
+        return SignatureResult('error', detail=str(exc)[:1000])
+
+
+def store_result(vote, name, result, digest=None):
+    """Записывает результат проверки в голос, если лист за это время не заменили"""
+    if digest is not None and result.status in ('valid', 'invalid'):
+        SignatureCheck.objects.update_or_create(digest=digest, defaults={
+            'status': result.status, 'signer': result.signer, 'detail': result.detail,
+        })
+
+    updated = Vote.objects.filter(pk=vote.pk, signed_vote=name).update(
+        signature_status=result.status, signature_signer=result.signer
+    )
+    if updated:
+        # Статус подписи есть в протоколе
+        bump_protocol_version(vote.agenda_item_id)
+    return bool(updated)
+
+
+def _verified(vote, name, digest, future):
+    # Выполняется в потоке обработки результатов (main.process_pool.add_result_callback)
+    try:
+        store_result(vote, name, future.result(), digest)
+    except Exception:
+        logger.exception('Не удалось проверить подпись %s', name)
+
+
+def check_vote_signature(vote, name):
+    """Результат из кэша по SHA-256 файла или проверка в пуле процессов"""
+    digest = file_digest(name)
+    cached = SignatureCheck.objects.filter(digest=digest).first()
+    if cached is not None:
+        store_result(vote, name, SignatureResult(cached.status, cached.signer, cached.detail))
+        return
+
+    future = get_pool().submit(verify_file, name)
+    add_result_callback(future, partial(_verified, vote, name, digest))
+
+
+def signed_vote_changed(vote):
+    """Новый опросный лист: статус pending, проверка после фиксации транзакции"""
+    name = vote.signed_vote.name if vote.signed_vote else ''
+    vote.signature_status = 'pending' if name else ''
+    vote.signature_signer = ''
+    Vote.objects.filter(pk=vote.pk).update(signature_status=vote.signature_status, signature_signer='')
+    # Статус подписи есть в протоколе
+    bump_protocol_version(vote.agenda_item_id)
+    if name:
+        transaction.on_commit(lambda: check_vote_signature(vote, name))
@@ -0,0 +1,81 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+# Хранилище по содержимому: файл сохраняется под SHA-256 своего содержимого,
+# поэтому одинаковые материалы, опросные листы и фото хранятся один раз.
+# Ссылки на файлы считаются в модели Blob (main.blobs), неиспользуемые файлы
+# удаляет команда gc_blobs.
+
+BLOB_PREFIX = 'blobs'
+HASH_READ_SIZE = 1024 * 1024
+MAX_EXTENSION_LENGTH = 10
+
+
+def content_sha256(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks(HASH_READ_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(digest, filename):
+    """blobs/ab/abcdef....pdf - расширение исходного файла сохраняется для Content-Type"""
+    extension = os.path.splitext(filename)[1].lower()
+    if len(extension) > MAX_EXTENSION_LENGTH or not extension[1:].isalnum():
+        extension = ''
+    return f'{BLOB_PREFIX}/{digest[:2]}/{digest}{extension}'
+
+
+def is_blob(name):
+    return name.startswith(f'{BLOB_PREFIX}/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, в котором имя файла - хеш его содержимого.
+
+    Если у содержимого есть готовый атрибут sha256 (загрузка частями,
+    main.uploads), файл повторно не читается.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # Файл с тем же именем - это то же содержимое, перезапись безопасна
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(*args, **kwargs)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        digest = getattr(content, 'sha256', None) or content_sha256(content)
+        name = blob_name(digest, name)
+        if self.exists(name):
+            # Время изменения - признак использования для gc_blobs
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+    def _save(self, name, content):
+        if hasattr(content, 'temporary_file_path'):
+            # Перенос файла (os.rename) атомарен
+            return super()._save(name, content)
+
+        # Пишем во временный файл рядом и переименовываем: параллельно читающий
+        # или сохраняющий то же содержимое не увидит файл записанным наполовину
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, prefix='.', suffix='.tmp', delete=False) as output:
+            for chunk in content.chunks():
+                output.write(chunk)
+        os.replace(output.name, full_path)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return name
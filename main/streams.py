@@ -0,0 +1,143 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.authtoken.models import Token
+
+from .authentication import get_token
+from .events import agenda_item_channel, format_event, get_broker, meeting_channel
+from .models import AgendaItem, Meeting, UserMeetings, VoteTally
+
+
+# Потоки итогов голосования (Server-Sent Events).
+# Работают под ASGI (meeting/asgi.py): ожидающее соединение - это корутина
+# с очередью в памяти, поток-обработчик не занимается. Соединение с базой
+# закрывается после каждого чтения итогов: иначе каждый подписчик держал бы
+# своё соединение, пока не отключится.
+
+
+async def _authenticate(request):
+    """Пользователь по токену из заголовка Authorization или параметра ?token=
+
+    EventSource в браузере не умеет передавать заголовки, поэтому токен
+    можно передать в строке запроса.
+    """
+    parts = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(parts) == 2 and parts[0].lower() == 'token':
+        key = parts[1]
+    else:
+        key = request.GET.get('token')
+
+    if not key:
+        return None
+
+    try:
+        token = await sync_to_async(get_token)(key)
+    except Token.DoesNotExist:
+        return None
+
+    return token.user if token.user.is_active else None
+
+
+async def _has_access(user, meeting_id):
+    """Администратор или участник конференции"""
+    profile = getattr(user, 'profile', None)
+    if profile is not None and profile.is_admin:
+        return True
+    return await UserMeetings.objects.filter(user=user, meeting_id=meeting_id).aexists()
+
+
+@sync_to_async
+def _tallies(**filters):
+    """Текущие итоги; соединение закрывается в том же потоке, где открыто"""
+    try:
+        return list(VoteTally.objects.filter(**filters).values(
+            'agenda_item_id', 'yes', 'no', 'abstain', 'total', 'version'
+        ))
+    finally:
+        connection.close()
+
+
+def _versions(tallies):
+    return {row['agenda_item_id']: row['version'] for row in tallies}
+
+
+async def _event_stream(channel, **snapshot_filters):
+    """Сначала текущие итоги (snapshot), затем изменения (tally) по мере голосования"""
+    heartbeat = getattr(settings, 'VOTE_EVENTS_HEARTBEAT', 25)
+
+    # Подписываемся до чтения итогов, чтобы не пропустить голоса между ними.
+    # Изменения, которые пришли в очередь, но уже учтены в итогах (их версия
+    # не больше версии в snapshot), пропускаются - иначе голос посчитается дважды
+    async with get_broker().subscribe(channel) as subscription:
+        tallies = await _tallies(**snapshot_filters)
+        versions = _versions(tallies)
+        yield format_event('snapshot', tallies)
+
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.get(), heartbeat)
+            except asyncio.TimeoutError:
+                # Комментарий SSE держит соединение открытым через прокси
+                yield ': ping\n\n'
+                continue
+
+            if subscription.lagged:
+                # Клиент отстал и часть изменений потеряна - отправляем итоги заново
+                subscription.lagged = False
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                tallies = await _tallies(**snapshot_filters)
+                versions = _versions(tallies)
+                yield format_event('snapshot', tallies)
+                continue
+
+            if message['version'] <= versions.get(message['agenda_item'], 0):
+                continue
+            yield format_event('tally', message)
+
+
+def _stream_response(stream):
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Отключаем буферизацию ответа в nginx
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def agenda_item_stream(request, agenda_item_id):
+    """Поток итогов голосования по вопросу"""
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse({"error": "Invalid token"}, status=401)
+
+    try:
+        agenda_item = await AgendaItem.objects.aget(pk=agenda_item_id)
+    except AgendaItem.DoesNotExist:
+        return JsonResponse({"error": "Вопрос не найден"}, status=404)
+
+    if not await _has_access(user, agenda_item.meeting_id):
+        return JsonResponse({"error": "Forbidden"}, status=403)
+
+    return _stream_response(_event_stream(
+        agenda_item_channel(agenda_item.id), agenda_item_id=agenda_item.id
+    ))
+
+
+async def meeting_stream(request, meeting_id):
+    """Поток итогов голосования по всем вопросам конференции"""
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse({"error": "Invalid token"}, status=401)
+
+    if not await Meeting.objects.filter(pk=meeting_id).aexists():
+        return JsonResponse({"error": "Meeting not found"}, status=404)
+
+    if not await _has_access(user, meeting_id):
+        return JsonResponse({"error": "Forbidden"}, status=403)
+
+    return _stream_response(_event_stream(
+        meeting_channel(meeting_id), agenda_item__meeting_id=meeting_id
+    ))
@@ -0,0 +1,145 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .events import publish_tally_delta
+from .models import AgendaItem, Vote, VoteTally
+
+
+CHOICES = ('yes', 'no', 'abstain')
+
+# Голоса, которые сохраняет код, сам вызывающий apply_vote (представления).
+# Остальные сохранения (админка, shell, миграции данных) учитывает vote_saved
+_counted_by_caller = ContextVar('counted_by_caller', default=False)
+
+
+def vote_delta(new_choice, old_choice=None):
+    """Изменение счётчиков итогов при новом или изменённом голосе"""
+    delta = {new_choice: 1}
+    if old_choice is None:
+        delta['total'] = 1
+    else:
+        delta[old_choice] = -1
+    return delta
+
+
+def apply_vote(agenda_item, new_choice, old_choice=None):
+    """Обновляет итоги по вопросу одним UPDATE с F()-выражениями.
+
+    Для нового голоса old_choice не передаётся, при смене голоса
+    счётчик старого варианта уменьшается, а общий итог не меняется.
+    Вызывать внутри той же транзакции, что и запись голоса: после её
+    фиксации изменение публикуется подписчикам потока итогов.
+    """
+    if new_choice == old_choice:
+        return
+
+    delta = vote_delta(new_choice, old_choice)
+    version = apply_delta(agenda_item.id, delta)
+    transaction.on_commit(
+        lambda: publish_tally_delta(agenda_item.id, agenda_item.meeting_id, delta, version)
+    )
+
+
+def _changes(delta):
+    return {
+        **{field: F(field) + value for field, value in delta.items()},
+        'version': F('version') + 1,
+    }
+
+
+def apply_delta(agenda_item_id, delta):
+    """Прибавляет delta к счётчикам итогов по вопросу. Возвращает новую версию итогов"""
+    tallies = VoteTally.objects.filter(agenda_item_id=agenda_item_id)
+    if not tallies.update(**_changes(delta)):
+        # Строки итогов нет (вопрос создан до появления VoteTally)
+        VoteTally.objects.get_or_create(agenda_item_id=agenda_item_id)
+        tallies.update(**_changes(delta))
+    # Строка заблокирована обновлением до конца транзакции, версия не изменится
+    return tallies.values_list('version', flat=True).get()
+
+
+@contextmanager
+def counted_by_caller():
+    """Голоса, сохранённые внутри блока, вызывающий код учтёт в итогах сам"""
+    token = _counted_by_caller.set(True)
+    try:
+        yield
+    finally:
+        _counted_by_caller.reset(token)
+
+
+def vote_saved(vote, created, old_choice):
+    """Учитывает голос, сохранённый в обход apply_vote (сигнал post_save)"""
+    if _counted_by_caller.get() or (not created and vote.vote == old_choice):
+        return
+    apply_vote(vote.agenda_item, vote.vote, None if created else old_choice)
+
+
+def remove_vote(vote):
+    """Убирает удалённый голос из итогов (сигнал post_delete)"""
+    delta = {vote.vote: -1, 'total': -1}
+    # Строку итогов не создаём: при удалении вопроса она удаляется вместе с голосами
+    tallies = VoteTally.objects.filter(agenda_item_id=vote.agenda_item_id)
+    if not tallies.update(**_changes(delta)):
+        return
+    version = tallies.values_list('version', flat=True).get()
+
+    def publish():
+        meeting_id = AgendaItem.objects.filter(pk=vote.agenda_item_id).values_list('meeting_id', flat=True).first()
+        if meeting_id is not None:
+            publish_tally_delta(vote.agenda_item_id, meeting_id, delta, version)
+    transaction.on_commit(publish)
+
+
+def get_tally(agenda_item):
+    """Итоги по вопросу (пустые, если голосов ещё не было)"""
+    try:
+        return agenda_item.tally
+    except VoteTally.DoesNotExist:
+        return VoteTally(agenda_item=agenda_item)
+
+
+def count_tallies(votes):
+    """Агрегирует голоса по вопросам одним сгруппированным запросом"""
+    return votes.values('agenda_item_id').annotate(
+        yes=Count('id', filter=Q(vote='yes')),
+        no=Count('id', filter=Q(vote='no')),
+        abstain=Count('id', filter=Q(vote='abstain')),
+        total=Count('id'),
+    )
+
+
+def rebuild_tallies(agenda_item_ids=None, batch_size=1000):
+    """Пересчитывает итоги по таблице Vote. Возвращает число вопросов"""
+    agenda_items = AgendaItem.objects.all()
+    votes = Vote.objects.all()
+    if agenda_item_ids is not None:
+        agenda_items = agenda_items.filter(pk__in=agenda_item_ids)
+        votes = votes.filter(agenda_item_id__in=agenda_item_ids)
+
+    counts = {row['agenda_item_id']: row for row in count_tallies(votes)}
+
+    tallies = []
+    for agenda_item_id in agenda_items.values_list('pk', flat=True).iterator():
+        row = counts.get(agenda_item_id, {})
+        tallies.append(VoteTally(
+            agenda_item_id=agenda_item_id,
+            yes=row.get('yes', 0),
+            no=row.get('no', 0),
+            abstain=row.get('abstain', 0),
+            total=row.get('total', 0),
+        ))
+
+    VoteTally.objects.bulk_create(
+        tallies,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['agenda_item'],
+        update_fields=['yes', 'no', 'abstain', 'total'],
+    )
+    # Счётчики могли измениться: отправленные потокам итоги устарели
+    VoteTally.objects.filter(agenda_item__in=agenda_items).update(version=F('version') + 1)
+    return len(tallies)
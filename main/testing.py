@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Server(ThreadingHTTPServer):
+    # Очередь соединений больше стандартной (5): одновременные запросы
+    # не ждут повторной попытки соединения
+    request_queue_size = 128
+
+
+class FakeRoomServer:
+    """Локальная замена внешнего сервиса комнат для тестов.
+
+    Первые `failures` запросов получают ответ `failure_status` (None - сервер
+    читает запрос и закрывает соединение без ответа), каждый ответ можно
+    задержать на `delay` секунд. Использование:
+
+        with FakeRoomServer() as server:
+            with override_settings(ROOM_SERVICE_URL=server.url):
+                ...
+    """
+
+    def __init__(self, failures=0, delay=0, failure_status=500):
+        self.failures = failures
+        self.failure_status = failure_status
+        self.delay = delay
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}/api/create-room'
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+
+                with fake._lock:
+                    fake.requests.append(payload)
+                    failed = len(fake.requests) <= fake.failures
+
+                if fake.delay:
+                    time.sleep(fake.delay)
+
+                if failed and fake.failure_status is None:
+                    self.close_connection = True
+                elif failed:
+                    self._reply(fake.failure_status, {'error': 'unavailable'})
+                else:
+                    self._reply(200, {'uri': f'https://rooms.test/{payload.get("name")}'})
+
+            def _reply(self, code, data):
+                body = json.dumps(data).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,3 +1,1973 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+import requests
+from asgiref.sync import async_to_sync, sync_to_async
+from PIL import Image
+
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.servers.basehttp import WSGIServer
+from django.db import connection, connections
+from django.db.models import Count
+from django.db.models.functions import Lower
+from django.test import AsyncClient, LiveServerTestCase, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.testcases import LiveServerThread, QuietWSGIRequestHandler
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .avatars import remove_stale_variants, render_variants, store_variants, variant_storage
+from .blobs import collect_garbage
+from .checks import check_replica_caches
+from .deadlines import DeadlineQueue, finalize_agenda_items
+from .enrollment import enroll_participants
+from .events import agenda_item_channel, format_event, get_broker
+from .files import parse_range
+from .http_client import AsyncHttpClient, CircuitOpenError, HttpClient
+from .metrics import registry, timer
+from .models import *
+from .process_pool import add_result_callback
+from .protocol import get_participants, get_protocol, protocol_name, protocol_storage, render_protocol
+from .provisioning import claim_jobs, run_job
+from .serializers import AgendaItemSerializer
+from .signatures import verify_file
+from .streams import _event_stream
+from .versions import get_version, user_version_key
+from .views import create_vote, update_vote, upsert_vote
+from .testing import FakeRoomServer
+from .uploads import UploadError, file_sha256, partial_path, write_chunk
+
+
+def create_user(username, is_admin=False):
+    user = User.objects.create_user(username=username, email=f'{username}@example.com', password='password')
+    UserProfile.objects.create(user=user, is_admin=is_admin)
+    return user
+
+
+def create_meeting(admin, name_room='board', **fields):
+    fields.setdefault('date', timezone.now())
+    return Meeting.objects.create(
+        registration_link=f'https://rooms.test/{name_room}', name_room=name_room, admin=admin, **fields
+    )
+
+
+def create_agenda_item(meeting, title='Вопрос', **fields):
+    """Вопрос с голосованием, по умолчанию открытый ещё сутки"""
+    fields.setdefault('summary_datetime', timezone.now() + timedelta(days=1))
+    return AgendaItem.objects.create(
+        meeting=meeting, title=title, description='Проект решения', meeting_type='vote', **fields
+    )
+
+
+def current_protocol_name(agenda_item_id, user_id):
+    """Имя протокола по текущей версии итогов в базе"""
+    return protocol_name(AgendaItem.objects.select_related('tally').get(pk=agenda_item_id), user_id)
+
+
+def clear_protocols():
+    """Удаляет протоколы прошлых тестов: после отката их транзакций id вопросов
+    и версии итогов повторяются, и под тем же именем лежал бы чужой файл
+    """
+    shutil.rmtree(settings.PROTOCOL_ROOT, ignore_errors=True)
+
+
+def api_client(user):
+    client = APIClient()
+    client.token = Token.objects.create(user=user).key
+    client.credentials(HTTP_AUTHORIZATION=f'Token {client.token}')
+    return client
+
+
+class ClearCacheMixin:
+    """Кэш (токены, версии данных) не откатывается вместе с транзакцией теста:
+    каждый тест начинает с пустого
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+class TokenCacheTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('member')
+        self.client = api_client(self.user)
+
+    def test_deleted_token_is_rejected(self):
+        self.assertEqual(self.client.get('/api/profile/').status_code, 200)
+
+        Token.objects.filter(key=self.client.token).delete()
+
+        self.assertEqual(self.client.get('/api/profile/').status_code, 401)
+
+    def test_profile_change_is_visible(self):
+        self.assertFalse(self.client.get('/api/profile/').data['is_admin'])
+
+        profile = UserProfile.objects.get(user=self.user)
+        profile.is_admin = True
+        profile.save()
+
+        self.assertTrue(self.client.get('/api/profile/').data['is_admin'])
+
+    def test_new_user_skips_invalidation(self):
+        with patch('main.signals.invalidate_user_tokens') as invalidate:
+            user = create_user('newcomer')
+            invalidate.assert_not_called()
+
+            user.save()
+        invalidate.assert_called_once_with(user.pk)
+
+
+class ProtocolCacheTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        clear_protocols()
+        self.admin = create_user('admin', is_admin=True)
+        meeting = create_meeting(self.admin)
+        self.agenda_item = create_agenda_item(meeting)
+        self.client = api_client(self.admin)
+        self.url = f'/api/generate-protocol/{self.agenda_item.pk}/'
+
+    def get_protocol(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        return response['ETag']
+
+    def test_vote_invalidates_protocol(self):
+        with patch('main.protocol.render_protocol', wraps=render_protocol) as render:
+            etag = self.get_protocol()
+            # Повторный запрос - сохранённый файл
+            self.assertEqual(self.get_protocol(), etag)
+            self.assertEqual(render.call_count, 1)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                response = api_client(create_user('member')).post('/api/vote_create/', {
+                    'agenda_item': self.agenda_item.pk, 'vote': 'yes',
+                }, format='json')
+            self.assertEqual(response.status_code, 201)
+
+            self.assertNotEqual(self.get_protocol(), etag)
+            self.assertEqual(render.call_count, 2)
+        self.assertEqual(render.call_args.args[1].yes, 1)
+
+
+class VoteTallyTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        admin = create_user('admin', is_admin=True)
+        meeting = create_meeting(admin)
+        self.agenda_item = create_agenda_item(meeting)
+        self.voters = [create_user(f'voter{number}') for number in range(3)]
+        for voter in self.voters:
+            create_vote(voter, self.agenda_item, {'agenda_item': self.agenda_item.pk, 'vote': 'yes'})
+
+    def assertTally(self, yes, no, abstain):
+        tally = VoteTally.objects.get(agenda_item=self.agenda_item)
+        self.assertEqual((tally.yes, tally.no, tally.abstain, tally.total), (yes, no, abstain, yes + no + abstain))
+
+    def test_change_uses_current_choice(self):
+        vote = Vote.objects.get(user=self.voters[0])
+        # Параллельный запрос успел сменить голос после того, как vote был прочитан
+        update_vote(self.voters[0], self.agenda_item, Vote.objects.get(pk=vote.pk), {'vote': 'no'})
+        self.assertTally(2, 1, 0)
+
+        body, status_code = update_vote(self.voters[0], self.agenda_item, vote, {'vote': 'abstain'})
+
+        self.assertEqual(status_code, 201)
+        self.assertTally(2, 0, 1)
+
+    def test_deleted_votes_are_subtracted(self):
+        Vote.objects.get(user=self.voters[0]).delete()
+        self.assertTally(2, 0, 0)
+
+        # Голоса удаляются вместе с пользователем
+        self.voters[1].delete()
+        self.assertTally(1, 0, 0)
+
+        self.agenda_item.delete()
+        self.assertFalse(VoteTally.objects.exists())
+
+    def test_upsert_counts_first_vote_once(self):
+        user = create_user('late')
+        name = current_protocol_name(self.agenda_item.pk, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            body, code = upsert_vote(user, self.agenda_item, {'agenda_item': self.agenda_item.pk, 'vote': 'no'})
+        self.assertEqual(code, 201)
+        # Голос уже есть: вставка не проходит, голос переносится на новый вариант
+        with self.captureOnCommitCallbacks(execute=True):
+            body, code = upsert_vote(user, self.agenda_item, {'agenda_item': self.agenda_item.pk, 'vote': 'abstain'})
+        self.assertEqual((code, body['vote']), (200, 'abstain'))
+
+        self.assertTally(3, 0, 1)
+        self.assertNotEqual(current_protocol_name(self.agenda_item.pk, 1), name)
+
+    def test_votes_saved_outside_views_are_counted(self):
+        # Голоса, изменённые в админке или shell, тоже меняют итоги и протокол
+        name = current_protocol_name(self.agenda_item.pk, 1)
+        vote = Vote.objects.get(user=self.voters[0])
+        vote.vote = 'no'
+        vote.save()
+        self.assertTally(2, 1, 0)
+        self.assertNotEqual(current_protocol_name(self.agenda_item.pk, 1), name)
+
+        Vote.objects.create(agenda_item=self.agenda_item, user=create_user('late'), vote='abstain')
+        self.assertTally(2, 1, 1)
+
+        # Сохранение без смены варианта итоги не меняет
+        name = current_protocol_name(self.agenda_item.pk, 1)
+        vote.save()
+        Vote.objects.get(pk=vote.pk).save()
+        self.assertTally(2, 1, 1)
+        self.assertEqual(current_protocol_name(self.agenda_item.pk, 1), name)
+
+
+class TallyStreamTests(SimpleTestCase):
+    def test_deltas_counted_in_snapshot_are_skipped(self):
+        channel = agenda_item_channel(1)
+
+        def message(version):
+            return {'agenda_item': 1, 'meeting': 1, 'delta': {'yes': 1, 'total': 1}, 'version': version}
+
+        async def tallies(**filters):
+            # Голос зафиксирован и опубликован после подписки, но до чтения итогов
+            get_broker().publish(channel, message(5))
+            return [{'agenda_item_id': 1, 'yes': 5, 'no': 0, 'abstain': 0, 'total': 5, 'version': 5}]
+
+        async def read():
+            stream = _event_stream(channel, agenda_item_id=1)
+            try:
+                snapshot = await anext(stream)
+                get_broker().publish(channel, message(6))
+                return snapshot, await anext(stream)
+            finally:
+                await stream.aclose()
+
+        with patch('main.streams._tallies', tallies):
+            snapshot, event = asyncio.run(read())
+
+        self.assertIn('"yes": 5', snapshot)
+        self.assertEqual(event, format_event('tally', message(6)))
+
+
+class TallyStreamConnectionTests(TransactionTestCase):
+    # Итоги читаются в потоке sync_to_async, а не в потоке теста
+    def setUp(self):
+        meeting = create_meeting(create_user('admin', is_admin=True))
+        self.agenda_item = create_agenda_item(meeting, 'Бюджет')
+
+    @override_settings(VOTE_EVENTS_QUEUE_SIZE=1)
+    def test_connection_is_closed_while_stream_is_idle(self):
+        channel = agenda_item_channel(self.agenda_item.pk)
+        message = {'agenda_item': self.agenda_item.pk, 'meeting': 1, 'delta': {'yes': 1, 'total': 1}, 'version': 1}
+        # Закрытие соединения с базой в памяти sqlite игнорирует, поэтому
+        # проверяем, в каком потоке и сколько раз оно вызвано
+        wrapper_class = type(connections['default'])
+        close = wrapper_class.close
+        closed_in = []
+
+        def spy(self):
+            closed_in.append(threading.get_ident())
+            close(self)
+
+        async def read():
+            stream = _event_stream(channel, agenda_item_id=self.agenda_item.pk)
+            try:
+                events = [await anext(stream)]
+                closes = [len(closed_in)]
+                # Очередь переполнена - итоги отправляются заново
+                get_broker().publish(channel, message)
+                get_broker().publish(channel, message)
+                events.append(await anext(stream))
+                closes.append(len(closed_in))
+                return events, closes, await sync_to_async(threading.get_ident)()
+            finally:
+                await stream.aclose()
+
+        with patch.object(wrapper_class, 'close', spy):
+            events, closes, orm_thread = asyncio.run(read())
+
+        self.assertEqual([event.split('\n')[0] for event in events], ['event: snapshot'] * 2)
+        # Соединение закрыто после каждого чтения итогов, в потоке, где оно открыто
+        self.assertEqual(closes, [1, 2])
+        self.assertEqual(set(closed_in), {orm_thread})
+
+
+class VoteBatchTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        admin = create_user('admin', is_admin=True)
+        meeting = create_meeting(admin)
+        self.agenda_items = [create_agenda_item(meeting, f'Вопрос {number}') for number in range(2)]
+        self.client = api_client(create_user('member'))
+
+    def test_string_ids_and_protocol_versions(self):
+        first, second = self.agenda_items
+        names = [current_protocol_name(item.pk, 1) for item in self.agenda_items]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/vote_batch_create/', {'votes': [
+                {'agenda_item': str(first.pk), 'vote': 'yes'},
+                {'agenda_item': second.pk, 'vote': 'no'},
+                {'agenda_item': '²', 'vote': 'no'},
+            ]}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        results = response.data['results']
+        self.assertEqual(results[0]['vote'], 'yes')
+        self.assertEqual(results[1]['vote'], 'no')
+        self.assertEqual(results[2]['error'], 'Вопрос не найден')
+        # Сохранённые протоколы обоих вопросов устарели
+        self.assertNotEqual([current_protocol_name(item.pk, 1) for item in self.agenda_items], names)
+
+    def test_malformed_body(self):
+        first = self.agenda_items[0]
+
+        response = self.client.post('/api/vote_batch_create/', [{'agenda_item': first.pk, 'vote': 'yes'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Передайте список голосов в поле votes'})
+
+        response = self.client.post('/api/vote_batch_create/', {'votes': [
+            {'agenda_item': first.pk, 'vote': [1]},
+            {'agenda_item': first.pk, 'vote': {'yes': 1}},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [result['error'] for result in response.data['results']], ['Некорректный вариант голоса'] * 2
+        )
+        self.assertFalse(Vote.objects.exists())
+
+
+class ListFilterTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = api_client(create_user('member'))
+
+    def test_meeting_filter_expects_ascii_digits(self):
+        for value in ('²', '١', 'x'):
+            response = self.client.get('/api/agenda_get/', {'meeting': value})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('meeting', response.data)
+        self.assertEqual(self.client.get('/api/agenda_get/', {'meeting': '1'}).status_code, 200)
+
+
+class PaginationTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.member = create_user('member')
+        self.client = api_client(self.member)
+        admin = create_user('admin', is_admin=True)
+        # Одинаковые даты: порядок внутри них задаёт id
+        date = timezone.now()
+        self.meetings = [create_meeting(admin, date=date) for _ in range(5)]
+        for meeting in self.meetings:
+            UserMeetings.objects.create(user=self.member, meeting=meeting)
+        deadline = timezone.now() + timedelta(days=1)
+        self.agenda_items = [
+            create_agenda_item(
+                self.meetings[number % 2], f'Вопрос {number}',
+                summary_datetime=deadline if number < 5 else deadline + timedelta(hours=1),
+            )
+            for number in range(7)
+        ]
+
+    def pages(self, path, **params):
+        ids, cursor = [], None
+        while True:
+            response = self.client.get(path, {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            ids.append([row['id'] for row in response.data])
+            cursor = response.get('X-Next-Cursor')
+            if cursor is None:
+                return ids
+            self.assertTrue(response['Link'].endswith('>; rel="next"'))
+
+    def test_pages_rows_with_equal_sort_keys(self):
+        pages = self.pages('/api/meeting_list/', limit=2)
+        self.assertEqual(pages, [[meeting.pk for meeting in self.meetings[i:i + 2]] for i in (0, 2, 4)])
+
+        pages = self.pages('/api/agenda_get/', limit=3)
+        self.assertEqual(sum(pages, []), [item.pk for item in self.agenda_items])
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+    def test_invalid_cursor_and_limit(self):
+        cursor = self.client.get('/api/agenda_get/', {'limit': 2})['X-Next-Cursor']
+        tampered = cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B')
+        for value in (tampered, 'garbage', signing.dumps(['x'], salt='main.pagination.cursor')):
+            response = self.client.get('/api/agenda_get/', {'cursor': value})
+            self.assertEqual(response.status_code, 400, value)
+            self.assertIn('cursor', response.data)
+
+        for value in ('0', '-1', str(settings.API_MAX_PAGE_SIZE + 1), 'x'):
+            response = self.client.get('/api/meeting_list/', {'limit': value})
+            self.assertEqual(response.status_code, 400, value)
+            self.assertIn('limit', response.data)
+        response = self.client.get('/api/meeting_list/', {'limit': settings.API_MAX_PAGE_SIZE})
+        self.assertEqual(response.status_code, 200)
+
+    def test_fields_limit_keys_and_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/agenda_get/', {'fields': 'id,title', 'limit': 2})
+        self.assertEqual([set(row) for row in response.data], [{'id', 'title'}] * 2)
+
+        select = next(query['sql'] for query in queries if 'FROM "main_agendaitem"' in query['sql'])
+        # Кроме запрошенных полей читаются только поля курсора
+        self.assertIn('"main_agendaitem"."summary_datetime"', select)
+        self.assertNotIn('"main_agendaitem"."description"', select)
+        self.assertNotIn('"main_agendaitem"."materials"', select)
+
+        response = self.client.get('/api/agenda_get/', {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.data)
+
+
+class ConditionalGetTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = create_user('admin', is_admin=True)
+        self.meeting = create_meeting(self.admin)
+        self.member = create_user('member')
+        UserMeetings.objects.create(user=self.member, meeting=self.meeting)
+        self.client = api_client(self.member)
+
+    def assertChangedAfter(self, path, write):
+        etag = self.client.get(path)['ETag']
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_agenda_changes(self):
+        self.assertChangedAfter('/api/agenda_get/', lambda: create_agenda_item(self.meeting))
+
+    def test_new_membership(self):
+        other = create_meeting(self.admin, 'other')
+        self.assertChangedAfter(
+            '/api/meeting_list/', lambda: UserMeetings.objects.create(user=self.member, meeting=other),
+        )
+
+    def test_profile_update(self):
+        self.assertChangedAfter('/api/profile/', lambda: self.client.put(
+            '/api/profile/update', {'username': 'renamed'}, format='json',
+        ))
+
+
+class RoomProvisioningTests(TransactionTestCase):
+    # Воркер работает в отдельных потоках со своими соединениями с базой
+    def setUp(self):
+        self.admin = create_user('admin', is_admin=True)
+        self.client = api_client(self.admin)
+
+    def create_meeting(self):
+        response = self.client.post('/api/meeting_create/', {
+            'name_room': 'board',
+            'password_room': 'secret',
+            'date': timezone.now().isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 202)
+        return response.data
+
+    def test_meeting_is_created_pending(self):
+        data = self.create_meeting()
+
+        meeting = Meeting.objects.get(pk=data['meeting_id'])
+        self.assertEqual(meeting.registration_link, '')
+
+        response = self.client.get(f'/api/meeting_create/status/{data["job_id"]}/')
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertIsNone(response.data['registration_link'])
+
+    def test_worker_fills_registration_link(self):
+        data = self.create_meeting()
+
+        with FakeRoomServer() as server, override_settings(ROOM_SERVICE_URL=server.url):
+            call_command('run_room_provisioning', '--once', stdout=StringIO())
+
+        self.assertEqual(server.requests, [{'name': 'board', 'password': 'secret'}])
+        response = self.client.get(f'/api/meeting_create/status/{data["job_id"]}/')
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual(response.data['registration_link'], 'https://rooms.test/board')
+        self.assertEqual(RoomProvisioningJob.objects.get().password_room, '')
+
+    @override_settings(ROOM_PROVISIONING_MAX_ATTEMPTS=2)
+    def test_failed_attempts_are_retried_then_given_up(self):
+        self.create_meeting()
+
+        with FakeRoomServer(failures=2) as server, override_settings(ROOM_SERVICE_URL=server.url):
+            job = run_job(claim_jobs(1)[0])
+            self.assertEqual(job.status, 'pending')
+            self.assertGreater(job.next_attempt_at, timezone.now())
+
+            # Задача с отложенной попыткой не забирается раньше времени
+            self.assertEqual(claim_jobs(1), [])
+
+            RoomProvisioningJob.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+            job = run_job(claim_jobs(1)[0])
+
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, 2)
+
+    def test_lease_covers_all_request_retries(self):
+        self.create_meeting()
+
+        with override_settings(ROOM_PROVISIONING_LEASE=5, ROOM_SERVICE_CONNECT_TIMEOUT=3, ROOM_SERVICE_READ_TIMEOUT=10,
+                               ROOM_SERVICE_RETRIES=2, ROOM_SERVICE_BACKOFF=1):
+            started = timezone.now()
+            job = claim_jobs(1)[0]
+
+        # Три попытки по 13 секунд и паузы до 1 + 2 секунд
+        self.assertGreaterEqual(job.next_attempt_at, started + timedelta(seconds=42))
+        self.assertEqual(claim_jobs(1), [])
+
+    def test_async_worker_waits_for_rooms_concurrently(self):
+        for _ in range(3):
+            self.create_meeting()
+
+        with FakeRoomServer(delay=0.3) as server, override_settings(ROOM_SERVICE_URL=server.url):
+            started = time.perf_counter()
+            call_command('run_room_provisioning', '--once', '--async', '--workers', '3', stdout=StringIO())
+            elapsed = time.perf_counter() - started
+
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(set(RoomProvisioningJob.objects.values_list('status', flat=True)), {'done'})
+        self.assertLess(elapsed, 0.9)
+
+
+class HttpClientTests(SimpleTestCase):
+    def test_retries_unavailable_responses(self):
+        client = HttpClient(retries=2, backoff=0)
+
+        with FakeRoomServer(failures=2, failure_status=503) as server:
+            response = client.post(server.url, json={'name': 'board'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(server.requests), 3)
+
+    def test_does_not_retry_server_errors(self):
+        client = HttpClient(retries=2, backoff=0)
+
+        with FakeRoomServer(failures=1) as server:
+            response = client.post(server.url, json={'name': 'board'})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(server.requests), 1)
+
+    def test_does_not_retry_gateway_timeout_for_post(self):
+        client = HttpClient(retries=2, backoff=0)
+
+        with FakeRoomServer(failures=1, failure_status=504) as server:
+            response = client.post(server.url, json={'name': 'board'})
+
+        # Шлюз не дождался ответа: комната могла быть уже создана
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(len(server.requests), 1)
+
+    def test_does_not_retry_dropped_connection_for_post(self):
+        client = HttpClient(retries=2, backoff=0)
+
+        with FakeRoomServer(failures=1, failure_status=None) as server:
+            with self.assertRaises(requests.ConnectionError):
+                client.post(server.url, json={'name': 'board'})
+
+        self.assertEqual(len(server.requests), 1)
+
+    def test_retries_refused_connection(self):
+        client = HttpClient(retries=2, backoff=0)
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            url = f'http://127.0.0.1:{sock.getsockname()[1]}/api/create-room'
+
+        # Соединение не установлено - запрос точно не отправлен, повторяем и POST
+        with patch.object(client, 'sleep_before_retry') as sleep, self.assertRaises(requests.ConnectionError):
+            client.post(url, json={'name': 'board'})
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_read_timeout(self):
+        client = HttpClient(read_timeout=0.1, retries=2, backoff=0)
+
+        with FakeRoomServer(delay=0.5) as server:
+            with self.assertRaises(requests.ReadTimeout):
+                client.post(server.url, json={'name': 'board'})
+
+        # Запрос, который мог быть выполнен, не повторяется
+        self.assertEqual(len(server.requests), 1)
+
+    def test_circuit_breaker_fails_fast(self):
+        client = HttpClient(retries=0, failure_threshold=2, reset_timeout=60)
+
+        with FakeRoomServer(failures=10) as server:
+            client.post(server.url, json={})
+            client.post(server.url, json={})
+            with self.assertRaises(CircuitOpenError):
+                client.post(server.url, json={})
+
+        self.assertEqual(len(server.requests), 2)
+
+    def test_circuit_breaker_closes_after_successful_probe(self):
+        client = HttpClient(retries=0, failure_threshold=1, reset_timeout=0)
+
+        with FakeRoomServer(failures=1) as server:
+            client.post(server.url, json={})
+            response = client.post(server.url, json={})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(client.get_breaker(server.url).is_open)
+
+    def test_async_client_retries_unavailable_responses(self):
+        client = AsyncHttpClient(retries=2, backoff=0)
+
+        with FakeRoomServer(failures=2, failure_status=503) as server:
+            response = asyncio.run(client.post(server.url, json={'name': 'board'}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(server.requests), 3)
+
+    def test_async_client_sends_max_workers_requests_at_once(self):
+        client = AsyncHttpClient(retries=0, max_workers=10)
+
+        async def send_all():
+            # Общий пул цикла событий клиент не использует
+            asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(1))
+            return await asyncio.gather(*(client.post(server.url, json={'name': str(n)}) for n in range(10)))
+
+        with FakeRoomServer(delay=0.3) as server:
+            started = time.perf_counter()
+            responses = asyncio.run(send_all())
+            elapsed = time.perf_counter() - started
+
+        self.assertEqual([response.status_code for response in responses], [200] * 10)
+        self.assertLess(elapsed, 0.6)
+
+
+class MeetingProtocolsExportTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        clear_protocols()
+        self.admin = create_user('admin', is_admin=True)
+        self.meeting = create_meeting(self.admin)
+        self.agenda_items = [create_agenda_item(self.meeting, f'Вопрос {number}') for number in range(2)]
+        create_vote(create_user('member'), self.agenda_items[0], {'agenda_item': self.agenda_items[0].pk, 'vote': 'yes'})
+        self.client = api_client(self.admin)
+
+    def test_renders_missing_protocols_in_pool(self):
+        pool = ImmediatePool()
+        with patch.object(pool, 'submit', wraps=pool.submit) as submit, \
+                patch('main.exports.get_pool', return_value=pool):
+            response = self.client.get(f'/api/generate-protocols/{self.meeting.pk}/')
+            content = b''.join(response.streaming_content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(submit.call_count, 2)
+        with zipfile.ZipFile(BytesIO(content)) as archive:
+            self.assertEqual(
+                sorted(archive.namelist()), sorted(f'protocol_{item.pk}.pdf' for item in self.agenda_items)
+            )
+            for name in archive.namelist():
+                self.assertTrue(archive.read(name).startswith(b'%PDF'))
+        # Сгенерированные протоколы сохранены для следующих выгрузок
+        for item in self.agenda_items:
+            self.assertTrue(protocol_storage.exists(current_protocol_name(item.pk, self.admin.pk)))
+
+
+class ProtocolDownloadTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        clear_protocols()
+        admin = create_user('admin', is_admin=True)
+        meeting = create_meeting(admin)
+        self.agenda_item = create_agenda_item(meeting)
+        self.client = api_client(admin)
+        self.url = f'/api/generate-protocol/{self.agenda_item.pk}/'
+
+    def download(self, **headers):
+        """Ответ и его тело (файл закрывается)"""
+        response = self.client.get(self.url, **headers)
+        body = response.getvalue()
+        response.close()
+        return response, body
+
+    def test_name_does_not_depend_on_cache(self):
+        with patch('main.protocol.render_protocol', wraps=render_protocol) as render:
+            etag = self.download()[0]['ETag']
+            # Другой процесс со своим кэшем видит ту же версию итогов
+            cache.clear()
+            self.assertEqual(self.download()[0]['ETag'], etag)
+        self.assertEqual(render.call_count, 1)
+
+    def test_removed_file_is_rendered_again(self):
+        def get_and_remove(agenda_item, user):
+            name = get_protocol(agenda_item, user)
+            # Процесс с более новой версией итогов удалил файл до открытия
+            protocol_storage.delete(name)
+            return name
+
+        with patch('main.protocol.get_protocol', get_and_remove):
+            response, body = self.download()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body.startswith(b'%PDF'))
+
+    def test_range_requests(self):
+        _, full = self.download()
+        size = len(full)
+
+        response, body = self.download(HTTP_RANGE='bytes=0-99')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 0-99/{size}')
+        self.assertEqual(body, full[:100])
+
+        response, body = self.download(HTTP_RANGE='bytes=-10')
+        self.assertEqual(body, full[-10:])
+
+        response, body = self.download(HTTP_RANGE=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+    def test_if_range(self):
+        etag = self.download()[0]['ETag']
+
+        response, body = self.download(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+        # Протокол изменился: вместо части отдаётся новый файл целиком
+        with self.captureOnCommitCallbacks(execute=True):
+            create_vote(create_user('member'), self.agenda_item, {'agenda_item': self.agenda_item.pk, 'vote': 'yes'})
+        response, body = self.download(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # У протокола нет Last-Modified: дата в If-Range не совпадает никогда
+        response, body = self.download(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='Wed, 21 Oct 2015 07:28:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=0-5000', 1000), (0, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+        # Несколько диапазонов и другие единицы не поддерживаются - файл целиком
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 1000))
+        self.assertIsNone(parse_range('items=0-1', 1000))
+        self.assertIsNone(parse_range('bytes=-', 1000))
+        for header in ('bytes=1000-', 'bytes=5-3', 'bytes=-0'):
+            with self.assertRaises(ValueError):
+                parse_range(header, 1000)
+
+
+class QueryCountTests(ClearCacheMixin, TestCase):
+    """Число запросов к базе для каждого эндпоинта из main/urls.py.
+
+    Счётчики фиксируют текущее поведение: лишний запрос (например, N+1
+    в списке) ломает тест.
+    """
+
+    def setUp(self):
+        super().setUp()
+        clear_protocols()
+
+        self.admin = create_user('admin', is_admin=True)
+        self.member = create_user('member')
+        self.meeting = create_meeting(self.admin)
+        UserMeetings.objects.create(user=self.member, meeting=self.meeting)
+        self.agenda_items = [create_agenda_item(self.meeting, f'Вопрос {i}') for i in range(3)]
+        self.agenda_item = self.agenda_items[0]
+
+        self.admin_client = api_client(self.admin)
+        self.member_client = api_client(self.member)
+
+    def test_register(self):
+        with self.assertNumQueries(7):
+            response = self.client.post('/api/register/', {
+                'username': 'new', 'email': 'new@example.com', 'password': 'password',
+            })
+        self.assertEqual(response.status_code, 201)
+
+    def test_login(self):
+        with self.assertNumQueries(3):
+            response = self.client.post('/api/login/', {'email': 'MEMBER@example.com', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile(self):
+        with self.assertNumQueries(1):
+            response = self.member_client.get('/api/profile/')
+        self.assertEqual(response.status_code, 200)
+
+        # Повторный запрос: токен из кэша, ответ 304 по ETag
+        with self.assertNumQueries(0):
+            response = self.member_client.get('/api/profile/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_profile_update(self):
+        with self.assertNumQueries(6):
+            response = self.member_client.put('/api/profile/update', {'username': 'renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_meeting_create(self):
+        with self.assertNumQueries(5):
+            response = self.admin_client.post('/api/meeting_create/', {
+                'name_room': 'council', 'password_room': 'secret', 'date': timezone.now().isoformat(),
+            }, format='json')
+        self.assertEqual(response.status_code, 202)
+
+        with self.assertNumQueries(1):
+            response = self.admin_client.get(f'/api/meeting_create/status/{response.data["job_id"]}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_meeting_list(self):
+        with self.assertNumQueries(3):
+            response = self.member_client.get('/api/meeting_list/')
+        self.assertEqual(len(response.data), 1)
+
+    def test_agenda_create(self):
+        with self.assertNumQueries(4):
+            response = self.admin_client.post('/api/agenda_create/', {
+                'meeting': self.meeting.pk, 'title': 'Новый вопрос', 'description': 'Проект решения',
+                'meeting_type': 'vote', 'summary_datetime': timezone.now().isoformat(),
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_agenda_list(self):
+        with self.assertNumQueries(3):
+            response = self.member_client.get('/api/agenda_get/')
+        self.assertEqual(len(response.data), 3)
+
+    def test_vote_create(self):
+        with self.assertNumQueries(9):
+            response = self.member_client.post('/api/vote_create/', {
+                'agenda_item': self.agenda_item.pk, 'vote': 'yes',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_vote_batch_create(self):
+        # Голоса вставляются одним запросом после блокировки вопросов, итоги - UPDATE и версия итогов на вопрос
+        with self.assertNumQueries(7 + 2 * len(self.agenda_items)):
+            response = self.member_client.post('/api/vote_batch_create/', {
+                'votes': [{'agenda_item': item.pk, 'vote': 'no'} for item in self.agenda_items],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_vote_update(self):
+        Vote.objects.create(agenda_item=self.agenda_item, user=self.member, vote='yes')
+
+        with self.assertNumQueries(11):
+            response = self.member_client.put('/api/vote_update/', {
+                'agenda_item': self.agenda_item.pk, 'vote': 'no',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_generate_protocol(self):
+        with self.assertNumQueries(3):
+            response = self.admin_client.get(f'/api/generate-protocol/{self.agenda_item.pk}/')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_generate_meeting_protocols(self):
+        # Протоколы уже сгенерированы - пул процессов не используется
+        for item in self.agenda_items:
+            self.admin_client.get(f'/api/generate-protocol/{item.pk}/').close()
+
+        with self.assertNumQueries(3):
+            response = self.admin_client.get(f'/api/generate-protocols/{self.meeting.pk}/')
+            content = b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(content.startswith(b'PK'))
+
+    async def read_snapshot(self, path):
+        response = await self.async_client.get(path, {'token': self.member_client.token})
+        content = response.streaming_content
+        snapshot = await anext(content)
+
+        # Отключение клиента, как под ASGI: ожидание следующего события отменяется
+        waiting = asyncio.ensure_future(anext(content))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await waiting
+        return snapshot
+
+    def test_agenda_stream(self):
+        # Первое событие потока - текущие итоги; дальше поток ждёт голосов без запросов
+        with self.assertNumQueries(4):
+            snapshot = async_to_sync(self.read_snapshot)(f'/api/agenda_stream/{self.agenda_item.pk}/')
+        self.assertTrue(snapshot.startswith(b'event: snapshot'))
+
+    def test_meeting_stream(self):
+        with self.assertNumQueries(4):
+            snapshot = async_to_sync(self.read_snapshot)(f'/api/meeting_stream/{self.meeting.pk}/')
+        self.assertTrue(snapshot.startswith(b'event: snapshot'))
+
+    def test_check_token(self):
+        with self.assertNumQueries(1):
+            response = self.member_client.get('/api/check_token/')
+        self.assertEqual(response.status_code, 200)
+
+
+class IndexUsageTests(TestCase):
+    """Горячие запросы используют индексы, а не полный просмотр таблицы"""
+
+    def assertUsesIndex(self, queryset, *index_names):
+        if connection.vendor == 'postgresql':
+            # На маленьких тестовых таблицах планировщик предпочёл бы Seq Scan
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), plan)
+
+    def test_login_email_lookup(self):
+        queryset = User.objects.alias(email_lower=Lower('email')).filter(email_lower='member@example.com')
+        self.assertUsesIndex(queryset, 'auth_user_email_lower_idx')
+
+    def test_user_meetings_lookup(self):
+        queryset = UserMeetings.objects.filter(user_id=1).values('meeting_id')
+        # SQLite создаёт уникальное ограничение вместе с таблицей под своим именем
+        self.assertUsesIndex(queryset, 'unique_user_meeting', 'sqlite_autoindex_main_usermeetings_1')
+
+    def test_meeting_list_ordering(self):
+        queryset = Meeting.objects.order_by('date', 'id')[:20]
+        self.assertUsesIndex(queryset, 'meeting_date_idx')
+
+    def test_agenda_items_of_meeting(self):
+        queryset = AgendaItem.objects.filter(meeting_id=1).order_by('summary_datetime', 'id')[:20]
+        self.assertUsesIndex(queryset, 'agenda_meeting_date_idx')
+
+    def test_votes_by_choice(self):
+        self.assertUsesIndex(Vote.objects.filter(agenda_item_id=1, vote='yes'), 'vote_item_choice_idx')
+        queryset = Vote.objects.values('agenda_item', 'vote').annotate(count=Count('id')).order_by()
+        self.assertUsesIndex(queryset, 'vote_item_choice_idx')
+
+
+class BenchmarkCommandsTests(TestCase):
+    def test_seed_and_bench(self):
+        call_command(
+            'seed_benchmark_data', users=30, meetings=3, agenda_items=12, votes=100,
+            meetings_per_user=2, admin_ratio=0.1, stdout=StringIO(),
+        )
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Vote.objects.count(), 100)
+        # Итоги соответствуют голосам
+        self.assertEqual(sum(VoteTally.objects.values_list('total', flat=True)), 100)
+        self.assertEqual(
+            Vote.objects.filter(vote='yes').count(), sum(VoteTally.objects.values_list('yes', flat=True))
+        )
+
+        # Генерация протоколов всей конференции идёт в пуле процессов - её не запускаем
+        output = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        output.close()
+        self.addCleanup(os.remove, output.name)
+        call_command(
+            'bench_api', iterations=2, warmup=0, output=output.name, stdout=StringIO(),
+            only=['login', 'meeting_list', 'agenda_get', 'vote_create', 'vote_update'],
+        )
+
+        with open(output.name, encoding='utf-8') as f:
+            report = json.load(f)
+        self.assertEqual(report['dataset']['votes'], 100)
+        self.assertEqual(
+            set(report['results']), {'login', 'meeting_list', 'agenda_get', 'vote_create', 'vote_update'}
+        )
+        self.assertEqual(report['results']['vote_create']['status'], 201)
+        # Изменяющие запросы откатываются
+        self.assertEqual(Vote.objects.count(), 100)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        registry.clear()
+        self.admin = create_user('admin', is_admin=True)
+        self.member = create_user('member')
+
+    def test_request_metrics_by_url_name(self):
+        api_client(self.member).get('/api/profile/')
+
+        with override_settings(METRICS_TOKEN='secret'):
+            response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+        metrics = response.content.decode()
+        self.assertIn('http_request_duration_seconds_count{method="GET",view="profile"} 1', metrics)
+        self.assertIn('http_responses_total{status="200",view="profile"} 1', metrics)
+        # Запрос токена при холодном кэше
+        self.assertIn('http_request_db_queries_bucket{view="profile",le="1"} 1', metrics)
+        self.assertIn('http_response_size_bytes_count{view="profile"} 1', metrics)
+
+    def test_unknown_methods_share_one_series(self):
+        client = api_client(self.member)
+        for method in ('FOO1', 'FOO2'):
+            client.generic(method, '/api/profile/')
+
+        metrics = registry.render()
+        self.assertIn('http_request_duration_seconds_count{method="other",view="profile"} 2', metrics)
+        self.assertNotIn('FOO', metrics)
+
+    async def test_async_request_queries(self):
+        token = await Token.objects.acreate(user=self.member)
+        response = await AsyncClient().get('/api/async/profile/', headers={'Authorization': f'Token {token.key}'})
+        self.assertEqual(response.status_code, 200)
+
+        metrics = registry.render()
+        self.assertIn('http_request_db_queries_count{view="async_profile"} 1', metrics)
+        # Токен и профиль читаются из базы через sync_to_async
+        self.assertNotIn('http_request_db_queries_bucket{view="async_profile",le="0"} 1', metrics)
+
+    def test_access(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.assertEqual(api_client(self.member).get('/api/metrics/').status_code, 403)
+        with override_settings(METRICS_TOKEN=None):
+            response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer None')
+        self.assertEqual(response.status_code, 403)
+
+        self.assertEqual(api_client(self.admin).get('/api/metrics/').status_code, 200)
+
+    def test_timer(self):
+        with timer('job_duration_seconds', kind='test'):
+            pass
+        with self.assertRaises(ValueError), timer('job_duration_seconds', kind='test'):
+            raise ValueError
+
+        metrics = registry.render()
+        self.assertIn('job_duration_seconds_count{kind="test",outcome="ok"} 1', metrics)
+        self.assertIn('job_duration_seconds_bucket{kind="test",outcome="error",le="+Inf"} 1', metrics)
+
+
+class ParticipantsImportTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = create_user('admin', is_admin=True)
+        self.meeting = create_meeting(self.admin)
+        self.users = [create_user(f'user{i}') for i in range(5)]
+        UserMeetings.objects.create(user=self.users[0], meeting=self.meeting)
+        self.client = api_client(self.admin)
+        self.url = f'/api/meeting_participants_import/{self.meeting.pk}/'
+
+    def test_csv_upload(self):
+        csv_file = SimpleUploadedFile('participants.csv', (
+            'name,email\n'
+            'Первый,USER0@example.com\n'
+            'Второй,user1@example.com\n'
+            'Второй ещё раз,user1@example.com\n'
+            'Неизвестный,nobody@example.com\n'
+        ).encode())
+
+        response = self.client.post(self.url, {'file': csv_file}, format='multipart')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['skipped'], 2)
+        self.assertEqual(response.data['unknown_entries'], ['nobody@example.com'])
+        self.assertEqual(UserMeetings.objects.filter(meeting=self.meeting).count(), 2)
+
+    def test_json_body_in_batches(self):
+        body = json.dumps([
+            self.users[2].pk, str(self.users[3].pk), {'email': 'user4@example.com'}, 999, 'junk', '²',
+        ])
+
+        with patch('main.views.enroll_participants', wraps=lambda meeting, entries: enroll_participants(
+            meeting, entries, batch_size=2
+        )):
+            response = self.client.generic('POST', self.url, body, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(response.data['unknown'], 3)
+        self.assertEqual(
+            set(UserMeetings.objects.filter(meeting=self.meeting).values_list('user_id', flat=True)),
+            {user.pk for user in self.users[:1] + self.users[2:]},
+        )
+
+    def test_invalid_json(self):
+        response = self.client.generic('POST', self.url, '{"email": 1}', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_admin_only(self):
+        response = api_client(self.users[1]).generic('POST', self.url, '1', content_type='text/csv')
+        self.assertEqual(response.status_code, 403)
+
+    def test_management_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(f'{self.users[1].pk}\n{self.users[2].email}\n')
+        self.addCleanup(os.remove, f.name)
+
+        call_command('enroll_participants', self.meeting.pk, f.name, stdout=StringIO())
+
+        self.assertEqual(UserMeetings.objects.filter(meeting=self.meeting).count(), 3)
+
+
+class BulkRegistrationTests(TransactionTestCase):
+    # Пароли хешируются в пуле процессов
+    def setUp(self):
+        self.admin = create_user('admin', is_admin=True)
+        self.client = api_client(self.admin)
+
+    def test_register_users(self):
+        response = self.client.post('/api/register_bulk/', {'users': [
+            {'username': 'board1', 'email': 'board1@example.com', 'password': 'secret1'},
+            {'username': 'board2', 'password': 'secret2', 'is_admin': True},
+            {'username': 'board3', 'email': 'board3@example.com', 'password': 'secret3'},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        users = response.data['users']
+        self.assertEqual([user['username'] for user in users], ['board1', 'board2', 'board3'])
+
+        # Выданные токены рабочие, пароли захешированы
+        self.assertEqual(self.client_for(users[1]['token']).get('/api/profile/').data['is_admin'], True)
+        self.assertTrue(User.objects.get(username='board3').check_password('secret3'))
+        self.assertEqual(
+            self.client.post('/api/login/', {'email': 'board1@example.com', 'password': 'secret1'}).status_code, 200
+        )
+
+    def test_nothing_is_created_on_errors(self):
+        create_user('taken')
+
+        response = self.client.post('/api/register_bulk/', [
+            {'username': 'new', 'password': 'secret'},
+            {'username': 'taken', 'password': 'secret'},
+            {'username': 'new', 'password': 'secret'},
+            {'username': 'bad name!', 'password': 'secret'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('username', response.data['errors'][3])
+
+        response = self.client.post('/api/register_bulk/', [
+            {'username': 'new', 'password': 'secret'},
+            {'username': 'taken', 'password': 'secret'},
+            {'username': 'new', 'password': 'secret'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([bool(error) for error in response.data['errors']], [False, True, True])
+        self.assertFalse(User.objects.filter(username='new').exists())
+
+    @override_settings(BULK_REGISTER_MAX_USERS=2)
+    def test_large_batches_go_to_the_command(self):
+        users = [{'username': f'board{number}', 'password': 'secret'} for number in range(3)]
+        with patch('main.views.register_users') as register:
+            response = self.client.post('/api/register_bulk/', users, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('register_users', response.data['error'])
+        register.assert_not_called()
+
+    def test_admin_only(self):
+        member = create_user('member')
+        response = api_client(member).post('/api/register_bulk/', [{'username': 'x', 'password': 'y'}], format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def client_for(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        return client
+
+
+class ChunkedUploadTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = create_user('admin', is_admin=True)
+        self.member = create_user('member')
+        meeting = create_meeting(self.admin)
+        self.agenda_item = create_agenda_item(meeting)
+        self.content = os.urandom(150_000)
+
+    def start(self, client, target, **extra):
+        response = client.post('/api/uploads/', {
+            'target': target, 'agenda_item': self.agenda_item.pk, 'filename': 'sheet.pdf',
+            'size': len(self.content), **extra,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return f'/api/uploads/{response.data["id"]}/'
+
+    def put_chunk(self, client, url, offset, data, **headers):
+        return client.generic(
+            'PUT', f'{url}?offset={offset}', data, content_type='application/octet-stream', headers=headers,
+        )
+
+    def test_materials_upload_resumes_after_wrong_offset(self):
+        client = api_client(self.admin)
+        url = self.start(client, 'materials', sha256=hashlib.sha256(self.content).hexdigest())
+
+        response = self.put_chunk(client, url, 0, self.content[:100_000])
+        self.assertEqual(response.data['offset'], 100_000)
+
+        # Повтор уже принятой части: сервер сообщает, откуда продолжать
+        response = self.put_chunk(client, url, 0, self.content[:100_000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(client.get(url).data['offset'], 100_000)
+
+        # Незавершённую загрузку прикрепить нельзя
+        self.assertEqual(client.post(f'{url}complete/').status_code, 409)
+
+        response = self.put_chunk(
+            client, url, 100_000, self.content[100_000:],
+            **{'X-Chunk-SHA256': hashlib.sha256(self.content[100_000:]).hexdigest()},
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = client.post(f'{url}complete/')
+        self.assertEqual(response.status_code, 200)
+        self.agenda_item.refresh_from_db()
+        self.addCleanup(self.agenda_item.materials.delete, save=False)
+        with self.agenda_item.materials.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_signed_vote_upload(self):
+        Vote.objects.create(agenda_item=self.agenda_item, user=self.member, vote='yes')
+        client = api_client(self.member)
+        url = self.start(client, 'signed_vote')
+
+        self.assertEqual(self.put_chunk(client, url, 0, self.content).status_code, 200)
+        response = client.post(f'{url}complete/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['sha256'], hashlib.sha256(self.content).hexdigest())
+        vote = Vote.objects.get(user=self.member)
+        self.addCleanup(vote.signed_vote.delete, save=False)
+        self.assertEqual(vote.signed_vote.size, len(self.content))
+
+    def test_chunk_is_read_outside_transaction(self):
+        client = api_client(self.admin)
+        url = self.start(client, 'materials')
+        session = UploadSession.objects.get()
+        # Уровень вложенности atomic у самого теста
+        depth = len(connection.atomic_blocks)
+        content = self.content
+
+        class SlowClient(BytesIO):
+            """Пока этот клиент передаёт часть, ту же часть успевает прислать повтор"""
+
+            def read(self, size=-1):
+                self.depths = getattr(self, 'depths', set()) | {len(connection.atomic_blocks)}
+                if self.tell() == 0:
+                    write_chunk(session.pk, session.user, 0, BytesIO(content[:1000]), 1000)
+                return super().read(size)
+
+        stream = SlowClient(b'x' * 1000)
+        with self.assertRaises(UploadError) as error:
+            write_chunk(session.pk, session.user, 0, stream, 1000)
+
+        self.assertEqual(error.exception.status, 409)
+        self.assertEqual(stream.depths, {depth})
+        # Засчитана часть, полученная первой, и её данные не перезаписаны
+        self.assertEqual(client.get(url).data['offset'], 1000)
+        with open(partial_path(session), 'rb') as f:
+            self.assertEqual(f.read(1000), content[:1000])
+
+    def test_file_is_hashed_outside_transaction(self):
+        client = api_client(self.admin)
+        url = self.start(client, 'materials')
+        self.put_chunk(client, url, 0, self.content)
+        depth = len(connection.atomic_blocks)
+        depths = []
+
+        def hash_file(path):
+            depths.append(len(connection.atomic_blocks))
+            return file_sha256(path)
+
+        with patch('main.uploads.file_sha256', hash_file):
+            response = client.post(f'{url}complete/')
+
+        self.assertEqual(response.status_code, 200)
+        self.agenda_item.refresh_from_db()
+        self.addCleanup(self.agenda_item.materials.delete, save=False)
+        self.assertEqual(depths, [depth])
+
+    def test_corrupted_chunk_is_not_counted(self):
+        client = api_client(self.admin)
+        url = self.start(client, 'materials')
+
+        response = self.put_chunk(client, url, 0, self.content[:1000], **{'X-Chunk-SHA256': '0' * 64})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(client.get(url).data['offset'], 0)
+
+    def test_file_checksum_mismatch(self):
+        client = api_client(self.admin)
+        url = self.start(client, 'materials', sha256='0' * 64)
+        self.put_chunk(client, url, 0, self.content)
+
+        self.assertEqual(client.post(f'{url}complete/').status_code, 400)
+        # Загрузка удалена вместе с файлом
+        self.assertEqual(client.get(url).status_code, 404)
+        self.agenda_item.refresh_from_db()
+        self.assertFalse(self.agenda_item.materials)
+
+    def test_permissions(self):
+        client = api_client(self.member)
+        response = client.post('/api/uploads/', {
+            'target': 'materials', 'agenda_item': self.agenda_item.pk, 'filename': 'a.pdf', 'size': 10,
+        }, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        # Опросный лист - только к своему голосу
+        response = client.post('/api/uploads/', {
+            'target': 'signed_vote', 'agenda_item': self.agenda_item.pk, 'filename': 'a.pdf', 'size': 10,
+        }, format='json')
+        self.assertEqual(response.status_code, 404)
+
+        # Чужая загрузка не видна
+        url = self.start(api_client(self.admin), 'materials')
+        self.assertEqual(client.get(url).status_code, 404)
+        self.assertEqual(self.put_chunk(client, url, 0, b'x').status_code, 404)
+
+    def test_expired_sessions_are_removed(self):
+        client = api_client(self.admin)
+        url = self.start(client, 'materials')
+        session = UploadSession.objects.get()
+        UploadSession.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        call_command('clear_uploads', stdout=StringIO())
+
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(partial_path(session)))
+        self.assertEqual(client.get(url).status_code, 404)
+
+
+class BlobStorageTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = create_user('admin', is_admin=True)
+        self.meeting = create_meeting(self.admin)
+        self.client = api_client(self.admin)
+
+    def create_item(self, title, materials):
+        response = self.client.post('/api/agenda_create/', {
+            'meeting': self.meeting.pk, 'title': title, 'description': 'Проект решения', 'meeting_type': 'vote',
+            'summary_datetime': (timezone.now() + timedelta(days=1)).isoformat(),
+            'materials': SimpleUploadedFile(f'{title}.pdf', materials),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return AgendaItem.objects.get(title=title)
+
+    def test_same_content_is_stored_once(self):
+        first = self.create_item('first', b'%PDF-1.4 materials')
+        second = self.create_item('second', b'%PDF-1.4 materials')
+        other = self.create_item('other', b'%PDF-1.4 other materials')
+
+        self.assertEqual(first.materials.name, second.materials.name)
+        self.assertTrue(first.materials.name.startswith('blobs/'))
+        self.assertTrue(first.materials.name.endswith('.pdf'))
+        self.assertEqual(Blob.objects.get(name=first.materials.name).refcount, 2)
+        self.assertEqual(Blob.objects.get(name=other.materials.name).refcount, 1)
+
+    def test_unreferenced_files_are_collected(self):
+        first = self.create_item('first', b'shared')
+        second = self.create_item('second', b'shared')
+        name = first.materials.name
+
+        second.delete()
+        first.materials = SimpleUploadedFile('new.pdf', b'replacement')
+        first.save()
+
+        self.assertEqual(Blob.objects.get(name=name).refcount, 0)
+        stats = collect_garbage(grace=timedelta(0))
+
+        self.assertEqual(stats, {'deleted': 1, 'freed_bytes': len(b'shared')})
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+        self.assertTrue(default_storage.exists(first.materials.name))
+
+    def test_references_written_without_signals(self):
+        item = self.create_item('first', b'shared')
+        # update() не отправляет сигналов: счётчик не знает о второй ссылке
+        copy = self.create_item('second', b'other')
+        AgendaItem.objects.filter(pk=copy.pk).update(materials=item.materials.name)
+        item.delete()
+
+        call_command('gc_blobs', '--grace=0', '--skip-recount', stdout=StringIO())
+        self.assertTrue(default_storage.exists(item.materials.name))
+
+        call_command('gc_blobs', '--grace=0', stdout=StringIO())
+        self.assertEqual(Blob.objects.get(name=item.materials.name).refcount, 1)
+        self.assertFalse(default_storage.exists(copy.materials.name))
+
+
+class AvatarVariantsTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = create_user('member')
+        self.client = api_client(self.user)
+
+    def upload_photo(self, color):
+        output = BytesIO()
+        Image.new('RGBA', (600, 400), color).save(output, 'PNG')
+        photo = SimpleUploadedFile('photo.png', output.getvalue(), content_type='image/png')
+
+        with patch('main.serializers.schedule_variants') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.put('/api/profile/update', {'photo': photo}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.data)
+        name = UserProfile.objects.get(user=self.user).photo.name
+        schedule.assert_called_once_with(self.user.pk, name)
+        return name
+
+    def test_original_until_variants_are_ready(self):
+        name = self.upload_photo('red')
+
+        data = self.client.get('/api/profile/').data
+        self.assertEqual(data['photo_variants']['48'], {'webp': data['photo'], 'jpeg': data['photo']})
+
+        store_variants(self.user.pk, name, render_variants(name))
+
+        variants = self.client.get('/api/profile/').data['photo_variants']
+        self.assertEqual(set(variants), {'48', '128', '256'})
+        self.assertTrue(variants['48']['webp'].endswith('/48.webp'))
+        with Image.open(variant_storage.path(UserProfile.objects.get().photo_variants['48']['webp'])) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (48, 48)))
+
+    def test_variants_of_replaced_photo_are_ignored_and_removed(self):
+        old_name = self.upload_photo('red')
+        old_variants = render_variants(old_name)
+        self.upload_photo('blue')
+
+        # Копии старого фото готовы позже, чем загружено новое
+        self.assertFalse(store_variants(self.user.pk, old_name, old_variants))
+        self.assertEqual(UserProfile.objects.get().photo_variants, {})
+
+        self.assertEqual(remove_stale_variants(), 1)
+        self.assertFalse(variant_storage.exists(old_variants['48']['jpeg']))
+
+    @override_settings(AVATAR_MAX_UPLOAD_SIZE=100)
+    def test_large_photo_is_rejected(self):
+        # Настоящее изображение: ошибка именно из-за размера, а не формата
+        output = BytesIO()
+        Image.new('RGB', (64, 64), 'red').save(output, 'PNG')
+        self.assertGreater(len(output.getvalue()), 100)
+        photo = SimpleUploadedFile('photo.png', output.getvalue(), content_type='image/png')
+
+        with patch('main.serializers.schedule_variants') as schedule:
+            response = self.client.put('/api/profile/update', {'photo': photo}, format='multipart')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['photo'], ['Фото больше 100 байт'])
+        schedule.assert_not_called()
+
+
+class MediaDeliveryTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, MEDIA_ACCEL=None)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = create_user('admin', is_admin=True)
+        self.member = create_user('member')
+        self.outsider = create_user('outsider')
+        meeting = create_meeting(self.admin)
+        UserMeetings.objects.create(user=self.member, meeting=meeting)
+        UserMeetings.objects.create(user=self.outsider, meeting=create_meeting(self.admin, 'other'))
+
+        self.content = b'%PDF-1.4 ' + os.urandom(10_000)
+        self.agenda_item = create_agenda_item(meeting, materials=SimpleUploadedFile('pack.pdf', self.content))
+        self.url = f'/api/media/materials/{self.agenda_item.pk}/'
+
+    def test_member_downloads_with_range_and_etag(self):
+        client = api_client(self.member)
+
+        response = client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn(f'materials_{self.agenda_item.pk}.pdf', response['Content-Disposition'])
+
+        response = client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+        etag = response['ETag']
+        self.assertEqual(client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_only_meeting_members(self):
+        self.assertEqual(api_client(self.outsider).get(self.url).status_code, 403)
+        self.assertEqual(api_client(self.admin).get(self.url).status_code, 200)
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+
+    @override_settings(MEDIA_ACCEL='x-accel-redirect')
+    def test_offloaded_to_front_server(self):
+        client = api_client(self.member)
+        response = client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.agenda_item.materials.name}')
+        self.assertEqual(response.content, b'')
+
+        with override_settings(MEDIA_ACCEL='x-sendfile'):
+            response = client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], default_storage.path(self.agenda_item.materials.name))
+
+    def test_signed_vote_for_owner_and_meeting_admin(self):
+        vote = Vote.objects.create(
+            agenda_item=self.agenda_item, user=self.member, vote='yes',
+            signed_vote=SimpleUploadedFile('sheet.pdf', b'signed'),
+        )
+        url = f'/api/media/signed_vote/{vote.pk}/'
+        other = create_user('other')
+        UserMeetings.objects.create(user=other, meeting=self.agenda_item.meeting)
+
+        self.assertEqual(b''.join(api_client(self.member).get(url).streaming_content), b'signed')
+        self.assertEqual(api_client(self.admin).get(url).status_code, 200)
+        self.assertEqual(api_client(other).get(url).status_code, 403)
+
+
+class ImmediatePool:
+    """Пул, выполняющий задачи сразу в текущем потоке"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+class ProcessPoolResultTests(SimpleTestCase):
+    def test_result_callback_does_not_block_result_collection(self):
+        done = threading.Event()
+        handled_in = []
+
+        def callback(future):
+            time.sleep(0.3)
+            handled_in.append((threading.current_thread().name, future.result()))
+            done.set()
+
+        future = Future()
+        add_result_callback(future, callback)
+        started = time.perf_counter()
+        # Так результат задачи выставляет служебный поток пула процессов
+        future.set_result('ok')
+        self.assertLess(time.perf_counter() - started, 0.1)
+
+        self.assertTrue(done.wait(5))
+        self.assertEqual(handled_in[0][1], 'ok')
+        self.assertTrue(handled_in[0][0].startswith('process-pool-results'))
+
+
+def openssl(*args):
+    subprocess.run(['openssl', *args], check=True, capture_output=True)
+
+
+class SignatureVerificationTests(ClearCacheMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.certs = tempfile.TemporaryDirectory()
+        path = cls.path
+        key = ['-newkey', 'ec', '-pkeyopt', 'ec_paramgen_curve:prime256v1', '-nodes']
+
+        # Доверенный УЦ и выпущенный им сертификат подписанта; отдельно - самоподписанный
+        openssl('req', '-x509', *key, '-keyout', path('ca.key'), '-out', path('ca.pem'), '-days', '1',
+                '-subj', '/CN=Test CA', '-addext', 'basicConstraints=critical,CA:TRUE')
+        openssl('req', *key, '-keyout', path('signer.key'), '-out', path('signer.csr'), '-subj', '/CN=Test Signer')
+        openssl('x509', '-req', '-in', path('signer.csr'), '-CA', path('ca.pem'), '-CAkey', path('ca.key'),
+                '-CAcreateserial', '-out', path('signer.pem'), '-days', '1')
+        openssl('req', '-x509', *key, '-keyout', path('rogue.key'), '-out', path('rogue.pem'), '-days', '1',
+                '-subj', '/CN=Rogue')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.certs.cleanup()
+        super().tearDownClass()
+
+    @classmethod
+    def path(cls, name):
+        return os.path.join(cls.certs.name, name)
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, SIGNATURE_CA_FILE=self.path('ca.pem'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def sign(self, content, detached=False, signer='signer'):
+        with open(self.path('content'), 'wb') as f:
+            f.write(content)
+        openssl('cms', '-sign', '-binary', '-in', self.path('content'), '-signer', self.path(f'{signer}.pem'),
+                '-inkey', self.path(f'{signer}.key'), '-outform', 'DER', '-out', self.path('signature'),
+                *([] if detached else ['-nodetach']))
+        with open(self.path('signature'), 'rb') as f:
+            return f.read()
+
+    def signed_pdf(self):
+        # Подпись PDF: CMS над всем файлом, кроме /Contents, байты указаны в /ByteRange
+        placeholder = 8192
+        head = b'%%PDF-1.7\n1 0 obj\n<< /Type /Sig /ByteRange [0 %010d %010d %010d] /Contents '
+        tail = b' >>\nendobj\n%%EOF\n'
+        length1 = len(head % (0, 0, 0))
+        start2 = length1 + placeholder + 2
+        head = head % (length1, start2, len(tail))
+        signature = self.sign(head + tail, detached=True).hex().encode()
+        return head + b'<' + signature.ljust(placeholder, b'0') + b'>' + tail
+
+    def save(self, filename, content):
+        return default_storage.save(filename, ContentFile(content))
+
+    def test_embedded_signature(self):
+        result = verify_file(self.save('sheet.p7s', self.sign(b'opros list')))
+        self.assertEqual(result.status, 'valid', result.detail)
+        self.assertIn('CN=Test Signer', result.signer)
+
+        self.assertEqual(verify_file(self.save('rogue.p7s', self.sign(b'opros list', signer='rogue'))).status, 'invalid')
+        self.assertEqual(verify_file(self.save('plain.p7s', b'not a signature')).status, 'invalid')
+
+    def test_pdf_signature(self):
+        pdf = self.signed_pdf()
+        self.assertEqual(verify_file(self.save('sheet.pdf', pdf)).status, 'valid')
+
+        tampered = pdf.replace(b'/Type /Sig', b'/Type /Sug')
+        self.assertEqual(verify_file(self.save('tampered.pdf', tampered)).status, 'invalid')
+
+        # Дописанное после подписи обновление подписью не покрыто
+        appended = pdf + b'2 0 obj\n<< /Annots [] >>\nendobj\n%%EOF\n'
+        result = verify_file(self.save('appended.pdf', appended))
+        self.assertEqual(result.status, 'invalid')
+        self.assertIn('/ByteRange', result.detail)
+
+    @override_settings(SIGNATURE_CA_FILE=None)
+    def test_not_configured(self):
+        self.assertEqual(verify_file(self.save('sheet.p7s', b'x')).status, 'error')
+
+    def test_vote_upload_is_verified_in_background_and_cached(self):
+        admin = create_user('admin', is_admin=True)
+        meeting = create_meeting(admin)
+        agenda_item = create_agenda_item(meeting)
+        signature = self.sign(b'opros list')
+
+        def vote(user):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = api_client(user).post('/api/vote_create/', {
+                    'agenda_item': agenda_item.pk, 'vote': 'yes',
+                    'signed_vote': SimpleUploadedFile('sheet.p7s', signature),
+                }, format='multipart')
+            self.assertEqual(response.status_code, 201)
+            # Голос сохраняется сразу, подпись проверяется после
+            self.assertEqual(response.data['signature_status'], 'pending')
+            return Vote.objects.get(user=user)
+
+        with patch('main.signatures.get_pool', return_value=ImmediatePool()), \
+                patch('main.process_pool.get_result_executor', return_value=ImmediatePool()), \
+                patch('main.signatures.verify_file', wraps=verify_file) as verify:
+            first = vote(create_user('first'))
+            second = vote(create_user('second'))
+
+        # Одинаковый файл проверен один раз
+        self.assertEqual(verify.call_count, 1)
+        self.assertEqual((first.signature_status, second.signature_status), ('valid', 'valid'))
+        self.assertIn('CN=Test Signer', second.signature_signer)
+        self.assertEqual(get_participants(agenda_item), ['first (ЭП действительна)', 'second (ЭП действительна)'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReadReplicaTests(ClearCacheMixin, TestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('reader')
+        self.client = api_client(self.user)
+        token = Token.objects.get(key=self.client.token)
+        # "Реплика" отстаёт: в ней старый email
+        self.user.email = 'stale@example.com'
+        for instance in (self.user, self.user.profile, token):
+            instance.save(using='replica', force_insert=True)
+
+    def test_safe_views_read_from_replica(self):
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            self.assertEqual(self.client.get('/api/meeting_list/').status_code, 200)
+        self.assertTrue(replica_queries.captured_queries)
+
+        # Асинхронные представления (main.async_views) тоже
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            self.assertEqual(self.client.get('/api/async/meeting_list/').status_code, 200)
+        self.assertTrue(replica_queries.captured_queries)
+
+        # Запросы на изменение реплику не трогают
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = self.client.post('/api/meeting_create/', {})
+        self.assertEqual(replica_queries.captured_queries, [])
+
+    def test_reads_own_writes_after_update(self):
+        response = self.client.put('/api/profile/update', {'email': 'fresh@example.com'})
+        self.assertEqual(response.status_code, 200)
+
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = self.client.get('/api/profile/')
+        self.assertEqual(response.data['email'], 'fresh@example.com')
+        self.assertEqual(replica_queries.captured_queries, [])
+
+        # Окно закончилось - снова реплика
+        cache.clear()
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            self.assertEqual(self.client.get('/api/meeting_list/').status_code, 200)
+        self.assertTrue(replica_queries.captured_queries)
+
+    def test_cached_data_is_read_from_primary(self):
+        # Токен с пользователем и профилем кэшируется: отстающая реплика не читается
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = self.client.get('/api/profile/')
+        self.assertEqual(response.data['email'], 'reader@example.com')
+        self.assertEqual(replica_queries.captured_queries, [])
+
+        # Участие в конференции, которого на реплике ещё нет
+        meeting = create_meeting(self.user)
+        UserMeetings.objects.create(user=self.user, meeting=meeting)
+        cache.clear()
+        self.assertEqual(self.client.get('/api/meeting_list/').status_code, 200)
+        version = get_version(user_version_key(self.user.pk))
+        self.assertEqual(cache.get(f'user_meetings:{self.user.pk}:{version}'), [meeting.pk])
+
+    def test_shared_cache_is_required(self):
+        self.assertEqual([error.id for error in check_replica_caches(None)], ['main.E001'])
+
+        shared = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'}
+        with override_settings(CACHES={'default': shared}):
+            self.assertEqual(check_replica_caches(None), [])
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(check_replica_caches(None), [])
+
+    def test_new_token_falls_back_to_primary(self):
+        # Пользователь и токен ещё не дошли до реплики
+        newcomer = create_user('newcomer')
+        response = api_client(newcomer).get('/api/profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'newcomer')
+
+
+class AsyncViewsTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = create_user('admin', is_admin=True)
+        self.member = create_user('member')
+        meeting = create_meeting(self.admin)
+        UserMeetings.objects.create(user=self.member, meeting=meeting)
+        self.open_item, self.closed_item = [
+            create_agenda_item(meeting, title, summary_datetime=timezone.now() + delta)
+            for title, delta in (('Открытый', timedelta(days=1)), ('Закрытый', timedelta(hours=-1)))
+        ]
+        self.client = api_client(self.member)
+
+    def test_reads_match_sync_views(self):
+        for path in ('profile/', 'meeting_list/', 'agenda_get/?limit=1&fields=id,title'):
+            sync_response = self.client.get(f'/api/{path}')
+            async_response = self.client.get(f'/api/async/{path}')
+            self.assertEqual(async_response.status_code, 200, path)
+            self.assertEqual(async_response.json(), sync_response.json())
+            self.assertEqual(async_response.get('X-Next-Cursor'), sync_response.get('X-Next-Cursor'))
+
+        etag = self.client.get('/api/async/agenda_get/')['ETag']
+        response = self.client.get('/api/async/agenda_get/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    async def test_votes(self):
+        client = AsyncClient()
+        headers = {'Authorization': f'Token {self.client.token}'}
+
+        async def vote(path, agenda_item, choice, method='post'):
+            return await getattr(client, method)(
+                f'/api/async/{path}', {'agenda_item': agenda_item.pk, 'vote': choice},
+                content_type='application/json', headers=headers,
+            )
+
+        response = await vote('vote_create/', self.open_item, 'yes')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['vote'], 'yes')
+
+        response = await vote('vote_create/', self.open_item, 'no')
+        self.assertEqual(response.json(), {'error': 'Вы уже проголосовали'})
+        response = await vote('vote_create/', self.closed_item, 'no')
+        self.assertEqual(response.json(), {'error': 'Время голосования истекло'})
+
+        response = await vote('vote_update/', self.open_item, 'no', method='put')
+        self.assertEqual(response.status_code, 201)
+        response = await vote('vote_update/?upsert=1', self.open_item, 'abstain', method='put')
+        self.assertEqual(response.status_code, 200)
+
+        tally = await VoteTally.objects.aget(agenda_item=self.open_item)
+        self.assertEqual((tally.yes, tally.no, tally.abstain, tally.total), (0, 0, 1, 1))
+
+    async def test_authentication_and_permissions(self):
+        client = AsyncClient()
+        response = await client.get('/api/async/profile/')
+        self.assertEqual(response.status_code, 401)
+        response = await client.get('/api/async/profile/', headers={'Authorization': 'Token missing'})
+        self.assertEqual(response.json(), {'detail': 'Invalid token.'})
+
+        async def post_meeting(token):
+            return await client.post(
+                '/api/async/meeting_create/',
+                {'name_room': 'board', 'password_room': 'secret', 'date': timezone.now().isoformat()},
+                content_type='application/json', headers={'Authorization': f'Token {token}'},
+            )
+
+        response = await post_meeting(self.client.token)
+        self.assertEqual(response.status_code, 403)
+
+        token = await Token.objects.acreate(user=self.admin)
+        response = await post_meeting(token.key)
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(await RoomProvisioningJob.objects.filter(pk=response.json()['job_id']).aexists())
+
+
+class SerialLiveServerThread(LiveServerThread):
+    """Сервер обрабатывает запросы по одному.
+
+    Потоки LiveServerTestCase делят одно соединение с тестовой базой в памяти,
+    и одновременные транзакции ломают друг друга.
+    """
+
+    def _create_server(self, connections_override=None):
+        return WSGIServer((self.host, self.port), QuietWSGIRequestHandler, allow_reuse_address=False)
+
+
+class VoterBenchmarkTests(LiveServerTestCase):
+    server_thread_class = SerialLiveServerThread
+
+    def test_sync_and_async_stacks(self):
+        admin = create_user('admin', is_admin=True)
+        meeting = create_meeting(admin)
+        agenda_item = create_agenda_item(meeting)
+        for number in range(2):
+            UserMeetings.objects.create(user=create_user(f'voter{number}'), meeting=meeting)
+
+        for stack in ('sync', 'async'):
+            output = StringIO()
+            call_command(
+                'bench_voters', url=self.live_server_url, stack=stack, concurrency=[1, 2], duration=0.1,
+                stdout=output,
+            )
+            self.assertIn(f'Стек {stack}: выдерживает 2 одновременных голосующих', output.getvalue())
+
+        self.assertEqual(Vote.objects.filter(agenda_item=agenda_item).count(), 2)
+
+
+class DeadlineSchedulerTests(ClearCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        clear_protocols()
+        self.admin = create_user('admin', is_admin=True)
+        meeting = create_meeting(self.admin)
+        self.due, self.upcoming = [
+            create_agenda_item(meeting, title, summary_datetime=timezone.now() + delta)
+            for title, delta in (('Срок прошёл', timedelta(minutes=-1)), ('Срок завтра', timedelta(days=1)))
+        ]
+
+    def test_queue_pops_deadlines_in_order(self):
+        now = timezone.now()
+        queue = DeadlineQueue()
+        queue.replace([(now + timedelta(minutes=2), 3), (now - timedelta(minutes=1), 1), (now, 2)])
+
+        self.assertEqual(queue.next_deadline(), now - timedelta(minutes=1))
+        self.assertEqual(queue.pop_due(now), [1, 2])
+        self.assertEqual(len(queue), 1)
+
+    def test_closes_due_items_and_prerenders_protocol(self):
+        for number, choice in enumerate(['yes', 'yes', 'no']):
+            Vote.objects.create(agenda_item=self.due, user=create_user(f'voter{number}'), vote=choice)
+        # Счётчики разошлись с голосами - при закрытии итоги считаются заново
+        VoteTally.objects.filter(agenda_item=self.due).update(yes=10, no=0, abstain=0, total=10)
+
+        with patch('main.deadlines.get_pool', return_value=ImmediatePool()):
+            call_command('run_deadline_scheduler', '--once', stdout=StringIO())
+
+        self.due.refresh_from_db()
+        self.upcoming.refresh_from_db()
+        self.assertIsNotNone(self.due.closed_at)
+        self.assertIsNone(self.upcoming.closed_at)
+        tally = VoteTally.objects.get(agenda_item=self.due)
+        self.assertEqual((tally.yes, tally.no, tally.total), (2, 1, 3))
+
+        # Протокол готов до первого запроса и отдаётся любому администратору
+        self.assertTrue(protocol_storage.exists(current_protocol_name(self.due.pk, self.admin.pk)))
+        client = api_client(create_user('auditor', is_admin=True))
+        with patch('main.protocol.render_protocol') as render:
+            response = client.get(f'/api/generate-protocol/{self.due.pk}/')
+        self.assertEqual(response.status_code, 200)
+        render.assert_not_called()
+
+        self.assertIsNotNone(AgendaItemSerializer(self.due).data['closed_at'])
+        self.assertIsNone(AgendaItemSerializer(self.upcoming).data['closed_at'])
+
+    def test_item_is_closed_once(self):
+        with patch('main.deadlines.get_pool', return_value=ImmediatePool()):
+            self.assertEqual([item.pk for item in finalize_agenda_items([self.due.pk, self.upcoming.pk])], [self.due.pk])
+            self.assertEqual(finalize_agenda_items([self.due.pk]), [])
+
+    def test_prerendered_protocol_is_served_by_another_process(self):
+        with patch('main.deadlines.get_pool', return_value=ImmediatePool()):
+            finalize_agenda_items([self.due.pk])
+
+        # Версия протокола хранится в базе: процесс с пустым локальным кешем
+        # находит протокол, сгенерированный планировщиком
+        cache.clear()
+        client = api_client(create_user('auditor', is_admin=True))
+        with patch('main.protocol.render_protocol') as render:
+            response = client.get(f'/api/generate-protocol/{self.due.pk}/')
+        self.assertEqual(response.status_code, 200)
+        render.assert_not_called()
+
+    def test_votes_rejected_after_close(self):
+        voter = create_user('voter')
+        Vote.objects.create(agenda_item=self.upcoming, user=voter, vote='yes')
+        # Объект загружен до закрытия: голос проверяется под блокировкой строки вопроса
+        stale = AgendaItem.objects.get(pk=self.upcoming.pk)
+        AgendaItem.objects.filter(pk=self.upcoming.pk).update(closed_at=timezone.now())
+
+        closed = ({'error': 'Время голосования истекло'}, 400)
+        data = {'agenda_item': stale.pk, 'vote': 'no'}
+        self.assertEqual(create_vote(create_user('late'), stale, data), closed)
+        self.assertEqual(update_vote(voter, stale, Vote.objects.get(user=voter), data), closed)
+        self.assertEqual(upsert_vote(voter, stale, data), closed)
+
+        client = api_client(voter)
+        for method, path in (('post', 'vote_create/'), ('put', 'vote_update/'), ('put', 'vote_update/?upsert=1'),
+                             ('post', 'async/vote_create/'), ('put', 'async/vote_update/')):
+            response = getattr(client, method)(f'/api/{path}', data, format='json')
+            self.assertEqual(response.status_code, 400, path)
+            self.assertEqual(response.json(), {'error': 'Время голосования истекло'}, path)
+
+        response = client.post('/api/vote_batch_create/', {'votes': [data]}, format='json')
+        self.assertEqual(response.json()['results'], [{'agenda_item': stale.pk, 'error': 'Время голосования истекло'}])
+
+        tally = VoteTally.objects.get(agenda_item=self.upcoming)
+        self.assertEqual((tally.yes, tally.no, tally.total), (1, 0, 1))
+        self.assertEqual(Vote.objects.get(user=voter).vote, 'yes')
@@ -0,0 +1,218 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .deadlines import lock_open_agenda_items
+from .models import AgendaItem, UploadSession, Vote
+
+
+# Загрузка больших файлов частями с возможностью продолжить после обрыва.
+# Часть читается во временный файл в UPLOAD_TEMP_ROOT, без буферизации
+# в памяти и без обработчиков загрузки Django, и переносится в файл загрузки
+# по смещению. Один запрос - одна часть не больше UPLOAD_CHUNK_MAX_SIZE,
+# поэтому воркер занят недолго. После последней части файл переносится
+# в хранилище поля модели. Чтение от клиента и хеширование выполняются вне
+# транзакций: строка загрузки блокируется только на короткую запись.
+
+READ_SIZE = 64 * 1024
+HASH_READ_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class PartialFile(File):
+    """Собранный файл загрузки. FileSystemStorage переносит его (os.rename), а не копирует.
+
+    sha256 уже посчитан, хранилище по содержимому (main.storage) его не пересчитывает.
+    """
+
+    def __init__(self, file, path, sha256):
+        super().__init__(file)
+        self.path = path
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def partial_path(session):
+    return os.path.join(settings.UPLOAD_TEMP_ROOT, f'{session.pk}.part')
+
+
+def session_expiry():
+    return timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+
+
+def create_session(user, agenda_item, target, filename, size, sha256=''):
+    """Новая загрузка и пустой файл для неё"""
+    session = UploadSession.objects.create(
+        user=user,
+        agenda_item=agenda_item,
+        target=target,
+        filename=os.path.basename(filename),
+        size=size,
+        sha256=sha256.lower(),
+        expires_at=session_expiry(),
+    )
+    os.makedirs(settings.UPLOAD_TEMP_ROOT, exist_ok=True)
+    open(partial_path(session), 'wb').close()
+    return session
+
+
+def get_session(session_id, user, lock=False):
+    """Незавершённая загрузка пользователя. lock - заблокировать строку до конца транзакции"""
+    sessions = UploadSession.objects.filter(user=user, expires_at__gt=timezone.now())
+    if lock:
+        sessions = sessions.select_for_update()
+    try:
+        return sessions.get(pk=session_id)
+    except UploadSession.DoesNotExist:
+        raise UploadError('Загрузка не найдена', status=404)
+
+
+def write_chunk(session_id, user, offset, stream, length, sha256=None):
+    """Записывает часть длиной length из stream по смещению offset. Возвращает загрузку
+
+    Части принимаются строго по порядку: offset должен совпадать с числом
+    уже полученных байт. Часть читается от клиента во временный файл вне
+    транзакции, затем условный UPDATE (received = offset) занимает смещение
+    и блокирует строку, пока часть копируется в файл загрузки. Из двух
+    параллельных запросов с одной частью засчитывается один, второй
+    получает 409. Если соединение оборвалось посреди части, полученное
+    засчитывается, и клиент продолжает с нового смещения. Часть
+    с контрольной суммой засчитывается только целиком.
+    """
+    session = get_session(session_id, user)
+    if offset != session.received:
+        raise UploadError(f'Ожидается часть со смещения {session.received}', status=409)
+    if length <= 0:
+        raise UploadError('Пустая часть')
+    if length > settings.UPLOAD_CHUNK_MAX_SIZE:
+        raise UploadError(f'Часть больше {settings.UPLOAD_CHUNK_MAX_SIZE} байт', status=413)
+    if offset + length > session.size:
+        raise UploadError('Часть выходит за объявленный размер файла')
+
+    with tempfile.TemporaryFile(dir=settings.UPLOAD_TEMP_ROOT) as chunk:
+        digest = hashlib.sha256()
+        written = 0
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            chunk.write(data)
+            digest.update(data)
+            written += len(data)
+
+        if sha256 and (written < length or digest.hexdigest() != sha256.lower()):
+            raise UploadError('Контрольная сумма части не совпадает')
+
+        expires_at = session_expiry()
+        with transaction.atomic():
+            claimed = UploadSession.objects.filter(
+                pk=session.pk, received=offset, expires_at__gt=timezone.now()
+            ).update(received=offset + written, expires_at=expires_at)
+            if not claimed:
+                raise UploadError('Часть с этого смещения уже получена другим запросом', status=409)
+
+            chunk.seek(0)
+            with open(partial_path(session), 'r+b') as f:
+                f.seek(offset)
+                shutil.copyfileobj(chunk, f, READ_SIZE)
+
+    session.received = offset + written
+    session.expires_at = expires_at
+    if written < length:
+        raise UploadError(f'Часть получена не полностью: {written} из {length} байт')
+    return session
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_target(session):
+    """Объект, к которому прикрепляется файл (AgendaItem или голос пользователя)"""
+    if session.target == 'materials':
+        return AgendaItem.objects.select_for_update().get(pk=session.agenda_item_id)
+
+    # Лист прикрепляется к голосу под блокировкой вопроса, как и сам голос
+    if not lock_open_agenda_items([session.agenda_item_id]):
+        raise UploadError('Время голосования истекло')
+    try:
+        return Vote.objects.select_for_update().select_related('agenda_item').get(
+            agenda_item_id=session.agenda_item_id, user_id=session.user_id
+        )
+    except Vote.DoesNotExist:
+        raise UploadError('Голос не найден', status=404)
+
+
+def complete_upload(session_id, user):
+    """Проверяет собранный файл и прикрепляет его к вопросу или голосу.
+
+    Возвращает (объект, sha256 файла). Файл не копируется, а переносится
+    в хранилище поля; загрузка после этого удаляется. Полученный целиком
+    файл больше не меняется (части за его размер не принимаются), поэтому
+    хешируется до транзакции.
+    """
+    session = get_session(session_id, user)
+    if session.received != session.size:
+        raise UploadError(f'Получено {session.received} из {session.size} байт', status=409)
+
+    path = partial_path(session)
+    sha256 = file_sha256(path)
+    corrupted = bool(session.sha256) and sha256 != session.sha256
+
+    with transaction.atomic():
+        # Загрузку могли завершить или отменить параллельным запросом
+        session = get_session(session_id, user, lock=True)
+        if corrupted:
+            # Исправить файл частями уже нельзя: загрузку нужно начать заново
+            cancel_upload(session)
+        else:
+            instance = get_target(session)
+            with open(path, 'rb') as f:
+                getattr(instance, session.target).save(session.filename, PartialFile(f, path, sha256), save=False)
+            instance.save(update_fields=[session.target])
+            session.delete()
+
+    if corrupted:
+        raise UploadError('Контрольная сумма файла не совпадает, начните загрузку заново')
+    return instance, sha256
+
+
+def cancel_upload(session):
+    remove_partial_file(partial_path(session))
+    session.delete()
+
+
+def remove_partial_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_expired_sessions():
+    """Удаляет просроченные загрузки и их файлы. Возвращает число загрузок"""
+    expired = UploadSession.objects.filter(expires_at__lte=timezone.now())
+    count = 0
+    for session in expired.iterator():
+        with transaction.atomic():
+            cancel_upload(session)
+        count += 1
+    return count
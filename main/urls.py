@@ -1,27 +1,58 @@
 from django.urls import path
 from .views import *
+from . import async_views
+from .metrics import metrics_view
+from .streams import agenda_item_stream, meeting_stream
 
 from django.conf import settings
 from django.conf.urls.static import static
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
+    path('register_bulk/', RegisterBulkView.as_view(), name='register_bulk'),
     path('login/', LoginView.as_view(), name='login'),
 
     path('profile/', ProfileView.as_view(), name='profile'),
     path('profile/update', UserUpdateView.as_view(), name='profile_update'),
 
     path('meeting_create/', MeetingCreateView.as_view(), name='meeting_create'),
+    path('meeting_create/status/<int:job_id>/', MeetingCreateStatusView.as_view(), name='meeting_create_status'),
     path('meeting_list/', MeetingListView.as_view(), name='meeting_list'),
+    path('meeting_participants_import/<int:meeting_id>/', MeetingParticipantsImportView.as_view(),
+         name='meeting_participants_import'),
     path('agenda_create/', AgendaCreateView.as_view(), name='agenda_create'),
     path('agenda_get/', AgendasView.as_view(), name='agenda_get'),
     path('vote_create/', VoteCreateView.as_view(), name='vote_create'),
+    path('vote_batch_create/', VoteBatchCreateView.as_view(), name='vote_batch_create'),
     path('vote_update/', VoteUpdateView.as_view(), name='vote_update'),
 
+    path('media/materials/<int:agenda_item_id>/', AgendaMaterialsView.as_view(), name='agenda_materials'),
+    path('media/signed_vote/<int:vote_id>/', SignedVoteView.as_view(), name='signed_vote'),
+    path('uploads/', UploadSessionCreateView.as_view(), name='uploads'),
+    path('uploads/<uuid:session_id>/', UploadSessionView.as_view(), name='upload_session'),
+    path('uploads/<uuid:session_id>/complete/', UploadSessionCompleteView.as_view(), name='upload_complete'),
+
     path('generate-protocol/<int:agenda_item_id>/', GenerateProtocolView.as_view(), name='generate-protocol'),
+    path('generate-protocols/<int:meeting_id>/', GenerateMeetingProtocolsView.as_view(), name='generate-protocols'),
+
+    path('agenda_stream/<int:agenda_item_id>/', agenda_item_stream, name='agenda_stream'),
+    path('meeting_stream/<int:meeting_id>/', meeting_stream, name='meeting_stream'),
 
     path('check_token/', CheckAuthToken.as_view(), name='check_token'),
+
+    # Асинхронные варианты для запуска под ASGI (main.async_views)
+    path('async/profile/', async_views.profile, name='async_profile'),
+    path('async/meeting_create/', async_views.meeting_create, name='async_meeting_create'),
+    path('async/meeting_list/', async_views.meeting_list, name='async_meeting_list'),
+    path('async/agenda_create/', async_views.agenda_create, name='async_agenda_create'),
+    path('async/agenda_get/', async_views.agenda_get, name='async_agenda_get'),
+    path('async/vote_create/', async_views.vote_create, name='async_vote_create'),
+    path('async/vote_update/', async_views.vote_update, name='async_vote_update'),
+
+    path('metrics/', metrics_view, name='metrics'),
 ]
 
+# При разработке MEDIA_ROOT отдаётся целиком. В production материалы и опросные
+# листы доступны только через media/... с проверкой прав (MEDIA_ACCEL)
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
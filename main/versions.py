@@ -0,0 +1,37 @@
+import time
+
+from django.core.cache import cache
+
+
+# Счётчики версий данных в кэше. Начальное значение берётся от времени,
+# чтобы после вытеснения счётчика из кэша не повторить старую версию.
+
+
+def get_version(key):
+    return cache.get_or_set(key, time.time_ns, None)
+
+
+def get_versions(keys):
+    """Версии сразу для нескольких ключей (один запрос к кэшу)"""
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return versions
+
+
+def bump_version(key):
+    """Увеличивает версию, делая неактуальным всё, что от неё зависит"""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def user_version_key(user_id):
+    return f'version:user:{user_id}'
+
+
+def meeting_version_key(meeting_id):
+    return f'version:meeting:{meeting_id}'
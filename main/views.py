@@ -1,15 +1,15 @@
-import requests
+import os
 
-from reportlab.pdfbase.ttfonts import TTFont
-from django.http import HttpResponse
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfgen import canvas
-from io import BytesIO
+from django.conf import settings
+from django.http import StreamingHttpResponse
 
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
 from django.utils import timezone
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.exceptions import AuthenticationFailed
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -17,12 +17,32 @@ from rest_framework.authtoken.models import Token
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.contrib.auth import authenticate
 from django.core.exceptions import ObjectDoesNotExist
+from .authentication import CachedTokenAuthentication, get_token
+from .avatars import get_variant_urls
+from .deadlines import get_protocol_counter, lock_open_agenda_items, voting_is_open
+from .enrollment import EnrollmentError, enroll_participants, iter_entries
+from .etags import get_user_meeting_ids, profile_etag, user_meetings_etag
+from .files import file_response, media_response
+from .exports import iter_meeting_protocols, stream_protocols_zip
 from .models import *
+from .pagination import KeysetPagination, get_requested_fields
+from .protocol import open_protocol
+from .provisioning import enqueue_meeting
+from .registration import BulkRegistrationError, register_users
 from .serializers import MeetingSerializer, AgendaItemSerializer, VoteSerializer
-from .serializers import UserSerializer
+from .serializers import BulkUserSerializer, UploadSessionSerializer, UserSerializer
+from .tallies import apply_vote, counted_by_caller
+from .uploads import UploadError, cancel_upload, complete_upload, create_session, get_session, write_chunk
+from .versions import get_version, user_version_key
 
 
 def check_auth_token(request):
+    # Пользователь уже определён слоем аутентификации DRF (CachedTokenAuthentication),
+    # повторно разбирать заголовок и ходить в базу не нужно
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+
     # Извлекаем токен из заголовка Authorization
     auth_header = request.META.get('HTTP_AUTHORIZATION')
 
@@ -37,10 +57,9 @@ def check_auth_token(request):
     except ValueError:
         raise AuthenticationFailed('Invalid authorization header format')
 
-    # Проверяем токен
+    # Проверяем токен (через кэш токенов)
     try:
-        token_obj = Token.objects.get(key=token)
-        user = token_obj.user
+        user = get_token(token).user
     except Token.DoesNotExist:
         raise AuthenticationFailed('Invalid token')
 
@@ -68,6 +87,55 @@ class RegisterView(APIView):
         # Если данные невалидны, возвращаем ошибки
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class RegisterBulkView(APIView):
+    """Массовая регистрация пользователей (только для администраторов).
+
+    Тело: {"users": [{"username", "email", "password", "is_admin"}, ...]} или список.
+    Возвращает id, имена и токены созданных пользователей.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        user = check_auth_token(request)
+
+        # Проверяем, существует ли профиль пользователя
+        try:
+            profile = user.profile
+        except AttributeError:
+            raise AuthenticationFailed('User profile does not exist')
+
+        # Проверяем, является ли пользователь администратором
+        if not profile.is_admin:
+            return Response({"error": "Only admins can register users"}, status=403)
+
+        # Принимаем {"users": [...]} или просто список
+        data = request.data.get('users') if hasattr(request.data, 'get') else request.data
+
+        # Лимит проверяется до валидации: каждый пароль хешируется PBKDF2,
+        # большие списки регистрируются командой register_users
+        max_users = getattr(settings, 'BULK_REGISTER_MAX_USERS', 100)
+        if isinstance(data, list) and len(data) > max_users:
+            return Response(
+                {"error": f"Не больше {max_users} пользователей за запрос, "
+                          f"для больших списков - python manage.py register_users"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        serializer = BulkUserSerializer(data=data, many=True, allow_empty=False)
+        if not serializer.is_valid():
+            return Response({"errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            users = register_users(serializer.validated_data)
+        except BulkRegistrationError as exc:
+            return Response({"errors": exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            # Имя заняли параллельным запросом между проверкой и вставкой
+            return Response({"error": "Пользователь с таким именем уже существует"}, status=409)
+
+        return Response({"users": users}, status=status.HTTP_201_CREATED)
+
+
 # Авторизация пользователя
 class LoginView(APIView):
     permission_classes = [AllowAny]  # Разрешить доступ всем
@@ -80,10 +148,15 @@ class LoginView(APIView):
         if not email or not password:
             return Response({'error': 'Email and password are required'}, status=400)
 
-        # Находим пользователя по email
-        try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
+        # Находим пользователя по email без учёта регистра
+        # (запрос использует индекс auth_user_email_lower_idx)
+        user = (
+            User.objects.alias(email_lower=Lower('email'))
+            .filter(email_lower=email.lower())
+            .order_by('pk')
+            .first()
+        )
+        if user is None:
             return Response({'error': 'Invalid credentials'}, status=401)
 
         # Аутентифицируем пользователя
@@ -103,9 +176,11 @@ class LoginView(APIView):
 
 # Профиль
 class ProfileView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    read_from_replica = True
 
+    @method_decorator(condition(etag_func=profile_etag))
     def get(self, request):
         user = check_auth_token(request)
 
@@ -119,7 +194,8 @@ class ProfileView(APIView):
             'username': user.username,
             'email': user.email,
             'is_admin': profile.is_admin,
-            'photo': request.build_absolute_uri(profile.photo.url) if profile.photo else None
+            'photo': request.build_absolute_uri(profile.photo.url) if profile.photo else None,
+            'photo_variants': get_variant_urls(profile, request.build_absolute_uri),
         })
 
 
@@ -165,63 +241,108 @@ class MeetingCreateView(APIView):
                 status=403
             )
 
-        # Генерируем ссылку регистрации
-        url = "https://3449009-eq23140.twc1.net/api/create-room"
-        headers = {
-            "Content-Type": "application/json"
-        }
-        data = {
-            "name": name_room,
-            "password": password_room
-        }
-        response = requests.post(url, headers=headers, json=data)
-
-        # Проверка статуса ответа и вывод данных
-        if response.status_code == 200:
-            registration_link = response.json()['uri']
-
-            # Создаем новую конференцию
-            meeting = Meeting.objects.create(
-                registration_link=registration_link,
-                name_room=name_room,
-                date=date,  # Дата проведения встречи из запроса
-                admin=user  # Привязываем создателя к текущему пользователю
-            )
+        # Комната во внешнем сервисе создаётся в фоне (run_room_provisioning),
+        # ссылка на регистрацию появится в конференции после выполнения задачи
+        meeting, job = enqueue_meeting(name_room, password_room, date, user)
 
-            # Возвращаем ссылку на регистрацию
-            return Response(
-                {
-                    "message": "Meeting created successfully",
-                    "registration_link": meeting.registration_link
-                },
-                status=201
-            )
+        return Response(
+            {
+                "message": "Meeting creation started",
+                "meeting_id": meeting.id,
+                "job_id": job.id,
+                "status": job.status,
+            },
+            status=202
+        )
 
-        else:
-            return Response(
-                {
-                    "message": "Server error",
-                },
-                status=500
-            )
+
+class MeetingCreateStatusView(APIView):
+    """Статус создания комнаты конференции"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        user = check_auth_token(request)
+
+        try:
+            job = RoomProvisioningJob.objects.select_related('meeting').get(pk=job_id)
+        except RoomProvisioningJob.DoesNotExist:
+            return Response({"error": "Job not found"}, status=404)
+
+        # Статус видит только создатель конференции
+        if job.meeting.admin_id != user.id:
+            return Response({"error": "Forbidden"}, status=403)
+
+        return Response({
+            "job_id": job.id,
+            "meeting_id": job.meeting_id,
+            "status": job.status,
+            "attempts": job.attempts,
+            "registration_link": job.meeting.registration_link or None,
+            "error": job.last_error or None,
+        })
+
+
+def parse_id(value):
+    """ID из запроса: число или строка из цифр (как их принимает AgendaItem.objects.get). Иначе None"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isascii() and value.isdecimal():
+        return int(value)
+    return None
+
+
+def filter_list(request, queryset, date_field, meeting_field):
+    """Фильтры списков: ?status=open|closed и ?meeting=<id>"""
+    status_filter = request.query_params.get('status')
+    if status_filter == 'open':
+        queryset = queryset.filter(**{f'{date_field}__gte': timezone.now()})
+    elif status_filter == 'closed':
+        queryset = queryset.filter(**{f'{date_field}__lt': timezone.now()})
+    elif status_filter:
+        raise ValidationError({'status': 'Допустимые значения: open, closed'})
+
+    meeting_id = request.query_params.get('meeting')
+    if meeting_id:
+        meeting_id = parse_id(meeting_id)
+        if meeting_id is None:
+            raise ValidationError({'meeting': 'Ожидается целое число'})
+        queryset = queryset.filter(**{meeting_field: meeting_id})
+
+    return queryset
+
+
+def select_fields(request, queryset, serializer_class, ordering):
+    """Поля из ?fields= и queryset, загружающий только их (и поля курсора)"""
+    fields = get_requested_fields(request, serializer_class)
+    if fields is not None:
+        queryset = queryset.only(*dict.fromkeys([*ordering, *fields]))
+    return fields, queryset
+
+
+def paginate_list(request, queryset, serializer_class, ordering):
+    """Постраничная выдача списка с выбором полей (?fields=, ?limit=, ?cursor=)"""
+    fields, queryset = select_fields(request, queryset, serializer_class, ordering)
+    paginator = KeysetPagination(ordering)
+    page = paginator.paginate_queryset(queryset, request)
+    serializer = serializer_class(page, many=True, fields=fields)
+    return paginator.get_paginated_response(serializer.data)
 
 
 class MeetingListView(APIView):
     """Список конференций"""
     permission_classes = [IsAuthenticated]
+    read_from_replica = True
 
+    @method_decorator(condition(etag_func=user_meetings_etag))
     def get(self, request):
         user = check_auth_token(request)
 
         # Получаем все встречи, связанные с пользователем
-        user_meetings = UserMeetings.objects.filter(user=user).select_related('meeting')
-
-        # Извлекаем связанные объекты Meeting
-        meetings = [user_meeting.meeting for user_meeting in user_meetings]
+        meeting_ids = UserMeetings.objects.filter(user=user).values('meeting_id')
+        meetings = filter_list(request, Meeting.objects.filter(pk__in=meeting_ids), 'date', 'pk')
 
         # Сериализуем встречи
-        serializer = MeetingSerializer(meetings, many=True)
-        return Response(serializer.data)
+        return paginate_list(request, meetings, MeetingSerializer, ('date', 'id'))
 
 
 class AgendaCreateView(APIView):
@@ -263,7 +384,9 @@ class AgendaCreateView(APIView):
 class AgendasView(APIView):
     """Получить голосования пользователя"""
     permission_classes = [IsAuthenticated]
+    read_from_replica = True
 
+    @method_decorator(condition(etag_func=user_meetings_etag))
     def get(self, request):
         user = check_auth_token(request)
 
@@ -273,10 +396,10 @@ class AgendasView(APIView):
         # Получаем все agenda_items, связанные с этими встречами
         meeting_ids = user_meetings.values_list('meeting_id', flat=True)
         agenda_items = AgendaItem.objects.filter(meeting_id__in=meeting_ids)
+        agenda_items = filter_list(request, agenda_items, 'summary_datetime', 'meeting_id')
 
         # Сериализуем данные
-        serializer = AgendaItemSerializer(agenda_items, many=True)
-        return Response(serializer.data)
+        return paginate_list(request, agenda_items, AgendaItemSerializer, ('summary_datetime', 'id'))
 
 
 class VoteCreateView(APIView):
@@ -294,24 +417,95 @@ class VoteCreateView(APIView):
             return Response({"error": "Вопрос не найден"}, status=status.HTTP_404_NOT_FOUND)
 
         # Проверяем, что время голосования открыто
-        if not (agenda_item.summary_datetime >= timezone.now()):
+        if not voting_is_open(agenda_item):
             return Response({"error": "Время голосования истекло"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Проверяем, что пользователь не голосовал ранее
-        if Vote.objects.filter(user=request.user, agenda_item=agenda_item).exists():
-            return Response({"error": "Вы уже проголосовали"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(*create_vote(user, agenda_item, request.data))
 
-        # Создаем сериализатор и передаем данные
-        serializer = VoteSerializer(data=request.data)
-        if serializer.is_valid():
-            # Сохраняем голос, явно передавая пользователя
-            serializer.save(user=user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+class VoteBatchCreateView(APIView):
+    """Создание голосов сразу по нескольким вопросам"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        user = check_auth_token(request)
+
+        items = request.data.get('votes') if isinstance(request.data, dict) else None
+        if not isinstance(items, list) or not items:
+            return Response({"error": "Передайте список голосов в поле votes"}, status=status.HTTP_400_BAD_REQUEST)
+
+        choices = dict(Vote._meta.get_field('vote').choices)
+        agenda_item_ids = [parse_id(item.get('agenda_item')) for item in items if isinstance(item, dict)]
+
+        # Одним запросом получаем все вопросы (вместе со сроками голосования)
+        agenda_items = AgendaItem.objects.in_bulk(
+            [pk for pk in agenda_item_ids if pk is not None]
+        )
+
+        # Одним запросом находим вопросы, по которым пользователь уже голосовал
+        voted = set(
+            Vote.objects.filter(user=user, agenda_item_id__in=agenda_items.keys())
+            .values_list('agenda_item_id', flat=True)
+        )
+
+        now = timezone.now()
+        results = []
+        new_votes = []
+        for item in items:
+            agenda_item_id = item.get('agenda_item') if isinstance(item, dict) else None
+            result = {"agenda_item": agenda_item_id}
+            results.append(result)
+
+            agenda_item = agenda_items.get(parse_id(agenda_item_id))
+            if agenda_item is None:
+                result["error"] = "Вопрос не найден"
+            elif not isinstance(item.get('vote'), str) or item['vote'] not in choices:
+                result["error"] = "Некорректный вариант голоса"
+            elif not voting_is_open(agenda_item, now):
+                result["error"] = "Время голосования истекло"
+            elif agenda_item.pk in voted:
+                result["error"] = "Вы уже проголосовали"
+            else:
+                # Повторный вопрос в одном запросе тоже считается повторным голосом
+                voted.add(agenda_item.pk)
+                new_votes.append((result, Vote(agenda_item=agenda_item, user=user, vote=item['vote'])))
+
+        if new_votes:
+            try:
+                with transaction.atomic():
+                    # Вопрос могли закрыть после проверки выше: голоса пишутся
+                    # только по открытым вопросам, строки которых заблокированы
+                    open_ids = lock_open_agenda_items({vote.agenda_item_id for result, vote in new_votes})
+                    for result, vote in new_votes:
+                        if vote.agenda_item_id not in open_ids:
+                            result["error"] = "Время голосования истекло"
+                    new_votes = [(result, vote) for result, vote in new_votes if vote.agenda_item_id in open_ids]
+                    Vote.objects.bulk_create([vote for result, vote in new_votes])
+                    for result, vote in new_votes:
+                        # Версия итогов растёт вместе со счётчиками: сохранённые
+                        # протоколы вопроса устаревают, хотя bulk_create и не
+                        # отправляет post_save
+                        apply_vote(vote.agenda_item, vote.vote)
+            except IntegrityError:
+                # Параллельный запрос успел записать голос по одному из вопросов
+                return Response(
+                    {"error": "Голоса изменились во время сохранения, повторите запрос"},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+            for result, vote in new_votes:
+                result.update(VoteSerializer(vote).data)
+
+        return Response(
+            {"results": results},
+            status=status.HTTP_201_CREATED if new_votes else status.HTTP_400_BAD_REQUEST
+        )
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class VoteUpdateView(APIView):
-    """Обновление голоса"""
+    """Обновление голоса
+
+    С параметром ?upsert=1 голос создаётся, если его ещё нет.
+    """
     permission_classes = [IsAuthenticated]
 
     def put(self, request):
@@ -323,28 +517,111 @@ class VoteUpdateView(APIView):
         except AgendaItem.DoesNotExist:
             return Response({"error": "Вопрос не найден"}, status=status.HTTP_404_NOT_FOUND)
 
+        if request.query_params.get('upsert') in ('1', 'true'):
+            return self.upsert(request, user, agenda_item)
+
         try:
             vote = Vote.objects.get(agenda_item=agenda_item, user=user)
         except Vote.DoesNotExist:
             return Response({"error": "Голос не найден"}, status=status.HTTP_404_NOT_FOUND)
 
         # Проверяем, что время голосования открыто
-        if timezone.now() > agenda_item.summary_datetime:
+        if not voting_is_open(agenda_item):
             return Response({"error": "Время голосования истекло"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Создаем сериализатор и передаем данные
-        serializer = VoteSerializer(vote, data=request.data, partial=True)
-        if serializer.is_valid():
-            # Сохраняем голос, явно передавая пользователя
-            serializer.save(user=user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(*update_vote(user, agenda_item, vote, request.data))
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    def upsert(self, request, user, agenda_item):
+        # Проверяем, что время голосования открыто
+        if not voting_is_open(agenda_item):
+            return Response({"error": "Время голосования истекло"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(*upsert_vote(user, agenda_item, request.data))
+
+
+# Сохранение голосов - общее для синхронных представлений и main.async_views.
+# Возвращают (тело ответа, HTTP-статус). Открытость вопроса перепроверяется
+# под блокировкой его строки: закрытие (main.deadlines) ждёт записи голоса.
+
+VOTING_CLOSED = {"error": "Время голосования истекло"}, status.HTTP_400_BAD_REQUEST
+
+def create_vote(user, agenda_item, data):
+    """Новый голос"""
+    serializer = VoteSerializer(data=data)
+    if not serializer.is_valid():
+        return serializer.errors, status.HTTP_400_BAD_REQUEST
+
+    try:
+        with transaction.atomic():
+            if not lock_open_agenda_items([agenda_item.pk]):
+                return VOTING_CLOSED
+            # Сохраняем голос, явно передавая пользователя.
+            # Повторный голос отсекает уникальное ограничение (agenda_item, user)
+            with counted_by_caller():
+                vote = serializer.save(user=user)
+            # Обновляем итоги голосования
+            apply_vote(agenda_item, vote.vote)
+    except IntegrityError:
+        return {"error": "Вы уже проголосовали"}, status.HTTP_400_BAD_REQUEST
+    return serializer.data, status.HTTP_201_CREATED
+
+
+def update_vote(user, agenda_item, vote, data):
+    """Изменение существующего голоса vote"""
+    serializer = VoteSerializer(vote, data=data, partial=True)
+    if not serializer.is_valid():
+        return serializer.errors, status.HTTP_400_BAD_REQUEST
+
+    with transaction.atomic():
+        if not lock_open_agenda_items([agenda_item.pk]):
+            return VOTING_CLOSED
+        # Блокируем строку голоса: параллельное изменение ждёт, и старый
+        # вариант для пересчёта итогов не устаревает
+        try:
+            serializer.instance = Vote.objects.select_for_update().get(pk=vote.pk)
+        except Vote.DoesNotExist:
+            return {"error": "Голос не найден"}, status.HTTP_404_NOT_FOUND
+        old_choice = serializer.instance.vote
+        # Сохраняем голос, явно передавая пользователя
+        with counted_by_caller():
+            vote = serializer.save(user=user)
+        # Переносим голос в итогах со старого варианта на новый
+        apply_vote(agenda_item, vote.vote, old_choice)
+    return serializer.data, status.HTTP_201_CREATED
+
+
+def upsert_vote(user, agenda_item, data):
+    """Создание или изменение голоса одним запросом"""
+    serializer = VoteSerializer(data=data)
+    if not serializer.is_valid():
+        return serializer.errors, status.HTTP_400_BAD_REQUEST
+
+    with transaction.atomic():
+        if not lock_open_agenda_items([agenda_item.pk]):
+            return VOTING_CLOSED
+        try:
+            # Сначала пробуем вставить первый голос. Параллельная вставка того же
+            # голоса ждёт фиксации первой и получает IntegrityError, поэтому
+            # новым голос считается ровно один раз
+            with transaction.atomic(), counted_by_caller():
+                vote = serializer.save(user=user)
+            old_choice = None
+        except IntegrityError:
+            # Голос уже есть: блокируем строку и меняем её, как update_vote
+            serializer.instance = Vote.objects.select_for_update().get(agenda_item=agenda_item, user=user)
+            old_choice = serializer.instance.vote
+            with counted_by_caller():
+                vote = serializer.save(user=user)
+        # Сигналы post_save уже запустили проверку листа и обновление протокола
+        apply_vote(agenda_item, vote.vote, old_choice)
+
+    return serializer.data, status.HTTP_201_CREATED if old_choice is None else status.HTTP_200_OK
 
 
 class CheckAuthToken(APIView):
     """Эндпоинт для проверки токена"""
     permission_classes = [IsAuthenticated]
+    read_from_replica = True
 
     def get(self, request):
         check_auth_token(request)
@@ -372,83 +649,256 @@ class GenerateProtocolView(APIView):
 
         # Получаем объект AgendaItem
         try:
-            agenda_item = AgendaItem.objects.get(id=agenda_item_id)
+            agenda_item = AgendaItem.objects.select_related('tally', 'meeting__admin').get(id=agenda_item_id)
         except AgendaItem.DoesNotExist:
             return Response({"error": "Agenda item not found"}, status=404)
 
-        # Получаем голоса по этому вопросу
-        votes = Vote.objects.filter(agenda_item=agenda_item)
-
-        # Регистрация шрифта DejaVuSans для поддержки кириллицы
-        pdfmetrics.registerFont(TTFont('DejaVuSans', 'DejaVuSans.ttf'))
-
-        # Генерируем PDF
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-
-        # Устанавливаем шрифт с поддержкой кириллицы
-        p.setFont("DejaVuSans", 14)
-
-        # Заголовок протокола
-        p.drawString(50, 750, f"ПРОТОКОЛ № {agenda_item.id}")
-        p.drawString(50, 730, "заочного голосования Совета директоров")
-        p.drawString(50, 710, "ПАО «ТНС энерго Ростов-на-Дону»")
-
-        # Дата и время окончания приема документов
-        summary_datetime = agenda_item.summary_datetime.strftime("%d %B %Y года, %H:%M")
-        p.setFont("DejaVuSans", 12)
-        p.drawString(50, 680, f"Дата и время окончания приема документов: {summary_datetime} по московскому времени.")
-        p.drawString(50, 660, f"Место подведения итогов заочного голосования: Москва")
-        p.drawString(50, 640, f"Форма проведения: {agenda_item.get_meeting_type_display()}.")
-
-        # Дата составления протокола
-        protocol_date = agenda_item.summary_datetime.strftime("%d %B %Y года")
-        p.drawString(50, 620, f"Дата составления протокола: {protocol_date}.")
-
-        # Лица, принявшие участие в голосовании
-        participants = ", ".join([vote.user.username for vote in votes])
-        p.drawString(50, 600, f"Лица, принявшие участие в заочном голосовании: {participants}.")
-        p.drawString(50, 580, f"Лицо, проводившее подсчет голосов: {user.username}.")
-
-        # Кворум
-        p.drawString(50, 560,
-                     "Кворум для подведения итогов заочного голосования Совета директоров с данной повесткой дня имеется.")
-
-        # Повестка дня
-        p.setFont("DejaVuSans-Bold", 12)
-        p.drawString(50, 530, "ПОВЕСТКА ДНЯ:")
-        p.setFont("DejaVuSans", 12)
-        p.drawString(50, 510, f"ВОПРОС № 1:")
-        p.drawString(50, 490, f"Вопрос повестки дня, поставленный на голосование:")
-        p.drawString(50, 470, f"{agenda_item.title}")
-        p.drawString(50, 450, f"Проект решения, поставленный на голосование:")
-        p.drawString(50, 430, f"{agenda_item.description}")
-
-        # Результаты голосования
-        yes_votes = votes.filter(vote="yes").count()
-        no_votes = votes.filter(vote="no").count()
-        abstain_votes = votes.filter(vote="abstain").count()
-
-        p.drawString(50, 410, "Результаты (итоги) голосования:")
-        p.drawString(50, 390, f"ЗА – {yes_votes} голосов.")
-        p.drawString(50, 370, f"ПРОТИВ – {no_votes} голосов.")
-        p.drawString(50, 350, f"ВОЗДЕРЖАЛИСЬ – {abstain_votes} голосов.")
-
-        # Итоговое решение
-        decision = "Решение принято." if yes_votes > no_votes else "Решение не принято."
-        p.drawString(50, 330, decision)
-
-        # Завершение документа
-        p.showPage()
-        p.save()
-
-        print(2)
-
-        # Получаем содержимое PDF
-        buffer.seek(0)
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="protocol_{agenda_item.id}.pdf"'
-        response.write(buffer.getvalue())
-        buffer.close()
-
-        return response
\ No newline at end of file
+        # Генерируем PDF (или берём уже сохранённый). Протокол закрытого вопроса
+        # планировщик сроков (run_deadline_scheduler) сгенерировал заранее
+        name, file, size = open_protocol(agenda_item, get_protocol_counter(agenda_item, user))
+
+        # Отдаём файл потоком, с поддержкой Range и If-None-Match
+        return file_response(
+            request,
+            file,
+            size,
+            content_type='application/pdf',
+            filename=f'protocol_{agenda_item.id}.pdf',
+            as_attachment=True,
+            etag=name,
+        )
+
+
+class GenerateMeetingProtocolsView(APIView):
+    """Эндпоинт для выгрузки PDF-протоколов всех вопросов конференции (ZIP)"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, meeting_id):
+        user = check_auth_token(request)
+
+        # Проверяем, существует ли профиль пользователя
+        try:
+            profile = user.profile
+        except AttributeError:
+            raise AuthenticationFailed('User profile does not exist')
+
+        # Проверяем, что пользователь является администратором
+        if not profile.is_admin:
+            return Response({"error": "Forbidden"}, status=403)
+
+        if not Meeting.objects.filter(pk=meeting_id).exists():
+            return Response({"error": "Meeting not found"}, status=404)
+
+        protocols = iter_meeting_protocols(meeting_id, user)
+
+        response = StreamingHttpResponse(stream_protocols_zip(protocols), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="protocols_{meeting_id}.zip"'
+        return response
+
+
+class MeetingParticipantsImportView(APIView):
+    """Массовая запись участников в конференцию из CSV или JSON.
+
+    Файл передаётся полем file (multipart) или телом запроса
+    (Content-Type: text/csv или application/json). Формат можно указать
+    явно: ?file_format=csv|json.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, meeting_id):
+        user = check_auth_token(request)
+
+        # Проверяем, существует ли профиль пользователя
+        try:
+            profile = user.profile
+        except AttributeError:
+            raise AuthenticationFailed('User profile does not exist')
+
+        # Проверяем, что пользователь является администратором
+        if not profile.is_admin:
+            return Response({"error": "Forbidden"}, status=403)
+
+        try:
+            meeting = Meeting.objects.get(pk=meeting_id)
+        except Meeting.DoesNotExist:
+            return Response({"error": "Meeting not found"}, status=404)
+
+        # Тело не разбирается целиком: multipart-файл Django сохраняет во временный
+        # файл, обычное тело читается из потока запроса
+        if request.content_type.startswith('multipart/form-data'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({"error": "Файл не передан (поле file)"}, status=400)
+            stream, filename = upload, upload.name
+        else:
+            stream, filename = request.stream, ''
+            if stream is None:
+                return Response({"error": "Пустое тело запроса"}, status=400)
+
+        file_format = request.query_params.get('file_format')
+        if file_format is None:
+            is_json = filename.lower().endswith('.json') or 'json' in request.content_type
+            file_format = 'json' if is_json else 'csv'
+        elif file_format not in ('csv', 'json'):
+            return Response({"error": "Допустимые форматы: csv, json"}, status=400)
+
+        try:
+            summary = enroll_participants(meeting, iter_entries(stream, file_format))
+        except EnrollmentError as exc:
+            return Response({"error": str(exc), **exc.summary}, status=400)
+
+        return Response(summary, status=200)
+
+
+class UploadSessionCreateView(APIView):
+    """Начало загрузки файла частями.
+
+    target=materials - материалы вопроса (только администратор),
+    target=signed_vote - подписанный опросный лист к своему голосу.
+    Дальше части отправляются PUT на uploads/<id>/?offset=N, затем POST
+    на uploads/<id>/complete/.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        user = check_auth_token(request)
+
+        serializer = UploadSessionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        agenda_item = data['agenda_item']
+
+        if data['target'] == 'materials':
+            try:
+                profile = user.profile
+            except AttributeError:
+                raise AuthenticationFailed('User profile does not exist')
+            if not profile.is_admin:
+                return Response({"error": "Only admins can upload materials"}, status=403)
+        else:
+            if not Vote.objects.filter(agenda_item=agenda_item, user=user).exists():
+                return Response({"error": "Голос не найден"}, status=status.HTTP_404_NOT_FOUND)
+            if not voting_is_open(agenda_item):
+                return Response({"error": "Время голосования истекло"}, status=status.HTTP_400_BAD_REQUEST)
+
+        session = create_session(
+            user, agenda_item, data['target'], data['filename'], data['size'], data.get('sha256', '')
+        )
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+
+class UploadSessionView(APIView):
+    """Состояние загрузки (GET), очередная часть (PUT) и отмена (DELETE).
+
+    Часть - тело PUT-запроса, смещение - параметр ?offset=N. Необязательный
+    заголовок X-Chunk-SHA256 - контрольная сумма части. После обрыва
+    клиент запрашивает состояние и продолжает с offset из ответа.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, session_id):
+        user = check_auth_token(request)
+        try:
+            session = get_session(session_id, user)
+        except UploadError as exc:
+            return Response({"error": str(exc)}, status=exc.status)
+        return Response(UploadSessionSerializer(session).data)
+
+    def put(self, request, session_id):
+        user = check_auth_token(request)
+
+        try:
+            offset = int(request.query_params['offset'])
+        except (KeyError, ValueError):
+            return Response({"error": "Укажите смещение части: ?offset=N"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+
+        # Тело читается из потока запроса по частям, без обработчиков загрузки Django
+        try:
+            session = write_chunk(
+                session_id, user, offset, request.stream, length, request.headers.get('X-Chunk-SHA256')
+            )
+        except UploadError as exc:
+            return Response({"error": str(exc)}, status=exc.status)
+        return Response(UploadSessionSerializer(session).data)
+
+    def delete(self, request, session_id):
+        user = check_auth_token(request)
+        try:
+            with transaction.atomic():
+                cancel_upload(get_session(session_id, user, lock=True))
+        except UploadError as exc:
+            return Response({"error": str(exc)}, status=exc.status)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadSessionCompleteView(APIView):
+    """Завершение загрузки: файл прикрепляется к вопросу или голосу"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, session_id):
+        user = check_auth_token(request)
+        try:
+            instance, sha256 = complete_upload(session_id, user)
+        except UploadError as exc:
+            return Response({"error": str(exc)}, status=exc.status)
+
+        if isinstance(instance, Vote):
+            return Response({"sha256": sha256, "vote": VoteSerializer(instance).data})
+        return Response({"sha256": sha256, "agenda_item": AgendaItemSerializer(instance).data})
+
+
+def is_meeting_member(user, meeting):
+    """Участник (UserMeetings) или создатель конференции. Участие берётся из кэша (main.etags)"""
+    if meeting.admin_id == user.pk:
+        return True
+    return meeting.pk in get_user_meeting_ids(user.pk, get_version(user_version_key(user.pk)))
+
+
+class AgendaMaterialsView(APIView):
+    """Материалы вопроса - только участникам конференции"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, agenda_item_id):
+        user = check_auth_token(request)
+
+        try:
+            agenda_item = AgendaItem.objects.select_related('meeting').get(pk=agenda_item_id)
+        except AgendaItem.DoesNotExist:
+            return Response({"error": "Вопрос не найден"}, status=status.HTTP_404_NOT_FOUND)
+        if not is_meeting_member(user, agenda_item.meeting):
+            return Response({"error": "Forbidden"}, status=status.HTTP_403_FORBIDDEN)
+        if not agenda_item.materials:
+            return Response({"error": "Материалов нет"}, status=status.HTTP_404_NOT_FOUND)
+
+        name = agenda_item.materials.name
+        return media_response(
+            request, default_storage, name, f'materials_{agenda_item.pk}{os.path.splitext(name)[1]}',
+        )
+
+
+class SignedVoteView(APIView):
+    """Подписанный опросный лист - проголосовавшему и создателю конференции"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, vote_id):
+        user = check_auth_token(request)
+
+        try:
+            vote = Vote.objects.select_related('agenda_item__meeting').get(pk=vote_id)
+        except Vote.DoesNotExist:
+            return Response({"error": "Голос не найден"}, status=status.HTTP_404_NOT_FOUND)
+        if user.pk not in (vote.user_id, vote.agenda_item.meeting.admin_id):
+            return Response({"error": "Forbidden"}, status=status.HTTP_403_FORBIDDEN)
+        if not vote.signed_vote:
+            return Response({"error": "Опросный лист не загружен"}, status=status.HTTP_404_NOT_FOUND)
+
+        name = vote.signed_vote.name
+        return media_response(
+            request, default_storage, name, f'signed_vote_{vote.pk}{os.path.splitext(name)[1]}',
+            as_attachment=True,
+        )
@@ -39,14 +39,82 @@ INSTALLED_APPS += [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'main.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
 }
 
+# Размер страницы списков (main.pagination)
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 500
+
+# Кэш токенов аутентификации (main.authentication)
+TOKEN_CACHE_MAXSIZE = 10000
+TOKEN_CACHE_TTL = 60  # секунд
+# Алиас из CACHES для общего кэша токенов между процессами (например, 'default')
+TOKEN_CACHE_ALIAS = None
+
+# Сгенерированные PDF-протоколы (main.protocol), вне MEDIA_ROOT
+PROTOCOL_ROOT = os.path.join(BASE_DIR, 'protocols')
+# До этого размера протокол генерируется в памяти, дальше - во временном файле
+PROTOCOL_SPOOL_MAX_SIZE = 1024 * 1024
+
+# Пул процессов для PDF, хеширования паролей, копий фото и проверки ЭП (main.process_pool), None - по числу ядер
+PROCESS_POOL_WORKERS = None
+PROCESS_POOL_RESULT_WORKERS = 2  # потоков для записи результатов задач пула в базу
+
+# Загрузка файлов частями (main.uploads). Недокачанные файлы - вне MEDIA_ROOT
+UPLOAD_TEMP_ROOT = os.path.join(BASE_DIR, 'uploads')
+UPLOAD_MAX_SIZE = 1024 * 1024 * 1024  # байт, весь файл
+UPLOAD_CHUNK_MAX_SIZE = 8 * 1024 * 1024  # байт, одна часть (один запрос)
+UPLOAD_SESSION_TTL = 24 * 60 * 60  # секунд с последней полученной части
+
+# Копии фото профиля (main.avatars): стороны квадратов в пикселях, качество WebP/JPEG
+AVATAR_SIZES = (48, 128, 256)
+AVATAR_QUALITY = 85
+AVATAR_MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # байт
+
+# Проверка ЭП опросных листов (main.signatures): доверенные корневые сертификаты (PEM)
+# и openssl (для ГОСТ - сборка с ГОСТ-движком)
+SIGNATURE_CA_FILE = os.environ.get('SIGNATURE_CA_FILE')
+SIGNATURE_OPENSSL = os.environ.get('SIGNATURE_OPENSSL', 'openssl')
+SIGNATURE_VERIFY_TIMEOUT = 30  # секунд на вызов openssl
+
+# Подведение итогов по срокам (main.deadlines, run_deadline_scheduler)
+DEADLINE_REFRESH_INTERVAL = 30  # секунд между чтениями ближайших сроков из базы
+
+# Массовая регистрация (main.registration): пользователей за один запрос.
+# Каждый пароль - PBKDF2, поэтому через HTTP только небольшие пачки, большие
+# списки - командой register_users
+BULK_REGISTER_MAX_USERS = 100
+
+# Потоки итогов голосования (main.events, main.streams)
+VOTE_EVENTS_BROKER = 'main.events.InProcessBroker'
+VOTE_EVENTS_QUEUE_SIZE = 100  # сообщений на одного клиента
+VOTE_EVENTS_HEARTBEAT = 25  # секунд
+
+# Внешний сервис комнат конференций (main.provisioning)
+ROOM_SERVICE_URL = 'https://3449009-eq23140.twc1.net/api/create-room'
+ROOM_SERVICE_CONNECT_TIMEOUT = 3.05  # секунд
+ROOM_SERVICE_READ_TIMEOUT = 10  # секунд
+ROOM_SERVICE_RETRIES = 2  # повторов при ошибке соединения или 502/503/504
+ROOM_SERVICE_BACKOFF = 0.5  # секунд, базовая задержка перед повтором
+ROOM_SERVICE_POOL_SIZE = 10  # keep-alive соединений на хост
+ROOM_SERVICE_BREAKER_THRESHOLD = 5  # ошибок подряд до размыкания цепи
+ROOM_SERVICE_BREAKER_RESET = 30  # секунд до пробного запроса
+ROOM_PROVISIONING_MAX_ATTEMPTS = 5
+ROOM_PROVISIONING_RETRY_DELAY = 10  # секунд, удваивается с каждой попыткой
+ROOM_PROVISIONING_LEASE = 60  # секунд на одну попытку, не меньше таймаутов запроса со всеми повторами
+
+# Метрики (main.metrics, api/metrics/): доступны администраторам
+# и сборщику метрик с заголовком "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
 MIDDLEWARE = [
+    # Первым, чтобы учитывать время всех остальных middleware
+    'main.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -55,6 +123,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'main.replicas.ReplicaMiddleware',
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -68,6 +137,12 @@ CORS_ALLOW_METHODS = [
     'PUT',
 ]
 
+# Заголовки пагинации должны быть доступны фронтенду
+CORS_EXPOSE_HEADERS = [
+    'link',
+    'x-next-cursor',
+]
+
 CORS_ALLOW_HEADERS = [
     'accept',
     'accept-encoding',
@@ -114,6 +189,35 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения (main.replicas), хосты через запятую. Остальные
+# параметры подключения - как у основной базы
+for number, host in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['main.replicas.ReplicaRouter']
+# Сколько секунд после записи клиент читает из основной базы (больше отставания реплик)
+REPLICA_STICKY_SECONDS = 10
+# Алиас из CACHES: отметки о записи должны быть общими для всех процессов
+REPLICA_STICKY_CACHE = 'default'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Счётчики версий (ETag) должны быть общими для всех процессов:
+# при запуске нескольких воркеров замените LocMemCache на Redis или Memcached.
+# С репликами (DATABASE_REPLICA_HOSTS) это обязательно - проверка main.E001.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -154,6 +258,24 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Отдача материалов и опросных листов после проверки прав (main.files.media_response):
+# 'x-accel-redirect' (nginx), 'x-sendfile' (Apache, lighttpd) или None - отдаёт Django
+MEDIA_ACCEL = os.environ.get('MEDIA_ACCEL') or None
+# internal-location nginx, указывающий на MEDIA_ROOT
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Загружаемые файлы хранятся по хешу содержимого, каждый уникальный файл - один раз
+STORAGES = {
+    'default': {
+        'BACKEND': 'main.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+# Файл без ссылок удаляется командой gc_blobs не раньше, чем через это время
+BLOB_GC_GRACE = 60 * 60  # секунд
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,35 @@
+"""
+Настройки для запуска тестов локально:
+
+    python manage.py test --settings=meeting.settings_test
+"""
+
+import os
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+    # Отдельная база для тестов чтения с реплики (main.replicas). Репликации нет,
+    # поэтому по умолчанию с неё не читают, тесты включают её через override_settings
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+}
+DATABASE_REPLICAS = []
+
+# Быстрое хеширование паролей в тестах
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
+# Сгенерированные в тестах протоколы не попадают в каталог проекта
+PROTOCOL_ROOT = os.path.join(tempfile.gettempdir(), 'meeting-test-protocols')
+# Загружаемые в тестах файлы тоже
+UPLOAD_TEMP_ROOT = os.path.join(tempfile.gettempdir(), 'meeting-test-uploads')
+MEDIA_ROOT = os.path.join(tempfile.gettempdir(), 'meeting-test-media')